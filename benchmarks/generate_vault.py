@@ -0,0 +1,127 @@
+"""
+Deterministic synthetic vault generator for the benchmarks.
+
+The same parameters and seed always produce the same vault: note names,
+directory layout, sizes, links, tags and frontmatter. Note sizes follow a
+log-normal distribution, like real vaults with many short and a few very
+long notes.
+
+Usage:
+    python benchmarks/generate_vault.py /tmp/vault --notes 10000
+"""
+
+import argparse
+import math
+import random
+from pathlib import Path
+
+WORDS = """
+    project meeting idea review draft summary task plan design research note
+    daily weekly goal budget travel reading book article python server index
+    search cache vault obsidian garden health recipe music family work client
+    release feature bug question answer archive inbox
+""".split()
+STATUSES = ["open", "in-progress", "done", "blocked"]
+
+
+def generate_vault(
+    root: str | Path,
+    notes: int = 1000,
+    mean_size: int = 2000,
+    size_sigma: float = 1.0,
+    depth: int = 3,
+    fanout: int = 8,
+    link_density: float = 0.05,
+    frontmatter: float = 0.5,
+    seed: int = 0,
+) -> Path:
+    """Write a synthetic vault to `root`.
+
+    Args:
+        notes: Number of notes.
+        mean_size: Mean note size in bytes.
+        size_sigma: Sigma of the log-normal size distribution.
+        depth: Maximum directory depth below the vault root.
+        fanout: Number of subdirectories per directory.
+        link_density: Probability of a wikilink per line.
+        frontmatter: Fraction of notes with frontmatter.
+        seed: Seed of the random generator.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+    dirs = [""]
+    level = [""]
+    for _ in range(depth):
+        level = [f"{parent}dir{i}/" for parent in level for i in range(fanout)]
+        dirs += level
+        if len(dirs) > notes:
+            break
+
+    names = [f"{rng.choice(WORDS)}-{i:06d}" for i in range(notes)]
+    # median of the log-normal distribution giving the requested mean
+    mu = math.log(mean_size) - size_sigma**2 / 2
+
+    for i, name in enumerate(names):
+        lines = []
+        if rng.random() < frontmatter:
+            lines += [
+                "---",
+                f"status: {rng.choice(STATUSES)}",
+                f"priority: {rng.randint(1, 5)}",
+                f"tags: [{rng.choice(WORDS)}, {rng.choice(WORDS)}]",
+                f"created: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "---",
+            ]
+        lines.append(f"# {name}")
+
+        size = int(rng.lognormvariate(mu, size_sigma))
+        written = sum(len(line) + 1 for line in lines)
+        while written < size:
+            if rng.random() < 0.05:
+                line = f"## {rng.choice(WORDS).title()} {rng.randint(1, 99)}"
+            else:
+                line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16)))
+                if rng.random() < link_density:
+                    line += f" [[{names[rng.randrange(notes)]}]]"
+                if rng.random() < 0.02:
+                    line += f" #{rng.choice(WORDS)}"
+            lines.append(line)
+            written += len(line) + 1
+
+        path = root / rng.choice(dirs) / f"{name}.md"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return root
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--mean-size", type=int, default=2000)
+    parser.add_argument("--size-sigma", type=float, default=1.0)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--link-density", type=float, default=0.05)
+    parser.add_argument("--frontmatter", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generator_options(args: argparse.Namespace) -> dict:
+    return {
+        "mean_size": args.mean_size,
+        "size_sigma": args.size_sigma,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "link_density": args.link_density,
+        "frontmatter": args.frontmatter,
+        "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--notes", type=int, default=1000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    generate_vault(args.root, args.notes, **generator_options(args))
@@ -0,0 +1,346 @@
+"""
+Benchmarks of every Vault method and MCP tool on synthetic vaults.
+
+For each vault size a deterministic vault is generated (see
+generate_vault.py), then every Vault method is timed directly and every MCP
+tool is timed through an in-process FastMCP client. Results are written as
+JSON, so runs on different commits can be compared.
+
+The in-process client does not carry an HTTP request, so the
+UserAuthMiddleware is removed for the tool benchmarks.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from generate_vault import add_arguments, generate_vault, generator_options
+
+SRC = Path(__file__).resolve().parent.parent / "src" / "obsidian_http_mcp"
+sys.path.insert(0, str(SRC))
+
+BENCH_NOTE = "benchmark/bench_note.md"
+
+
+# ------------------------
+# Timing
+# ------------------------
+def summarize(times: list[float]) -> dict:
+    return {
+        "runs": len(times),
+        "min_ms": min(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "mean_ms": statistics.fmean(times) * 1000,
+        "max_ms": max(times) * 1000,
+    }
+
+
+def time_call(fn, repeat: int) -> dict:
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+async def time_tool(client, name: str, args, repeat: int) -> dict:
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await client.call_tool(name, args(i))
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+# ------------------------
+# Operations
+# ------------------------
+def sample_note(vault) -> tuple[str, str]:
+    """Vault relative path and name of a note with links and headings."""
+    notes = sorted(vault.index.files_under("", (".md",)))
+    rel = notes[len(notes) // 2]
+    return rel, rel.rpartition("/")[2]
+
+
+def operations(vault) -> list[tuple[str, callable]]:
+    """(label, kwargs factory) of every benchmarked call.
+
+    The label is the name of the Vault method and MCP tool, optionally
+    followed by the variant in brackets. The factories get the repetition
+    number, so edits can use fresh targets.
+    """
+    rel, name = sample_note(vault)
+    table = vault.line_tables.get(vault.path / rel)
+    heading = table.headings[-1][2] if table.headings else name
+    some_dir = rel.rpartition("/")[0] or "/"
+    names = [r.rpartition("/")[2] for r in sorted(vault.index.files)[::97][:20]]
+
+    return [
+        ("list_files_in_vault", lambda i: {}),
+        (
+            "list_files_in_vault[page]",
+            lambda i: {"limit": 100},
+        ),
+        ("list_files_in_dir", lambda i: {"dir": some_dir}),
+        ("get_file_contents", lambda i: {"filename": name}),
+        (
+            "get_file_contents[lines]",
+            lambda i: {"filename": name, "start_line": 2, "end_line": 20},
+        ),
+        (
+            "get_file_contents[heading]",
+            lambda i: {"filename": name, "heading": heading},
+        ),
+        (
+            "get_many_file_contents",
+            lambda i: {"filenames": names},
+        ),
+        (
+            "find_note_in_vault",
+            lambda i: {"dir": "/", "query": "project", "threshold": 80},
+        ),
+        (
+            "search_text_in_notes[exact]",
+            lambda i: {"dir": "/", "query": "budget travel", "threshold": 100},
+        ),
+        (
+            "search_text_in_notes",
+            lambda i: {"dir": "/", "query": "budget travel", "threshold": 80},
+        ),
+        (
+            "search_text_in_notes[page]",
+            lambda i: {"dir": "/", "query": "budget travel", "limit": 20},
+        ),
+        (
+            "search_text_in_notes[fulltext]",
+            lambda i: {
+                "dir": "/",
+                "query": '"budget travel" OR proj*',
+                "mode": "fulltext",
+                "limit": 20,
+            },
+        ),
+        (
+            "query_notes[filter]",
+            lambda i: {"tags": ["project"], "properties": {"status": "open"}},
+        ),
+        (
+            "query_notes[sort]",
+            lambda i: {"sort_by": "priority", "descending": True, "limit": 50},
+        ),
+        ("get_backlinks", lambda i: {"filename": name}),
+        ("get_outgoing_links", lambda i: {"filename": name}),
+        ("get_unresolved_links", lambda i: {"dir": "/"}),
+        (
+            "get_note_neighborhood",
+            lambda i: {"filename": name, "depth": 2},
+        ),
+        ("create_note", lambda i: {"filepath": f"benchmark/new_{i}"}),
+        (
+            "append_content_to_note",
+            lambda i: {"filepath": BENCH_NOTE, "content": f"line {i} marker-{i}-end"},
+        ),
+        (
+            "patch_content_into_note[text]",
+            lambda i: {
+                "filepath": BENCH_NOTE,
+                "target_type": "text",
+                "target": f"marker-{i}-end",
+                "operation": "replace",
+                "content": f"patched-{i}",
+            },
+        ),
+        (
+            "patch_content_into_note[heading]",
+            lambda i: {
+                "filepath": BENCH_NOTE,
+                "target_type": "heading",
+                "target": "Bench",
+                "operation": "append",
+                "content": f"appended {i}",
+            },
+        ),
+        (
+            "apply_note_edits",
+            lambda i: {
+                "filepath": BENCH_NOTE,
+                "edits": [
+                    {"op": "append", "content": f"edit-{i}-end"},
+                    {
+                        "op": "replace",
+                        "target": f"edit-{i}-end",
+                        "content": f"done-{i}",
+                    },
+                    {"op": "prepend", "content": f"first {i}"},
+                ],
+            },
+        ),
+        (
+            "delete_lines_from_note",
+            lambda i: {"filepath": BENCH_NOTE, "line_numbers": [1]},
+        ),
+    ]
+
+
+def prepare_bench_note(vault_dir: Path, lines: int = 400):
+    path = vault_dir / BENCH_NOTE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        "# Bench\n" + "".join(f"filler line {i}\n" for i in range(lines)),
+        encoding="utf-8",
+    )
+
+
+def reset_bench_notes(vault, vault_dir: Path):
+    shutil.rmtree(vault_dir / "benchmark", ignore_errors=True)
+    prepare_bench_note(vault_dir)
+    vault.rescan()
+
+
+def bench_vault(vault_dir: Path, repeat: int) -> dict:
+    from vault import Vault
+
+    results = {}
+    start = time.perf_counter()
+    vault = Vault(str(vault_dir), snapshot="off")
+    results["Vault.__init__"] = summarize([time.perf_counter() - start])
+
+    # restart with an up to date snapshot and full text index
+    stored = {
+        "snapshot": vault_dir.parent / f".{vault_dir.name}.bench.sqlite",
+        "fulltext": vault_dir.parent / f".{vault_dir.name}.bench-fts.sqlite",
+    }
+    options = {name: str(path) for name, path in stored.items()}
+    Vault(str(vault_dir), **options).save_snapshot()
+    start = time.perf_counter()
+    Vault(str(vault_dir), **options)
+    results["Vault.__init__[snapshot]"] = summarize([time.perf_counter() - start])
+    for path in stored.values():
+        for suffix in ("", "-wal", "-shm"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+    results["Vault.rescan"] = time_call(lambda i: vault.rescan(), max(repeat // 2, 1))
+
+    for label, kwargs in operations(vault):
+        method = getattr(vault, label.partition("[")[0])
+        results[f"Vault.{label}"] = time_call(lambda i: method(**kwargs(i)), repeat)
+    reset_bench_notes(vault, vault_dir)
+    return results
+
+
+async def bench_tools(vault_dir: Path, repeat: int) -> dict:
+    import server
+    from authentication import UserAuthMiddleware
+    from fastmcp import Client
+    from vault import Vault
+
+    server.mcp.middleware[:] = [
+        m for m in server.mcp.middleware if not isinstance(m, UserAuthMiddleware)
+    ]
+    server.VAULT = Vault(str(vault_dir))
+
+    results = {}
+    async with Client(server.mcp) as client:
+        for label, kwargs in operations(server.VAULT):
+            tool = label.partition("[")[0]
+            results[f"tool.{label}"] = await time_tool(client, tool, kwargs, repeat)
+    reset_bench_notes(server.VAULT, vault_dir)
+    return results
+
+
+# ------------------------
+# Main
+# ------------------------
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="-", help="JSON file, '-' for stdout")
+    parser.add_argument(
+        "--vault-cache",
+        default=None,
+        help="directory to keep generated vaults in and reuse them",
+    )
+    parser.add_argument("--skip-tools", action="store_true")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    options = generator_options(args)
+
+    # the server module creates its Vault on import, point it at the first vault
+    os.environ.setdefault("VAULT_WATCH_MODE", "off")
+    os.environ.setdefault("VAULT_SNAPSHOT_PATH", "off")
+    os.environ.setdefault("VAULT_FULLTEXT_PATH", "memory")
+    # timed tool calls must scan everything instead of stopping at the deadline
+    os.environ.setdefault("MCP_CALL_TIMEOUT", "0")
+    cache = Path(args.vault_cache or tempfile.mkdtemp(prefix="vault-bench-"))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "generator": options,
+        },
+        "results": {},
+    }
+    for size in sizes:
+        vault_dir = cache / f"vault-{size}-{options['seed']}"
+        if not vault_dir.exists():
+            start = time.perf_counter()
+            generate_vault(vault_dir, size, **options)
+            print(
+                f"generated {size} notes in {time.perf_counter() - start:.1f}s",
+                file=sys.stderr,
+            )
+        prepare_bench_note(vault_dir)
+        os.environ.setdefault("VAULT_PATH", str(vault_dir))
+
+        results = bench_vault(vault_dir, args.repeat)
+        if not args.skip_tools:
+            results.update(asyncio.run(bench_tools(vault_dir, args.repeat)))
+        report["results"][str(size)] = results
+        print(f"benchmarked {size} notes", file=sys.stderr)
+
+    if not args.vault_cache:
+        shutil.rmtree(cache, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
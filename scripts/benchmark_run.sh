@@ -0,0 +1,3 @@
+source .venv/bin/activate
+
+python ./benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --output benchmark_results.json "$@"
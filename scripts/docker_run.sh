@@ -10,6 +10,7 @@ docker run -d \
   --name obsidian-http-mcp \
   --network mcp \
   -v $VAULT_PATH:/vault \
+  -v obsidian-http-mcp-data:/data \
   -e MCP_API_KEY=$MCP_API_KEY \
   -e MCP_USER=$MCP_USER \
   -p 9001:9001 \
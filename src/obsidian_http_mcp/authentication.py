@@ -3,7 +3,12 @@ from fastmcp.exceptions import ToolError
 from fastmcp.server.dependencies import get_http_request
 from dotenv import load_dotenv
 
+from collections.abc import Iterable
+import hashlib
+import hmac
 import os
+import threading
+import time
 
 # ------------------------
 # Load environment
@@ -12,33 +17,177 @@ load_dotenv()
 
 MCP_API_KEY = os.getenv("MCP_API_KEY")
 MCP_USER = os.getenv("MCP_USER")
+# File with one `user:token` per line, reloaded when it changes
+MCP_API_KEYS_FILE = os.getenv("MCP_API_KEYS_FILE")
+# Tool calls per second and burst size allowed per user, 0 disables the limit
+MCP_RATE_LIMIT = float(os.getenv("MCP_RATE_LIMIT", 0))
+MCP_RATE_BURST = int(os.getenv("MCP_RATE_BURST", 20))
+# Vault wide searches a user may run at the same time, 0 disables the limit
+MCP_MAX_HEAVY_CALLS = int(os.getenv("MCP_MAX_HEAVY_CALLS", 0))
+
+# Seconds between checks whether the keyfile changed
+KEYFILE_CHECK_INTERVAL = 1.0
+
+
+# ------------------------
+# API keys
+# ------------------------
+class KeyStore:
+    """Token to user mapping of MCP_API_KEY / MCP_USER and the keyfile.
+
+    The keyfile holds one `user:token` per line, empty lines and lines
+    starting with "#" are skipped. It is read again when its size or mtime
+    changed. Tokens are kept as SHA-256 digests and a lookup compares the
+    digest against every key with `hmac.compare_digest`, so its duration
+    reveals neither a partial match nor which key matched.
+    """
+
+    def __init__(
+        self,
+        path: str | None = MCP_API_KEYS_FILE,
+        api_key: str | None = MCP_API_KEY,
+        user: str | None = MCP_USER,
+    ):
+        self.path = path
+        self._env_keys = [(_digest(api_key), user)] if api_key and user else []
+        self._keys = list(self._env_keys)
+        self._stat: tuple[int, int] | None = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def user_for(self, token: str) -> str | None:
+        if time.monotonic() - self._checked >= KEYFILE_CHECK_INTERVAL:
+            self._reload()
+        digest = _digest(token)
+        user = None
+        for key, key_user in self._keys:
+            # no early exit, every key is compared
+            if hmac.compare_digest(digest, key) and user is None:
+                user = key_user
+        return user
+
+    def _reload(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            if not self.path:
+                return
+            try:
+                st = os.stat(self.path)
+                if (st.st_size, st.st_mtime_ns) == self._stat:
+                    return
+                with open(self.path, encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                # keyfile deleted, its keys are revoked
+                self._keys = list(self._env_keys)
+                self._stat = None
+                return
+            except OSError:
+                return  # e.g. unreadable for a moment, keep the keys loaded last
+
+            keys = list(self._env_keys)
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                user, sep, token = line.partition(":")
+                if sep and user.strip() and token.strip():
+                    keys.append((_digest(token.strip()), user.strip()))
+            self._keys = keys
+            self._stat = (st.st_size, st.st_mtime_ns)
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+# ------------------------
+# Limits
+# ------------------------
+class RateLimiter:
+    """Token bucket per user: `rate` calls per second, bursts of `burst` calls."""
+
+    def __init__(self, rate: float = MCP_RATE_LIMIT, burst: int = MCP_RATE_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # user -> (tokens, time of the last update)
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user: str) -> float:
+        """Take a token. Returns 0 on success, otherwise the seconds until
+        the next token is available."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(user, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[user] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[user] = (tokens - 1, now)
+            return 0
+
+
+class ConcurrencyLimiter:
+    """Number of running calls per user, capped at `limit`."""
+
+    def __init__(self, limit: int = MCP_MAX_HEAVY_CALLS):
+        self.limit = limit
+        self._running: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user: str) -> bool:
+        with self._lock:
+            running = self._running.get(user, 0)
+            if 0 < self.limit <= running:
+                return False
+            self._running[user] = running + 1
+            return True
+
+    def release(self, user: str):
+        with self._lock:
+            running = self._running.get(user, 0) - 1
+            if running > 0:
+                self._running[user] = running
+            else:
+                self._running.pop(user, None)
 
 
 # ------------------------
 # Authentication Middleware
 # ------------------------
 class UserAuthMiddleware(Middleware):
-    async def on_list_tools(self, context: MiddlewareContext, call_next):
-        request = get_http_request()
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise ToolError("Access denied: missing Authorization header")
+    """Check the bearer token and apply the limits of its user.
 
-        token = auth_header.removeprefix("Bearer ").strip()
-        if token != MCP_API_KEY:
+    Calls over the rate limit, and calls to `heavy_tools` while the user
+    already runs MCP_MAX_HEAVY_CALLS of them, are rejected right away
+    instead of waiting for a free slot.
+    """
+
+    def __init__(
+        self,
+        keys: KeyStore | None = None,
+        rate_limiter: RateLimiter | None = None,
+        heavy_limiter: ConcurrencyLimiter | None = None,
+        heavy_tools: Iterable[str] = (),
+    ):
+        self.keys = keys or KeyStore()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.heavy_limiter = heavy_limiter or ConcurrencyLimiter()
+        self.heavy_tools = set(heavy_tools)
+
+    async def on_list_tools(self, context: MiddlewareContext, call_next):
+        token = self._bearer_token()
+        if not await self.verify_token_and_get_user_id(token):
             raise ToolError("Access denied: invalid token")
 
         return await call_next(context)
 
     async def on_call_tool(self, context: MiddlewareContext, call_next):
-        request = get_http_request()
-
-        # Expect header like: Authorization: Bearer <token>
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            raise ToolError("Access denied: missing Authorization header")
-
-        token = auth_header.removeprefix("Bearer ").strip()
+        token = self._bearer_token()
         user_id = await self.verify_token_and_get_user_id(token)
 
         if not user_id:
@@ -47,7 +196,38 @@ class UserAuthMiddleware(Middleware):
         # Store user info in context state
         context.fastmcp_context.set_state("user_id", user_id)
 
-        return await call_next(context)
+        wait = self.rate_limiter.acquire(user_id)
+        if wait:
+            raise ToolError(f"Rate limit exceeded: retry in {wait:.1f}s")
+
+        if context.message.name not in self.heavy_tools:
+            return await call_next(context)
+        if not self.heavy_limiter.acquire(user_id):
+            raise ToolError(
+                f"Too many concurrent searches: at most {self.heavy_limiter.limit} per user"
+            )
+        try:
+            return await call_next(context)
+        finally:
+            self.heavy_limiter.release(user_id)
 
     async def verify_token_and_get_user_id(self, token: str) -> str | None:
-        return MCP_USER if token == MCP_API_KEY else None
+        return self.keys.user_for(token)
+
+    def request_user(self, request) -> str | None:
+        """User of the bearer token of an HTTP request, None if there is no
+        valid one. For routes outside of MCP like /metrics."""
+        auth_header = request.headers.get("Authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return None
+        return self.keys.user_for(auth_header.removeprefix("Bearer ").strip())
+
+    def _bearer_token(self) -> str:
+        request = get_http_request()
+
+        # Expect header like: Authorization: Bearer <token>
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            raise ToolError("Access denied: missing Authorization header")
+
+        return auth_header.removeprefix("Bearer ").strip()
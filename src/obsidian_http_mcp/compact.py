@@ -0,0 +1,46 @@
+from collections.abc import Iterable
+
+
+# ------------------------
+# Compact results
+# ------------------------
+def group_hits(hits: Iterable[tuple[str, int, str, float]]) -> list[dict]:
+    """Group (rel, line, text, score) search hits by note.
+
+    Returns [{"path": rel, "hits": [[line, text, score], ...]}], so the path
+    and the keys are sent once per note instead of once per line. Notes keep
+    the order of their first hit, hits keep their order within the note.
+    """
+    groups = {}
+    for rel, line, text, score in hits:
+        group = groups.get(rel)
+        if group is None:
+            group = groups[rel] = {"path": rel, "hits": []}
+        group["hits"].append([line, text, score])
+    return list(groups.values())
+
+
+def path_tree(paths: Iterable[str], depth: int | None = None) -> dict:
+    """Nest "/" separated paths into a tree of dicts.
+
+    Directories map to the dict of their entries and files to None, e.g.
+    {"a.md": None, "projects": {"b.md": None}}. With `depth`, directories
+    nested deeper than `depth` levels are not expanded and map to the
+    number of files below them instead.
+    """
+    if depth is not None and depth < 0:
+        raise ValueError("depth must be at least 0")
+    tree = {}
+    for rel in paths:
+        *dirs, name = rel.split("/")
+        node = tree
+        if depth is not None and len(dirs) > depth:
+            for part in dirs[:depth]:
+                node = node.setdefault(part, {})
+            collapsed = dirs[depth]
+            node[collapsed] = node.get(collapsed, 0) + 1
+            continue
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[name] = None
+    return tree
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+from dotenv import load_dotenv
+
+from profiling import profiled
+import deadline
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+# Threads for cheap calls (reads, writes, listings)
+MCP_LIGHT_WORKERS = int(os.getenv("MCP_LIGHT_WORKERS", 16))
+# Threads for vault wide scans (search, find)
+MCP_HEAVY_WORKERS = int(os.getenv("MCP_HEAVY_WORKERS", 4))
+
+LIGHT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MCP_LIGHT_WORKERS, thread_name_prefix="mcp-light"
+)
+HEAVY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MCP_HEAVY_WORKERS, thread_name_prefix="mcp-heavy"
+)
+
+
+# ------------------------
+# Offloading helpers
+# ------------------------
+async def run_light(fn, *args, timeout: float | None = None, **kwargs):
+    """Run blocking `fn` on the executor for cheap operations.
+
+    Kept separate from the heavy executor so reads never queue behind scans.
+    """
+    return await _run(LIGHT_EXECUTOR, fn, args, kwargs, timeout)
+
+
+async def run_heavy(fn, *args, timeout: float | None = None, **kwargs):
+    """Run blocking `fn` on the executor reserved for vault wide scans."""
+    return await _run(HEAVY_EXECUTOR, fn, args, kwargs, timeout)
+
+
+async def _run(executor, fn, args, kwargs, timeout):
+    # `fn` runs under a deadline of `timeout` seconds (MCP_CALL_TIMEOUT if
+    # None), see `deadline.expired`
+    call_deadline = deadline.Deadline(
+        deadline.MCP_CALL_TIMEOUT if timeout is None else timeout
+    )
+    # executor threads do not inherit context variables, copy the caller's
+    # so per call state like the profiler is visible to `fn`
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    context.run(deadline.CURRENT.set, call_deadline)
+    try:
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(
+                context.run, profiled, functools.partial(fn, *args, **kwargs)
+            ),
+        )
+    finally:
+        # a cancelled call leaves the executor thread running, stop its scans
+        call_deadline.cancel()
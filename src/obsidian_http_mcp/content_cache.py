@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import os
+from pathlib import Path
+import threading
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+NOTE_CACHE_BYTES = int(os.getenv("NOTE_CACHE_BYTES", 64 * 1024 * 1024))
+
+
+# ------------------------
+# Note content cache
+# ------------------------
+class ContentCache:
+    """LRU cache of decoded note text with a total byte budget.
+
+    Entries are validated against the file's (mtime_ns, size) on every
+    lookup, so edits made outside of the server are never served stale.
+    """
+
+    def __init__(self, max_bytes: int = NOTE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # path -> (mtime_ns, size, text)
+        self._entries: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path: Path) -> str:
+        """Return the text of `path`, from the cache if it is still valid."""
+        st = path.stat()
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[:2] == (st.st_mtime_ns, st.st_size):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        text = path.read_text(encoding="utf-8")
+        self._store(key, st.st_mtime_ns, st.st_size, text)
+        return text
+
+    def put(self, path: Path, text: str):
+        """Store text just written to `path`."""
+        try:
+            st = path.stat()
+        except OSError:
+            self.invalidate(path)
+            return
+        self._store(str(path), st.st_mtime_ns, st.st_size, text)
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            entry = self._entries.pop(str(path), None)
+            if entry:
+                self.bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    # --- Helper methods ---
+
+    def _store(self, key: str, mtime_ns: int, size: int, text: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (mtime_ns, size, text)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
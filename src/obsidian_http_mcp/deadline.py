@@ -0,0 +1,60 @@
+from contextvars import ContextVar
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+# Seconds a tool call may scan before it returns what it found so far,
+# 0 disables the limit
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", 30))
+
+# Deadline of the tool call being served, if any
+CURRENT: ContextVar["Deadline | None"] = ContextVar("deadline", default=None)
+
+
+# ------------------------
+# Deadlines
+# ------------------------
+class Deadline:
+    """Time a tool call has to stop scanning, or earlier once cancelled.
+
+    Checked cooperatively: scans call `expired()` between batches and
+    return the results found so far, flagged as truncated.
+    """
+
+    def __init__(self, timeout: float | None = MCP_CALL_TIMEOUT):
+        self.expires = time.monotonic() + timeout if timeout and timeout > 0 else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def expired(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def remaining(self) -> float | None:
+        """Seconds left, None without a time limit."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires is None:
+            return None
+        return max(self.expires - time.monotonic(), 0.0)
+
+
+def expired() -> bool:
+    """Whether the current tool call ran out of time or was cancelled."""
+    deadline = CURRENT.get()
+    return deadline is not None and deadline.expired()
+
+
+def remaining() -> float | None:
+    """Seconds left for the current tool call, None without a time limit."""
+    deadline = CURRENT.get()
+    return None if deadline is None else deadline.remaining()
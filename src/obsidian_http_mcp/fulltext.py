@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# `auto` (hidden file next to the vault directory), `memory` or a file path
+VAULT_FULLTEXT_PATH = os.getenv("VAULT_FULLTEXT_PATH", "auto")
+
+# Markers around matched terms in snippets
+SNIPPET_START = "**"
+SNIPPET_END = "**"
+# Tokens per snippet
+SNIPPET_TOKENS = 16
+# Notes per snippet query
+SNIPPET_BATCH = 500
+# BM25 weights of the note name and the note text
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes USING fts5(
+    title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+"""
+
+
+def fulltext_path(vault: Path, setting: str = VAULT_FULLTEXT_PATH) -> str:
+    """SQLite database of the full text index of `vault`."""
+    if setting == "memory":
+        return ":memory:"
+    if setting == "auto":
+        return str(vault.parent / f".{vault.name}.mcp-fts.sqlite")
+    return str(Path(setting).expanduser())
+
+
+# ------------------------
+# Full text index
+# ------------------------
+class FullTextIndex:
+    """SQLite FTS5 index over the name and text of every note.
+
+    Supports the FTS5 query syntax: words, "phrases", prefixes like `serv*`,
+    AND / OR / NOT and NEAR. Results are ranked by BM25, matches in the note
+    name weigh more than matches in the text.
+
+    The (size, mtime_ns) a note was indexed with is stored next to it, so
+    an index kept on disk only needs the notes which changed since. If
+    `database` can not be opened, e.g. in a read-only directory, the index
+    is kept in memory instead.
+    """
+
+    def __init__(self, database: str = ":memory:"):
+        self.lock = threading.RLock()
+        try:
+            self._db = _connect(database)
+        except sqlite3.Error as e:
+            logger.warning(
+                "Full text index '%s' not usable (%s), keeping it in memory",
+                database,
+                e,
+            )
+            self._db = _connect(":memory:")
+        self._batch = 0
+
+    def files(self) -> dict[str, tuple[int, int]]:
+        """(size, mtime_ns) of every indexed note."""
+        with self.lock:
+            return {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in self._db.execute(
+                    "SELECT path, size, mtime_ns FROM files"
+                )
+            }
+
+    @contextmanager
+    def batch(self):
+        """Apply all updates inside the block in one transaction."""
+        with self.lock:
+            if self._batch == 0:
+                self._db.execute("BEGIN")
+            self._batch += 1
+            try:
+                yield
+            finally:
+                self._batch -= 1
+                if self._batch == 0:
+                    self._db.execute("COMMIT")
+
+    def update(self, rel: str, text: str, size: int, mtime_ns: int):
+        """(Re)index the content of a single note."""
+        title = rel.rpartition("/")[2].removesuffix(".md")
+        with self.batch():
+            self._remove(rel)
+            file_id = self._db.execute(
+                "INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                (rel, size, mtime_ns),
+            ).lastrowid
+            self._db.execute(
+                "INSERT INTO notes (rowid, title, body) VALUES (?, ?, ?)",
+                (file_id, title, text),
+            )
+
+    def remove(self, rel: str):
+        with self.batch():
+            self._remove(rel)
+
+    def search(
+        self,
+        query: str,
+        prefix: str = "",
+        limit: int | None = None,
+        after: tuple[float, str] | None = None,
+    ) -> list[tuple[float, str]]:
+        """(rank, note) of the notes matching the FTS5 `query`, best first.
+
+        The rank is the BM25 score as returned by SQLite, lower is better.
+        Only notes whose path starts with `prefix` are returned, at most
+        `limit`, starting after the (rank, note) `after`.
+        """
+        sql = (
+            "SELECT rank, path FROM (SELECT bm25(notes, ?, ?) AS rank,"
+            " files.path AS path FROM notes JOIN files ON files.id = notes.rowid"
+            " WHERE notes MATCH ?"
+        )
+        args = [TITLE_WEIGHT, BODY_WEIGHT, query]
+        if prefix:
+            # paths starting with "dir/" sort between "dir/" and "dir0"
+            sql += " AND files.path >= ? AND files.path < ?"
+            args += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        sql += ")"
+        if after is not None:
+            sql += " WHERE (rank, path) > (?, ?)"
+            args += list(after)
+        sql += " ORDER BY rank, path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+
+        with self.lock:
+            try:
+                return self._db.execute(sql, args).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid full text query '{query}': {e}") from e
+
+    def snippets(self, query: str, rels: list[str]) -> dict[str, str]:
+        """Text around the matches of `query` in each of `rels`, with the
+        matched terms between SNIPPET_START and SNIPPET_END."""
+        results = {}
+        with self.lock:
+            # stay below SQLite's limit of bound parameters
+            for i in range(0, len(rels), SNIPPET_BATCH):
+                batch = rels[i : i + SNIPPET_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                results.update(
+                    self._db.execute(
+                        "SELECT files.path, snippet(notes, 1, ?, ?, '…', ?)"
+                        " FROM notes JOIN files ON files.id = notes.rowid"
+                        f" WHERE notes MATCH ? AND files.path IN ({placeholders})",
+                        (SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, query, *batch),
+                    )
+                )
+        return results
+
+    def _remove(self, rel: str):
+        row = self._db.execute("SELECT id FROM files WHERE path = ?", (rel,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM notes WHERE rowid = ?", row)
+            self._db.execute("DELETE FROM files WHERE id = ?", row)
+
+
+def _connect(database: str) -> sqlite3.Connection:
+    db = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+    try:
+        # the index can always be rebuilt from the vault, trade durability
+        # of the last commits for cheap writes
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.executescript(SCHEMA)
+    except sqlite3.Error:
+        db.close()
+        raise
+    return db
@@ -0,0 +1,237 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+import os
+import threading
+import unicodedata
+from pathlib import Path
+
+# Names remembered as missing before the set is cleared
+MAX_MISSES = 10_000
+
+
+def normalize_name(name: str) -> str:
+    """Lowercased NFC form file names and queries are compared in."""
+    return unicodedata.normalize("NFC", name).lower()
+
+
+# ------------------------
+# File name corpus
+# ------------------------
+class NameCorpus:
+    """Sorted vault paths with their normalized file names.
+
+    Kept ready for fuzzy name lookups: the files below a directory form one
+    contiguous range of the sorted paths, so a directory filter is two
+    bisections and the names are scored as one slice.
+    """
+
+    def __init__(self, rels: Iterable[str] = ()):
+        self.paths = sorted(rels)
+        self.names = [normalize_name(rel.rpartition("/")[2]) for rel in self.paths]
+        # name length -> paths, see `score_names` for why
+        self.by_length: dict[int, set[str]] = {}
+        for rel, name in zip(self.paths, self.names):
+            self.by_length.setdefault(len(name), set()).add(rel)
+
+    def add(self, rel: str):
+        i = bisect_left(self.paths, rel)
+        if i < len(self.paths) and self.paths[i] == rel:
+            return
+        name = normalize_name(rel.rpartition("/")[2])
+        self.paths.insert(i, rel)
+        self.names.insert(i, name)
+        self.by_length.setdefault(len(name), set()).add(rel)
+
+    def remove(self, rel: str):
+        i = bisect_left(self.paths, rel)
+        if i < len(self.paths) and self.paths[i] == rel:
+            rels = self.by_length[len(self.names[i])]
+            rels.discard(rel)
+            if not rels:
+                del self.by_length[len(self.names[i])]
+            del self.paths[i]
+            del self.names[i]
+
+    def under(
+        self, rel_dir: str, shorter_than: int = 0
+    ) -> tuple[list[str], list[str], list[int]]:
+        """Paths and names of all files below `rel_dir`, plus the positions
+        of the names shorter than `shorter_than` among them."""
+        if rel_dir:
+            # "dir/..." sorts between "dir/" and "dir0"
+            start = bisect_left(self.paths, rel_dir + "/")
+            end = bisect_left(self.paths, rel_dir + "0", start)
+        else:
+            start, end = 0, len(self.paths)
+
+        short = []
+        for length in range(shorter_than):
+            for rel in self.by_length.get(length, ()):
+                i = bisect_left(self.paths, rel, start, end)
+                if i < end and self.paths[i] == rel:
+                    short.append(i - start)
+        return self.paths[start:end], self.names[start:end], short
+
+
+# ------------------------
+# Vault file index
+# ------------------------
+class VaultIndex:
+    """In-memory listing of every file in the vault.
+
+    Paths are stored vault relative with "/" separators. The root directory
+    is the empty string.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        # relative path -> (size, mtime_ns)
+        self.files: dict[str, tuple[int, int]] = {}
+        # basename -> relative paths
+        self.by_name: dict[str, set[str]] = {}
+        # relative dir -> names of direct children (files and dirs)
+        self.children: dict[str, set[str]] = {"": set()}
+        # names known to be absent since the last rescan, see `miss`
+        self.misses: set[str] = set()
+        # sorted paths and normalized names for find_note_in_vault
+        self.names = NameCorpus()
+        # guards the maps above against the watcher thread
+        self.lock = threading.RLock()
+
+    def build(self):
+        """Walk the vault once and (re)populate the index."""
+        with self.lock:
+            self.files.clear()
+            self.by_name.clear()
+            self.children = {"": set()}
+            self.misses.clear()
+            # filled in one go instead of an insertion per file
+            self.names = None
+            self._scan("")
+            self.names = NameCorpus(self.files)
+
+    def miss(self, name: str):
+        """Remember that no file matched `name`, until the next build."""
+        with self.lock:
+            if len(self.misses) >= MAX_MISSES:
+                self.misses.clear()
+            self.misses.add(name)
+
+    def add(self, rel: str, size: int, mtime_ns: int):
+        with self.lock:
+            if rel not in self.files and self.names is not None:
+                self.names.add(rel)
+            self.files[rel] = (size, mtime_ns)
+            parent, _, name = rel.rpartition("/")
+            self.by_name.setdefault(name, set()).add(rel)
+            self.misses.discard(name)
+            self._add_dir(parent)
+            self.children[parent].add(name)
+
+    def remove(self, rel: str) -> list[str]:
+        """Drop a file or a whole directory. Returns the removed file paths."""
+        with self.lock:
+            removed = []
+            if rel in self.children:
+                for name in list(self.children[rel]):
+                    removed += self.remove(f"{rel}/{name}" if rel else name)
+                if not rel:
+                    return removed
+                del self.children[rel]
+            elif self.files.pop(rel, None) is None:
+                return removed
+            else:
+                removed.append(rel)
+                self.names.remove(rel)
+
+            parent, _, name = rel.rpartition("/")
+            paths = self.by_name.get(name)
+            if paths:
+                paths.discard(rel)
+                if not paths:
+                    del self.by_name[name]
+            if parent in self.children:
+                self.children[parent].discard(name)
+            return removed
+
+    def refresh(self, rel: str) -> tuple[list[str], list[str]]:
+        """Re-stat a path and update the index accordingly.
+
+        Directories are rescanned recursively. Returns the file paths which
+        were (re)added and the ones which disappeared.
+        """
+        with self.lock:
+            path = self.root / rel
+            try:
+                st = path.stat()
+            except OSError:
+                return [], self.remove(rel)
+
+            if path.is_dir():
+                before = set(self.remove(rel))
+                self._scan(rel)
+                after = set(self.files_under(rel))
+                return sorted(after), sorted(before - after)
+
+            if rel in self.children:
+                self.remove(rel)
+            self.add(rel, st.st_size, st.st_mtime_ns)
+            return [rel], []
+
+    def files_under(self, rel_dir: str, suffixes: tuple[str, ...] = ()) -> list[str]:
+        """Return relative paths of all files below `rel_dir`.
+
+        Only files ending with one of `suffixes` are returned, unless it is empty.
+        """
+        with self.lock:
+            if rel_dir not in self.children:
+                return []
+
+            results = []
+            stack = [rel_dir]
+            while stack:
+                current = stack.pop()
+                for name in self.children[current]:
+                    rel = f"{current}/{name}" if current else name
+                    if rel in self.children:
+                        stack.append(rel)
+                    elif not suffixes or name.endswith(suffixes):
+                        results.append(rel)
+            return results
+
+    def is_dir(self, rel: str) -> bool:
+        return rel in self.children
+
+    # --- Helper methods ---
+
+    def _scan(self, rel_dir: str):
+        """Add everything below `rel_dir` found on disk."""
+        self._add_dir(rel_dir)
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = os.scandir(self.root / current)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    rel = f"{current}/{entry.name}" if current else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            self._add_dir(rel)
+                            stack.append(rel)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            self.add(rel, st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+
+    def _add_dir(self, rel: str):
+        if rel in self.children:
+            return
+        self.children[rel] = set()
+        if rel:
+            parent, _, name = rel.rpartition("/")
+            self._add_dir(parent)
+            self.children[parent].add(name)
@@ -0,0 +1,283 @@
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate, chain
+import mmap
+import os
+from pathlib import Path
+import re
+import threading
+
+# Number of line tables kept in memory
+LINE_TABLE_CACHE_SIZE = 128
+
+HEADING_RE = re.compile(r"^(#{1,6})[ \t]+(.*?)[ \t#]*$")
+# line breaks before lines which may start a heading or a code fence,
+# patterns start with a literal so the regex engine can skip ahead quickly
+MARKUP_LINE_RE = re.compile(rb"\n[#`~]")
+# block id at the end of a line, e.g. "- task ^task-1"
+BLOCK_ID_RE = re.compile(rb"\^([A-Za-z0-9-]+)[ \t]*\r?$", re.M)
+FRONTMATTER_FIELD_RE = re.compile(r"^([^\s#:-][^:]*):(?:[ \t]|$)")
+# separates the headings of a path like "Project::Tasks"
+HEADING_PATH_SEPARATOR = "::"
+
+
+# ------------------------
+# Line offset table
+# ------------------------
+class LineTable:
+    """Byte offsets of every line start and the Markdown structure of one note.
+
+    Built from the raw bytes without decoding them, so any line or byte
+    window can later be read with a single seek. Besides the line offsets it
+    holds the heading tree, the `^block-id` lines and the frontmatter span,
+    so headings, blocks and frontmatter fields resolve without rescanning
+    the text.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        offsets: array,
+        headings: list[tuple[int, int, str]],
+        blocks: dict[str, int] | None = None,
+        frontmatter: tuple[int, int] | None = None,
+        fields: dict[str, tuple[int, int]] | None = None,
+    ):
+        self.size = size
+        # offsets[i] is the byte offset of line i + 1
+        self.offsets = offsets
+        # (line number, level, title)
+        self.headings = headings
+        # block id -> line number
+        self.blocks = blocks or {}
+        # first and last line of the frontmatter, including the "---" lines
+        self.frontmatter = frontmatter
+        # frontmatter key -> first and last line of the field
+        self.fields = fields or {}
+
+        # last line of each heading's section and index of its parent heading
+        self.ends = [self.line_count] * len(headings)
+        self.parents: list[int] = []
+        self._by_title: dict[str, list[int]] = {}
+        stack: list[int] = []
+        for i, (line, level, title) in enumerate(headings):
+            while stack and headings[stack[-1]][1] >= level:
+                self.ends[stack.pop()] = line - 1
+            self.parents.append(stack[-1] if stack else -1)
+            stack.append(i)
+            self._by_title.setdefault(title, []).append(i)
+
+    @classmethod
+    def build(cls, path: Path) -> "LineTable":
+        with path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return cls(0, array("Q"), [])
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return cls.parse(mm, size)
+
+    @classmethod
+    def parse(cls, data, size: int | None = None) -> "LineTable":
+        """Build the table from `bytes` or an mmap of the note."""
+        size = len(data) if size is None else size
+        headings = []
+        if size == 0:
+            return cls(0, array("Q"), headings)
+
+        # line lengths are counted in C, the offsets follow from them
+        lines = data[:size].split(b"\n")
+        if not lines[-1]:
+            lines.pop()  # the trailing newline does not start a line
+        offsets = array(
+            "Q", accumulate((len(line) + 1 for line in lines[:-1]), initial=0)
+        )
+        del lines
+
+        def line_at(i: int) -> str:
+            end = offsets[i + 1] if i + 1 < len(offsets) else size
+            return data[offsets[i] : end].decode("utf-8", errors="ignore").rstrip()
+
+        # frontmatter starts at the first line and ends with "---" or "..."
+        frontmatter = None
+        fields = {}
+        body = 0
+        if data[:3] == b"---" and line_at(0) == "---":
+            for i in range(1, len(offsets)):
+                line = line_at(i)
+                if line in ("---", "..."):
+                    frontmatter = (1, i + 1)
+                    body = offsets[i + 1] if i + 1 < len(offsets) else size
+                    break
+                match = FRONTMATTER_FIELD_RE.match(line)
+                if match:
+                    fields[match.group(1).strip()] = (i + 1, i + 1)
+                elif fields and line:
+                    # indented values and list items continue the last field
+                    key = next(reversed(fields))
+                    fields[key] = (fields[key][0], i + 1)
+            else:
+                fields = {}
+
+        # only lines starting with "#" or a code fence need decoding
+        fences = []
+        in_fence = False
+        starts = (
+            m.start() + 1 for m in MARKUP_LINE_RE.finditer(data, max(body - 1, 0))
+        )
+        if body == 0 and data[:1] in (b"#", b"`", b"~"):
+            starts = chain([0], starts)
+        for start in starts:
+            i = bisect_right(offsets, start) - 1
+            line = line_at(i)
+            if line.startswith(("```", "~~~")):
+                if in_fence:
+                    fences[-1] = (fences[-1][0], i + 1)
+                else:
+                    fences.append((i + 1, len(offsets)))
+                in_fence = not in_fence
+                continue
+            heading = HEADING_RE.match(line)
+            if heading and not in_fence:
+                headings.append((i + 1, len(heading.group(1)), heading.group(2)))
+
+        blocks = {}
+        fence_starts = [first for first, _ in fences]
+        for match in BLOCK_ID_RE.finditer(data, body):
+            if data[match.start() - 1 : match.start()] not in (b"", b" ", b"\t", b"\n"):
+                continue  # the id must follow a space
+            line = bisect_right(offsets, match.start(1))
+            fence = bisect_right(fence_starts, line) - 1
+            if fence >= 0 and fences[fence][0] <= line <= fences[fence][1]:
+                continue
+            blocks.setdefault(match.group(1).decode("ascii"), line)
+
+        return cls(size, offsets, headings, blocks, frontmatter, fields)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets)
+
+    def line_span(self, first: int, last: int) -> tuple[int, int]:
+        """Byte span of the 1-based, inclusive line range `first`..`last`."""
+        first = max(first, 1)
+        last = min(last, self.line_count)
+        if first > last:
+            return 0, 0
+        end = self.offsets[last] if last < self.line_count else self.size
+        return self.offsets[first - 1], end
+
+    def section(self, heading: str) -> tuple[int, int]:
+        """Line range of the section under `heading`, including the heading.
+
+        `heading` is either the title, the full heading like "## Tasks" or a
+        path of headings like "Project::Tasks". The section ends before the
+        next heading of the same or a higher level.
+        """
+        i = self.find_heading(heading)
+        return self.headings[i][0], self.ends[i]
+
+    def find_heading(self, heading: str) -> int:
+        """Index of the unique heading matching `heading` in `headings`."""
+        *parents, last = heading.split(HEADING_PATH_SEPARATOR)
+        level, title = _split_heading(last)
+        found = [
+            i
+            for i in self._by_title.get(title, [])
+            if level in (None, self.headings[i][1]) and self._has_parents(i, parents)
+        ]
+        if not found:
+            raise ValueError(f"No heading '{heading}' found")
+        if len(found) > 1:
+            raise ValueError(
+                f"Multiple matches for heading '{heading}' found. Must be unique."
+            )
+        return found[0]
+
+    def block(self, block_id: str) -> int:
+        """Line number of the line ending with `^block_id`."""
+        line = self.blocks.get(block_id.strip().lstrip("^"))
+        if line is None:
+            raise ValueError(f"No block '{block_id}' found")
+        return line
+
+    # --- Helper methods ---
+
+    def _has_parents(self, i: int, parents: list[str]) -> bool:
+        """Whether the headings above heading `i` end with the path `parents`."""
+        for parent in reversed(parents):
+            level, title = _split_heading(parent)
+            i = self.parents[i]
+            while i >= 0 and not (
+                self.headings[i][2] == title and level in (None, self.headings[i][1])
+            ):
+                i = self.parents[i]
+            if i < 0:
+                return False
+        return True
+
+
+def _split_heading(heading: str) -> tuple[int | None, str]:
+    """Level and title of "## Title", or (None, "Title") of a bare title."""
+    match = HEADING_RE.match(heading.strip())
+    if match:
+        return len(match.group(1)), match.group(2)
+    return None, heading.strip()
+
+
+class LineTableCache:
+    """Line tables of recently read notes, validated by (mtime_ns, size)."""
+
+    def __init__(self, max_entries: int = LINE_TABLE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[int, LineTable]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> LineTable:
+        st = path.stat()
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == st.st_mtime_ns and entry[1].size == st.st_size:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        table = LineTable.build(path)
+        self._store(key, st.st_mtime_ns, table)
+        return table
+
+    def put(self, path: Path, data: bytes) -> LineTable:
+        """Parse `data` just written to `path` and store its table."""
+        table = LineTable.parse(data)
+        try:
+            st = path.stat()
+        except OSError:
+            self.invalidate(path)
+            return table
+        if st.st_size == table.size:
+            self._store(str(path), st.st_mtime_ns, table)
+        return table
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            self._entries.pop(str(path), None)
+
+    # --- Helper methods ---
+
+    def _store(self, key: str, mtime_ns: int, table: LineTable):
+        with self._lock:
+            self._entries[key] = (mtime_ns, table)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def read_span(path: Path, start: int, end: int) -> str:
+    """Read and decode the bytes `start`..`end` of `path`."""
+    if end <= start:
+        return ""
+    with path.open("rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return data.decode("utf-8", errors="ignore").replace("\r\n", "\n")
@@ -0,0 +1,218 @@
+from collections import deque
+import posixpath
+import re
+import threading
+
+from metadata import FENCE_RE, INLINE_CODE_RE
+
+# [[target#heading|alias]], ![[embed]] and [[target^block]]
+WIKILINK_RE = re.compile(
+    r"(!?)\[\[([^\[\]\n|#^]*)((?:#|\^)[^\[\]\n|]*)?(?:\|[^\[\]\n]*)?\]\]"
+)
+# Largest number of hops get_note_neighborhood walks
+MAX_DEPTH = 5
+
+
+# ------------------------
+# Parsing
+# ------------------------
+def parse_links(text: str) -> list[tuple[str, str, bool, int]]:
+    """Return (link text, link path, embed, line number) of every wikilink.
+
+    Links inside code blocks and inline code are ignored. Links to a
+    heading of the same note like `[[#Heading]]` have an empty path.
+    """
+    if "[[" not in text:
+        return []
+
+    def blank(match):
+        # keep offsets and line breaks, drop the code itself
+        return re.sub(r"[^\n]", " ", match.group())
+
+    text = INLINE_CODE_RE.sub(blank, FENCE_RE.sub(blank, text))
+    links = []
+    line, pos = 1, 0
+    for match in WIKILINK_RE.finditer(text):
+        line += text.count("\n", pos, match.start())
+        pos = match.start()
+        links.append(
+            (match.group(), match.group(2).strip(), bool(match.group(1)), line)
+        )
+    return links
+
+
+def link_key(path: str) -> str:
+    """Lowercased file name a link path or a vault path is matched by."""
+    name = path.lower().rpartition("/")[2]
+    return name[:-3] if name.endswith(".md") else name
+
+
+# ------------------------
+# Link index
+# ------------------------
+class LinkIndex:
+    """Wikilinks and embeds of every note, plus the file names they resolve to.
+
+    Only the raw link paths are stored. Links are resolved when queried, so
+    creating, renaming or deleting a file is reflected without re-parsing the
+    notes linking to it. Notes are posted under the names they link to, which
+    keeps backlink lookups independent of the vault size.
+    """
+
+    def __init__(self):
+        # lowercased vault path -> vault path, of all files
+        self.paths: dict[str, str] = {}
+        # lowercased file name -> vault paths
+        self.names: dict[str, set[str]] = {}
+        # note -> [(link text, link path, embed, line)]
+        self.outgoing: dict[str, list[tuple[str, str, bool, int]]] = {}
+        # link_key of a link path -> notes containing such a link
+        self.linked_by: dict[str, set[str]] = {}
+        self.lock = threading.RLock()
+
+    # --- Files ---
+
+    def add_file(self, rel: str):
+        with self.lock:
+            self.paths[rel.lower()] = rel
+            self.names.setdefault(rel.lower().rpartition("/")[2], set()).add(rel)
+
+    def remove_file(self, rel: str):
+        with self.lock:
+            if self.paths.get(rel.lower()) == rel:
+                del self.paths[rel.lower()]
+            name = rel.lower().rpartition("/")[2]
+            rels = self.names.get(name)
+            if rels is not None:
+                rels.discard(rel)
+                if not rels:
+                    del self.names[name]
+
+    def files(self) -> list[str]:
+        with self.lock:
+            return list(self.paths.values())
+
+    # --- Notes ---
+
+    def update(self, rel: str, text: str):
+        self.put(rel, parse_links(text))
+
+    def put(self, rel: str, links: list[tuple[str, str, bool, int]]):
+        """Store the already parsed links of a note, see `parse_links`."""
+        with self.lock:
+            self.remove(rel)
+            if not links:
+                return
+            self.outgoing[rel] = links
+            for _, path, _, _ in links:
+                if path:
+                    self.linked_by.setdefault(link_key(path), set()).add(rel)
+
+    def remove(self, rel: str):
+        with self.lock:
+            for _, path, _, _ in self.outgoing.pop(rel, []):
+                rels = self.linked_by.get(link_key(path))
+                if rels is not None:
+                    rels.discard(rel)
+                    if not rels:
+                        del self.linked_by[link_key(path)]
+
+    def notes(self) -> list[str]:
+        with self.lock:
+            return list(self.outgoing)
+
+    # --- Queries ---
+
+    def resolve(self, path: str, source: str) -> str | None:
+        """Vault path a link path in note `source` points to.
+
+        Follows Obsidian's rules: a full vault path or a path relative to
+        the linking note wins, otherwise the file with a matching name (and
+        matching trailing folders) closest to the vault root is used. The
+        ".md" extension may be omitted and matching is case-insensitive.
+        """
+        if not path:
+            return source
+        lowered = path.lower().lstrip("/")
+        names = (lowered,) if lowered.endswith(".md") else (lowered + ".md", lowered)
+        source_dir = posixpath.dirname(source.lower())
+        with self.lock:
+            for name in names:
+                if name in self.paths:
+                    return self.paths[name]
+                relative = posixpath.normpath(posixpath.join(source_dir, name))
+                if relative in self.paths:
+                    return self.paths[relative]
+                matches = [
+                    rel
+                    for rel in self.names.get(name.rpartition("/")[2], ())
+                    if "/" not in name or rel.lower().endswith("/" + name)
+                ]
+                if matches:
+                    return min(matches, key=lambda rel: (rel.count("/"), rel))
+        return None
+
+    def links_of(self, rel: str) -> list[tuple[str, bool, int, str | None]]:
+        """(link text, embed, line, resolved path) of every link in `rel`."""
+        with self.lock:
+            return [
+                (text, embed, line, self.resolve(path, rel))
+                for text, path, embed, line in self.outgoing.get(rel, [])
+            ]
+
+    def backlinks(self, rel: str) -> list[tuple[str, str, bool, int]]:
+        """(source, link text, embed, line) of every link resolving to `rel`."""
+        results = []
+        with self.lock:
+            for source in sorted(self.linked_by.get(link_key(rel), ())):
+                for text, path, embed, line in self.outgoing.get(source, []):
+                    if (
+                        path
+                        and link_key(path) == link_key(rel)
+                        and self.resolve(path, source) == rel
+                    ):
+                        results.append((source, text, embed, line))
+        return results
+
+    def unresolved(self, rels: list[str]) -> list[tuple[str, str, int]]:
+        """(source, link text, line) of every link in `rels` to a missing file."""
+        results = []
+        with self.lock:
+            for source in rels:
+                for text, path, _, line in self.outgoing.get(source, []):
+                    if self.resolve(path, source) is None:
+                        results.append((source, text, line))
+        return results
+
+    def neighborhood(
+        self, rel: str, depth: int = 1, direction: str = "both"
+    ) -> dict[str, int]:
+        """Notes reachable from `rel` in up to `depth` hops, with their distance.
+
+        `direction` is "out" (follow links), "in" (follow backlinks) or
+        "both".
+        """
+        if direction not in ("out", "in", "both"):
+            raise ValueError(f"Wrong direction '{direction}'")
+        depth = min(depth, MAX_DEPTH)
+
+        distances = {rel: 0}
+        queue = deque([rel])
+        with self.lock:
+            while queue:
+                current = queue.popleft()
+                if distances[current] >= depth:
+                    continue
+                neighbors = set()
+                if direction in ("out", "both"):
+                    neighbors.update(
+                        target for *_, target in self.links_of(current) if target
+                    )
+                if direction in ("in", "both"):
+                    neighbors.update(source for source, *_ in self.backlinks(current))
+                for neighbor in sorted(neighbors):
+                    if neighbor not in distances:
+                        distances[neighbor] = distances[current] + 1
+                        queue.append(neighbor)
+        del distances[rel]
+        return distances
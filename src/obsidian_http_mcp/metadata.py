@@ -0,0 +1,278 @@
+import re
+import threading
+
+# frontmatter keys holding the tags of a note
+TAG_KEYS = ("tags", "tag")
+
+FIELD_RE = re.compile(r"^([^\s#:-][^:]*):(?:[ \t]+(.*))?$")
+NUMBER_RE = re.compile(r"^[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$")
+FENCE_RE = re.compile(r"^(```|~~~).*?(?:^\1|\Z)", re.M | re.S)
+INLINE_CODE_RE = re.compile(r"`[^`\n]*`")
+# "#tag" at the start of a line or after whitespace, may be nested like "#a/b"
+TAG_RE = re.compile(r"(?:^|(?<=[\s(\[]))#([\w/-]+)")
+
+
+# ------------------------
+# Parsing
+# ------------------------
+def parse_frontmatter(text: str) -> tuple[dict, int]:
+    """Parse the frontmatter of a note.
+
+    Supports the subset of YAML used for Obsidian properties: scalars,
+    quoted strings, flow lists like `[a, b]` and block lists of `- item`
+    lines. Returns the properties and the offset where the body starts.
+    """
+    if not text.startswith("---"):
+        return {}, 0
+    first = text.find("\n")
+    if first == -1 or text[:first].rstrip() != "---":
+        return {}, 0
+
+    properties: dict = {}
+    key = None
+    pos = first + 1
+    while pos < len(text):
+        end = text.find("\n", pos)
+        end = len(text) if end == -1 else end
+        line = text[pos:end].rstrip()
+        pos = end + 1
+        if line in ("---", "..."):
+            return properties, pos
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        item = line.strip()
+        match = FIELD_RE.match(line)
+        if match:
+            key = match.group(1).strip()
+            properties[key] = _value(match.group(2) or "")
+        elif key is None:
+            continue
+        elif item == "-" or item.startswith("- "):
+            if not isinstance(properties[key], list):
+                properties[key] = []
+            properties[key].append(_scalar(item[1:]))
+        elif isinstance(properties[key], (str, type(None))):
+            # folded or indented strings
+            previous = properties[key]
+            properties[key] = f"{previous} {item}" if previous else item
+    # no closing line, not a frontmatter
+    return {}, 0
+
+
+def parse_tags(text: str, properties: dict) -> set[str]:
+    """Tags of a note from its frontmatter and inline `#tags` of its body."""
+    tags = set()
+    for key in TAG_KEYS:
+        value = properties.get(key)
+        if isinstance(value, str):
+            value = re.split(r"[,\s]+", value)
+        if isinstance(value, list):
+            tags.update(str(tag).strip().lstrip("#") for tag in value if tag)
+
+    if "#" in text:
+        text = INLINE_CODE_RE.sub("", FENCE_RE.sub("", text))
+        for tag in TAG_RE.findall(text):
+            tag = tag.rstrip("/")
+            # tags need at least one non-numerical character
+            if tag and not tag.replace("/", "").isdigit():
+                tags.add(tag)
+    return {tag.lower() for tag in tags if tag}
+
+
+def _value(raw: str):
+    raw = _strip_comment(raw.strip())
+    if raw in ("", "|", ">", "|-", ">-", "|+", ">+"):
+        return None
+    if raw.startswith("[") and raw.endswith("]"):
+        inner = raw[1:-1].strip()
+        return [_scalar(item) for item in inner.split(",")] if inner else []
+    return _scalar(raw)
+
+
+def _scalar(raw: str):
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "'\"":
+        return raw[1:-1]
+    lowered = raw.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered in ("", "null", "~"):
+        return None
+    if NUMBER_RE.match(raw):
+        number = float(raw)
+        return int(number) if number.is_integer() and "." not in raw else number
+    return raw
+
+
+def _strip_comment(raw: str) -> str:
+    if raw[:1] in "'\"":
+        return raw
+    pos = raw.find(" #")
+    return raw[:pos].rstrip() if pos != -1 else raw
+
+
+def normalize(value) -> str:
+    """Comparable form of a property value for equality queries."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().lower()
+
+
+def comparable(value):
+    """Property value as number if possible, otherwise as lowercased text."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    if NUMBER_RE.match(value):
+        return float(value)
+    return value.lower()
+
+
+# ------------------------
+# Metadata index
+# ------------------------
+class MetadataIndex:
+    """Tags, frontmatter properties and modification time of every note.
+
+    Notes are parsed once when they are indexed, queries are answered from
+    memory. Tags and property values are posted to sets of notes, so
+    equality filters intersect small sets instead of testing every note.
+    """
+
+    def __init__(self):
+        # rel -> (tags, properties, mtime_ns)
+        self.notes: dict[str, tuple[frozenset, dict, int]] = {}
+        self.by_tag: dict[str, set[str]] = {}
+        # (key, normalized value) -> rels
+        self.by_value: dict[tuple[str, str], set[str]] = {}
+        self.lock = threading.RLock()
+
+    def update(self, rel: str, text: str, mtime_ns: int):
+        properties, body = parse_frontmatter(text)
+        tags = parse_tags(text[body:], properties)
+        self.put(rel, tags, properties, mtime_ns)
+
+    def put(self, rel: str, tags: set[str], properties: dict, mtime_ns: int):
+        """Store already parsed tags and properties of a note."""
+        tags = frozenset(tags)
+        with self.lock:
+            self.remove(rel)
+            self.notes[rel] = (tags, properties, mtime_ns)
+            for tag in tags:
+                self.by_tag.setdefault(tag, set()).add(rel)
+            for posting in _postings(properties):
+                self.by_value.setdefault(posting, set()).add(rel)
+
+    def remove(self, rel: str):
+        with self.lock:
+            entry = self.notes.pop(rel, None)
+            if entry is None:
+                return
+            tags, properties, _ = entry
+            for tag in tags:
+                _discard(self.by_tag, tag, rel)
+            for posting in _postings(properties):
+                _discard(self.by_value, posting, rel)
+
+    def paths(self) -> list[str]:
+        with self.lock:
+            return list(self.notes)
+
+    def query(
+        self,
+        tags: list[str] | None = None,
+        properties: dict | None = None,
+        ranges: dict | None = None,
+        modified_after: int | None = None,
+        modified_before: int | None = None,
+    ) -> list[tuple[str, frozenset, dict, int]]:
+        """Return (rel, tags, properties, mtime_ns) of the matching notes.
+
+        `tags` must all be present, nested tags match their parents (`a`
+        matches `a/b`). `properties` map keys to required values, list
+        properties match if they contain the value. `ranges` map keys to
+        {"min": ..., "max": ...} bounds, both inclusive and optional.
+        """
+        with self.lock:
+            sets = []
+            for tag in tags or []:
+                tag = tag.strip().lstrip("#").lower()
+                matching = set(self.by_tag.get(tag, ()))
+                prefix = tag + "/"
+                for other, rels in self.by_tag.items():
+                    if other.startswith(prefix):
+                        matching |= rels
+                sets.append(matching)
+            for key, value in (properties or {}).items():
+                sets.append(self.by_value.get((key, normalize(value)), set()))
+
+            if sets:
+                sets.sort(key=len)
+                candidates = set.intersection(*sets) if len(sets) > 1 else sets[0]
+            else:
+                candidates = self.notes.keys()
+
+            results = []
+            for rel in candidates:
+                note_tags, note_properties, mtime_ns = self.notes[rel]
+                if modified_after is not None and mtime_ns < modified_after:
+                    continue
+                if modified_before is not None and mtime_ns > modified_before:
+                    continue
+                if ranges and not _in_ranges(note_properties, ranges):
+                    continue
+                results.append((rel, note_tags, note_properties, mtime_ns))
+            return results
+
+
+def _postings(properties: dict):
+    for key, value in properties.items():
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if item is not None:
+                yield key, normalize(item)
+
+
+def _discard(postings: dict, key, rel: str):
+    rels = postings.get(key)
+    if rels is not None:
+        rels.discard(rel)
+        if not rels:
+            del postings[key]
+
+
+def _in_ranges(properties: dict, ranges: dict) -> bool:
+    for key, bounds in ranges.items():
+        value = comparable(properties.get(key))
+        if value is None:
+            return False
+        low, high = comparable(bounds.get("min")), comparable(bounds.get("max"))
+        for limit in (low, high):
+            if limit is not None and isinstance(limit, str) != isinstance(value, str):
+                return False
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+    return True
+
+
+def sort_key(value, descending: bool = False) -> tuple:
+    """Ascending sort key for property values of mixed types.
+
+    Numbers sort before text, missing values always come last. For
+    `descending` order numbers are negated and text is turned into a list of
+    negated code points, so both orders can be paged with the same cursor
+    mechanism.
+    """
+    value = comparable(value)
+    if value is None:
+        return (1, 0, 0)
+    if isinstance(value, str):
+        return (0, 1, [-ord(c) for c in value] + [0] if descending else value)
+    return (0, 0, -value if descending else value)
@@ -0,0 +1,215 @@
+from bisect import bisect_left
+from collections.abc import Callable
+import threading
+import time
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the files scanned / lines scored histogram buckets
+COUNT_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# Tool label of calls to tools the server does not have
+UNKNOWN_TOOL = "unknown"
+
+REGISTRY: list["Metric"] = []
+
+
+# ------------------------
+# Metric types
+# ------------------------
+class Metric:
+    """A named metric with labelled values, rendered in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # per bucket counts (last one is +Inf), sum
+            entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0])
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, (list(c), s)) for key, (c, s) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from `collect` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, collect: Callable[[], float]):
+        super().__init__(name, help)
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {self.collect()}"]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# ------------------------
+# Metrics
+# ------------------------
+TOOL_CALLS = Counter("mcp_tool_calls_total", "Tool calls", ("tool", "user"))
+TOOL_ERRORS = Counter("mcp_tool_errors_total", "Failed tool calls", ("tool", "user"))
+TOOL_LATENCY = Histogram(
+    "mcp_tool_duration_seconds", "Tool call latency", ("tool", "user")
+)
+TOOL_BYTES = Counter(
+    "mcp_tool_response_bytes_total", "Bytes of tool responses", ("tool", "user")
+)
+SEARCH_FILES = Histogram(
+    "vault_search_files_scanned",
+    "Files scanned per search",
+    ("search",),
+    COUNT_BUCKETS,
+)
+SEARCH_LINES = Histogram(
+    "vault_search_lines_scored",
+    "Lines or names scored per search",
+    ("search",),
+    COUNT_BUCKETS,
+)
+HITS_CACHE = Counter(
+    "vault_search_cache_requests_total",
+    "Lookups of cached search results for follow-up pages",
+    ("result",),
+)
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Export the counters of a cache with a `stats()` method like ContentCache."""
+    for key, help in (
+        ("hits", "Cache hits"),
+        ("misses", "Cache misses"),
+        ("evictions", "Cache evictions"),
+        ("bytes", "Bytes held by the cache"),
+        ("hit_ratio", "Share of lookups served from the cache"),
+    ):
+        Gauge(f"{name}_{key}", help, lambda key=key: stats()[key])
+
+
+# ------------------------
+# Metrics Middleware
+# ------------------------
+class MetricsMiddleware(Middleware):
+    """Count tool calls, errors, latency and response size per tool and user.
+
+    Add it before the UserAuthMiddleware, so rejected calls are counted too.
+    The user is read from the context state the auth middleware sets. Calls
+    of tools the server does not have are counted as tool "unknown", so
+    clients can not create arbitrary series.
+    """
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = await self._tool(context)
+        start = time.perf_counter()
+        try:
+            result = await call_next(context)
+        except Exception:
+            labels = {"tool": tool, "user": self._user(context)}
+            TOOL_CALLS.inc(**labels)
+            TOOL_ERRORS.inc(**labels)
+            TOOL_LATENCY.observe(time.perf_counter() - start, **labels)
+            raise
+
+        labels = {"tool": tool, "user": self._user(context)}
+        TOOL_CALLS.inc(**labels)
+        TOOL_LATENCY.observe(time.perf_counter() - start, **labels)
+        TOOL_BYTES.inc(_response_bytes(result), **labels)
+        return result
+
+    async def _tool(self, context: MiddlewareContext) -> str:
+        name = context.message.name
+        if context.fastmcp_context is None:
+            return UNKNOWN_TOOL
+        tools = await context.fastmcp_context.fastmcp.get_tools()
+        return name if name in tools else UNKNOWN_TOOL
+
+    def _user(self, context: MiddlewareContext) -> str:
+        if context.fastmcp_context is None:
+            return "anonymous"
+        return context.fastmcp_context.get_state("user_id") or "anonymous"
+
+
+def _response_bytes(result) -> int:
+    size = 0
+    for block in getattr(result, "content", None) or []:
+        text = getattr(block, "text", None)
+        if text is not None:
+            size += len(text.encode("utf-8"))
+    return size
@@ -0,0 +1,60 @@
+from collections.abc import Callable, Iterable
+import base64
+import hashlib
+import heapq
+import json
+
+
+# ------------------------
+# Cursor pagination
+# ------------------------
+def query_fingerprint(*params) -> str:
+    """Short hash tying a cursor to the query it was issued for."""
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+
+
+def encode_cursor(fingerprint: str, after: list) -> str:
+    payload = json.dumps({"q": fingerprint, "after": after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        after = tuple(payload["after"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if payload.get("q") != fingerprint:
+        raise ValueError("Cursor does not belong to this query")
+    return after
+
+
+def paginate(
+    items: Iterable,
+    key: Callable,
+    limit: int | None,
+    cursor: str | None,
+    fingerprint: str,
+) -> tuple[list, str | None]:
+    """Select the page following `cursor` in ascending `key` order.
+
+    Only `limit + 1` items are kept at any time (bounded heap) instead of
+    sorting everything. Returns the page and the cursor of the next page, or
+    None if this is the last one.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+
+    if cursor:
+        after = decode_cursor(cursor, fingerprint)
+        items = (item for item in items if key(item) > after)
+
+    if limit is None:
+        page = sorted(items, key=key)
+        return page, None
+
+    page = heapq.nsmallest(limit + 1, items, key=key)
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(fingerprint, list(key(page[-1])))
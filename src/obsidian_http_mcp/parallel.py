@@ -0,0 +1,189 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import heapq
+import multiprocessing
+import os
+from pathlib import Path
+import threading
+import time
+from dotenv import load_dotenv
+
+from scoring import BATCH_SIZE, score_batch
+from search_index import split_lines
+import deadline
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", os.cpu_count() or 1))
+# Directories smaller than this are scanned in-process
+SEARCH_PARALLEL_MIN_BYTES = int(os.getenv("SEARCH_PARALLEL_MIN_BYTES", 8 * 1024 * 1024))
+# Shards per worker, more shards even out differences in scoring cost
+SHARDS_PER_WORKER = 4
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+# ------------------------
+# Process pool
+# ------------------------
+def enabled() -> bool:
+    return SEARCH_WORKERS > 1
+
+
+def start_pool() -> ProcessPoolExecutor:
+    """Create the worker processes.
+
+    Call this before any other thread is started and before the vault is
+    indexed: workers are forked (where available) so they do not re-import
+    the server module, and read the notes from disk instead of sharing the
+    index, whose pages would be copied as soon as its objects are touched.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+            else:
+                context = multiprocessing.get_context()
+            _pool = ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=context)
+            # force the workers into existence now
+            for future in [_pool.submit(os.getpid) for _ in range(SEARCH_WORKERS)]:
+                future.result()
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def shard_by_bytes(files: list[tuple[str, int]], shards: int) -> list[list[str]]:
+    """Split (rel, size) pairs into contiguous shards of similar byte size."""
+    total = sum(size for _, size in files)
+    target = max(total // max(shards, 1), 1)
+
+    result: list[list[str]] = [[]]
+    current = 0
+    for rel, size in files:
+        if current >= target and len(result) < shards:
+            result.append([])
+            current = 0
+        result[-1].append(rel)
+        current += size
+    return [shard for shard in result if shard]
+
+
+def search_files(
+    root: Path,
+    files: list[tuple[str, int]],
+    query_lower: str,
+    threshold: int,
+    top: int | None = None,
+) -> tuple[list[tuple[str, int, str, float]], int, int]:
+    """Scan (rel, size) files for `query_lower`, sharded over the process pool.
+
+    Returns like `scan_files`. Once the call runs out of time, shards not
+    started yet are cancelled and running ones are no longer waited for,
+    neither is counted as read.
+    """
+    pool = start_pool()
+    current = deadline.CURRENT.get()
+    expires = current.expires if current is not None else None
+    shards = shard_by_bytes(files, SEARCH_WORKERS * SHARDS_PER_WORKER)
+    pending = {
+        pool.submit(scan_files, str(root), shard, query_lower, threshold, top, expires)
+        for shard in shards
+    }
+
+    results = []
+    scored = 0
+    read = 0
+    while pending and not deadline.expired():
+        done, pending = wait(
+            pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            matches, shard_scored, shard_read = future.result()
+            results += matches
+            scored += shard_scored
+            read += shard_read
+    for future in pending:
+        future.cancel()
+    if top is not None:
+        results = heapq.nsmallest(top, results, key=rank)
+    return results, scored, read
+
+
+def rank(hit: tuple[str, int, str, float]) -> tuple:
+    """Sort key of a hit: best score first, then by path and line."""
+    return -hit[3], hit[0], hit[1]
+
+
+# ------------------------
+# Worker
+# ------------------------
+def scan_files(
+    root: str,
+    rels: list[str],
+    query_lower: str,
+    threshold: int,
+    top: int | None = None,
+    expires: float | None = None,
+) -> tuple[list[tuple[str, int, str, float]], int, int]:
+    """Read `rels` from disk and score their lines in batches.
+
+    Returns (rel, line_number, stripped_line, score) for every line reaching
+    `threshold`, only the `top` best ones (see `rank`) if given, the number
+    of scored lines and the number of files read. Runs inside the pool
+    workers but is also used in-process. Reading stops once the call ran out
+    of time, in the workers at `expires` (a `time.monotonic()` value), so
+    fewer files are read.
+    """
+    matches = []
+    scored = 0
+    read = 0
+    batch: list[tuple[str, int, str]] = []
+    lowered: list[str] = []
+
+    def flush():
+        nonlocal scored
+        scored += len(lowered)
+        for i, score in score_batch(query_lower, lowered, threshold):
+            rel, line_number, line = batch[i]
+            matches.append((rel, line_number, line.strip(), score))
+        batch.clear()
+        lowered.clear()
+        if top is not None and len(matches) > 2 * top:
+            matches[:] = heapq.nsmallest(top, matches, key=rank)
+
+    def expired() -> bool:
+        if expires is None:
+            return deadline.expired()
+        return time.monotonic() >= expires
+
+    for rel in rels:
+        if expired():
+            break
+        read += 1
+        try:
+            with open(os.path.join(root, rel), encoding="utf-8", errors="ignore") as f:
+                lines = split_lines(f.read())
+        except Exception:
+            continue  # skip unreadable files
+
+        for i, line in enumerate(lines, 1):
+            if line.strip():
+                batch.append((rel, i, line))
+                lowered.append(line.lower())
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    flush()
+    if top is not None:
+        matches = heapq.nsmallest(top, matches, key=rank)
+    return matches, scored, read
@@ -0,0 +1,167 @@
+import asyncio
+from contextvars import ContextVar
+import cProfile
+import logging
+import os
+from pathlib import Path
+import pstats
+import re
+import threading
+import time
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from fastmcp.server.dependencies import get_http_request
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Profile every tool call, otherwise only calls sending the header
+MCP_PROFILE = os.getenv("MCP_PROFILE", "false").lower() in ("1", "true", "yes")
+MCP_PROFILE_HEADER = "X-MCP-Profile"
+MCP_PROFILE_DIR = os.getenv("MCP_PROFILE_DIR", "/tmp/mcp-profiles")
+# Only calls slower than this are written
+MCP_PROFILE_THRESHOLD_MS = float(os.getenv("MCP_PROFILE_THRESHOLD_MS", 1000))
+# Number of profile files kept, the oldest are deleted first
+MCP_PROFILE_KEEP = int(os.getenv("MCP_PROFILE_KEEP", 20))
+
+# Collector of the tool call being profiled, if any
+CURRENT: ContextVar["ProfileCollector | None"] = ContextVar(
+    "profile_collector", default=None
+)
+
+# Held while a profiler is enabled. Since Python 3.12 only one profiler may
+# be active per process, overlapping calls run unprofiled instead.
+_active = threading.Lock()
+
+
+# ------------------------
+# Profile collection
+# ------------------------
+class ProfileCollector:
+    """cProfile data of the executor calls made by one tool call.
+
+    cProfile only sees the thread it is enabled in, so the profiler runs
+    inside the executor threads (see `profiled`) instead of around the
+    coroutine. Work in the search process pool is not included, neither
+    are executor calls which overlap with another profiled one.
+    """
+
+    def __init__(self):
+        self.profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def run(self, fn):
+        if not _active.acquire(blocking=False):
+            return fn()  # another call is being profiled
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool is active, e.g. a debugger
+            _active.release()
+            return fn()
+        with self._lock:
+            self.profiles.append(profile)
+        try:
+            return fn()
+        finally:
+            profile.disable()
+            _active.release()
+
+    def dump(self, directory: Path, tool: str, elapsed_ms: float) -> Path | None:
+        if not self.profiles:
+            return None
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+
+        directory.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^\w-]", "_", tool)
+        path = directory / f"{time.time_ns()}-{name}-{elapsed_ms:.0f}ms.prof"
+        stats.dump_stats(path)
+        return path
+
+
+def profiled(fn):
+    """Run `fn`, under the profiler if the current tool call is profiled."""
+    collector = CURRENT.get()
+    if collector is None:
+        return fn()
+    return collector.run(fn)
+
+
+def prune(directory: Path, keep: int):
+    """Delete the oldest profiles beyond the newest `keep`."""
+    try:
+        files = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime_ns)
+    except OSError:
+        return
+    for path in files[: max(len(files) - keep, 0)]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+# ------------------------
+# Profiling Middleware
+# ------------------------
+class ProfilingMiddleware(Middleware):
+    """Profile tool calls and keep the profiles of slow ones.
+
+    Enabled for every call by MCP_PROFILE or per call by the X-MCP-Profile
+    header. Add it after the UserAuthMiddleware, so only authenticated
+    clients can request profiles. Profiles are written in the background,
+    failing to write one never fails the call.
+    """
+
+    def __init__(
+        self,
+        directory: str = MCP_PROFILE_DIR,
+        threshold_ms: float = MCP_PROFILE_THRESHOLD_MS,
+        keep: int = MCP_PROFILE_KEEP,
+        always: bool = MCP_PROFILE,
+    ):
+        self.directory = Path(directory)
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.always = always
+        self._lock = threading.Lock()
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        if not (self.always or self._requested()):
+            return await call_next(context)
+
+        collector = ProfileCollector()
+        token = CURRENT.set(collector)
+        start = time.perf_counter()
+        try:
+            return await call_next(context)
+        finally:
+            CURRENT.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                # merging and writing the stats is slow, keep it off the loop
+                asyncio.get_running_loop().run_in_executor(
+                    None, self._save, collector, context.message.name, elapsed_ms
+                )
+
+    def _save(self, collector: ProfileCollector, tool: str, elapsed_ms: float):
+        try:
+            with self._lock:
+                collector.dump(self.directory, tool, elapsed_ms)
+                prune(self.directory, self.keep)
+        except Exception:
+            logger.warning("Could not save the profile of %s", tool, exc_info=True)
+
+    def _requested(self) -> bool:
+        try:
+            request = get_http_request()
+        except RuntimeError:
+            return False  # not called via http
+        value = request.headers.get(MCP_PROFILE_HEADER, "")
+        return value.lower() in ("1", "true", "yes")
@@ -0,0 +1,51 @@
+import asyncio
+import heapq
+import time
+from fastmcp import Context
+
+# Seconds between two progress notifications of a streaming search
+PROGRESS_INTERVAL = 0.25
+# Best hits named in a progress message
+PROGRESS_BEST_HITS = 3
+# Seconds the search waits for its last notification to be sent
+FINAL_REPORT_TIMEOUT = 1.0
+
+
+# ------------------------
+# Search progress
+# ------------------------
+class SearchProgress:
+    """Progress callback of a streaming search running in an executor thread.
+
+    Forwards (files done, files total, hits so far) as MCP progress
+    notifications of the tool call, at most every `interval` seconds.
+    """
+
+    def __init__(self, ctx: Context, interval: float = PROGRESS_INTERVAL):
+        self.ctx = ctx
+        self.interval = interval
+        self._loop = asyncio.get_running_loop()
+        self._last = 0.0
+
+    def __call__(self, done: int, total: int, hits: list[tuple[str, int, str, float]]):
+        now = time.monotonic()
+        if done < total and now - self._last < self.interval:
+            return
+        self._last = now
+
+        message = f"{done}/{total} files scanned, {len(hits)} hits"
+        best = heapq.nlargest(PROGRESS_BEST_HITS, hits, key=lambda hit: hit[3])
+        if best:
+            message += ", best: " + ", ".join(
+                f"{rel}:{line} ({score:.0f})" for rel, line, _, score in best
+            )
+        # called from the executor thread, the notification is sent by the loop
+        sent = asyncio.run_coroutine_threadsafe(
+            self.ctx.report_progress(done, total, message), self._loop
+        )
+        if done >= total:
+            # deliver the final count before the result
+            try:
+                sent.result(timeout=FINAL_REPORT_TIMEOUT)
+            except Exception:
+                pass
@@ -0,0 +1,67 @@
+from collections.abc import Iterable, Iterator, Sequence
+import math
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import LCSseq
+
+import deadline
+
+# Number of strings handed to rapidfuzz at once
+BATCH_SIZE = 50_000
+
+
+# ------------------------
+# Batched fuzzy scoring
+# ------------------------
+def score_batch(
+    query: str, choices: Sequence[str], threshold: float
+) -> list[tuple[int, float]]:
+    """Score all `choices` against `query` with `fuzz.partial_ratio` in one call.
+
+    Returns (index, score) for every choice scoring at least `threshold`.
+    """
+    if threshold > 100 or not choices:
+        return []
+    matches = process.extract(
+        query,
+        choices,
+        scorer=fuzz.partial_ratio,
+        score_cutoff=max(threshold, 0),
+        limit=None,
+    )
+    return [(i, score) for _, score, i in matches]
+
+
+def score_names(
+    query: str, names: Sequence[str], threshold: float, short: Iterable[int] = ()
+) -> list[tuple[int, float]]:
+    """`score_batch` for file names, skipping names which can not reach `threshold`.
+
+    `partial_ratio` aligns the query with a window of the name at most as
+    long as the query. Reaching `threshold` needs a common subsequence of
+    `threshold * len(query) / (200 - threshold)` characters with the window
+    and thus with the whole name, which the much cheaper `LCSseq.similarity`
+    rules out for most names. The bound only holds for names at least as
+    long as the query, the positions `short` of shorter names are always
+    scored. Scoring stops early once the call ran out of time.
+    """
+    if threshold > 100 or not names:
+        return []
+    cutoff = math.ceil(max(threshold, 0) * len(query) / (200 - threshold) - 1e-9)
+    matches = process.extract(
+        query, names, scorer=LCSseq.similarity, score_cutoff=cutoff, limit=None
+    )
+    candidates = sorted({i for _, _, i in matches}.union(short))
+    results = []
+    for batch in batches(candidates):
+        if deadline.expired():
+            break
+        results += [
+            (batch[j], score)
+            for j, score in score_batch(query, [names[i] for i in batch], threshold)
+        ]
+    return results
+
+
+def batches(items: Sequence, size: int = BATCH_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
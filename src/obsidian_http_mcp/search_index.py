@@ -0,0 +1,265 @@
+from array import array
+from collections.abc import Iterable, Iterator
+import math
+import threading
+
+# The trigram filter is only used for queries shorter than this; longer
+# queries fall back to scoring every line.
+SHORT_LINE_LIMIT = 128
+
+
+def split_lines(text: str) -> list[str]:
+    """Split like iterating over a text file: keep "\\n", nothing else splits."""
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def line_starts(text: str) -> array:
+    """Offsets of the lines of `text` as split by `split_lines`, followed by
+    the end of the last line."""
+    starts = array("I", [0])
+    pos = text.find("\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    if starts[-1] != len(text):
+        starts.append(len(text))
+    return starts
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+# ------------------------
+# Trigram line index
+# ------------------------
+class TrigramIndex:
+    """Text and trigram posting lists of all indexed notes.
+
+    Used to skip lines which can not reach a `fuzz.partial_ratio` threshold.
+    Lines are scored on their lowercased text including the line break, the
+    same way `Vault.search_text_in_notes` reads them from disk.
+
+    The minimum number of shared trigrams follows from the q-gram lemma: an
+    alignment with `d` insertions/deletions breaks at most `3 * d` trigrams
+    and `partial_ratio >= t` allows at most `d = 2 * m * (1 - t / 100)` for a
+    needle of length `m`. Lines which might still reach the threshold are
+    never dropped, so results are identical to scoring every line.
+
+    Postings list the notes containing a trigram, the lines of those notes
+    are then checked for the trigrams themselves. A note is kept as its text
+    and its lowercased text (the same object if equal) with the offsets of
+    their lines; lines are only sliced out while searching.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._ids: dict[str, int] = {}
+        self._rels: dict[int, str] = {}
+        # file id -> (text, line starts, lowered text, lowered line starts)
+        self._notes: dict[int, tuple[str, array, str, array]] = {}
+        # length of the shortest non-blank line of a note
+        self._shortest: dict[int, int] = {}
+        self._posted: dict[int, int] = {}
+        self._next_id = 0
+
+        # trigram -> ids of the notes containing it
+        self._postings: dict[str, array] = {}
+        # postings of replaced or removed files are dropped lazily
+        self._dead = 0
+        self._live = 0
+
+    def __contains__(self, rel: str) -> bool:
+        return rel in self._ids
+
+    def paths(self) -> list[str]:
+        with self.lock:
+            return list(self._ids)
+
+    def text(self, rel: str) -> str | None:
+        """Indexed content of a note."""
+        with self.lock:
+            file_id = self._ids.get(rel)
+            return None if file_id is None else self._notes[file_id][0]
+
+    def line(self, rel: str, line_number: int) -> str | None:
+        """Line `line_number` (1-based) of a note, None if not indexed."""
+        with self.lock:
+            file_id = self._ids.get(rel)
+            if file_id is None:
+                return None
+            text, starts, _, _ = self._notes[file_id]
+            if not 0 < line_number < len(starts):
+                return None
+            return text[starts[line_number - 1] : starts[line_number]]
+
+    def update(self, rel: str, text: str):
+        """(Re)index the content of a single note."""
+        with self.lock:
+            self.remove(rel)
+            file_id = self._next_id
+            self._next_id += 1
+            self._add(rel, file_id, text)
+            self._post(file_id)
+
+    def remove(self, rel: str):
+        with self.lock:
+            file_id = self._ids.pop(rel, None)
+            if file_id is None:
+                return
+            del self._rels[file_id]
+            del self._notes[file_id]
+            del self._shortest[file_id]
+            posted = self._posted.pop(file_id)
+            self._dead += posted
+            self._live -= posted
+            if self._dead > max(self._live, 100_000):
+                self._compact()
+
+    def dump(self) -> tuple[list, dict[str, array], int]:
+        """Copy of the index for a snapshot, see `load`.
+
+        Returns ([(rel, file id, text, posted)], trigram postings, next file
+        id). The posting arrays are not copied, so this is cheap to call
+        under the locks of the vault; convert them with `tobytes` later.
+        Arrays are only appended to until `_compact` replaces them, and ids
+        appended after the dump belong to files it does not contain, which
+        `load` drops like those of removed files.
+        """
+        with self.lock:
+            files = [
+                (rel, file_id, self._notes[file_id][0], self._posted[file_id])
+                for rel, file_id in self._ids.items()
+            ]
+            return files, dict(self._postings), self._next_id
+
+    def load(
+        self,
+        files: Iterable[tuple[str, int, str, int]],
+        postings: dict[str, bytes],
+        next_id: int,
+    ):
+        """Replace the index with the output of `dump`, postings as the raw
+        bytes of their arrays.
+
+        `files` may leave out files of the dump which changed since, their
+        postings are dropped lazily like those of removed files.
+        """
+        with self.lock:
+            self._ids, self._rels, self._notes, self._shortest = {}, {}, {}, {}
+            self._posted, self._postings = {}, {}
+            self._dead = self._live = 0
+            for rel, file_id, text, posted in files:
+                self._add(rel, file_id, text)
+                self._posted[file_id] = posted
+                self._live += posted
+            for gram, ids in postings.items():
+                self._postings[gram] = posting = array("I")
+                posting.frombytes(ids)
+                self._dead += len(posting)
+            self._dead -= self._live
+            self._next_id = next_id
+            if self._dead > max(self._live, 100_000):
+                self._compact()
+
+    def candidates(
+        self, rels: Iterable[str], query_lower: str, threshold: int
+    ) -> list[tuple[str, int, str]]:
+        """Return (rel, line_number, lowered_line) for lines of `rels` which
+        may score at least `threshold` against `query_lower`, grouped by
+        note. `line` returns the original text of a line."""
+        with self.lock:
+            scope = sorted(self._ids[rel] for rel in rels if rel in self._ids)
+            required = self._required(query_lower, threshold)
+            if required <= 0:
+                return [
+                    (self._rels[file_id], i, lowered)
+                    for file_id in scope
+                    for i, lowered in self._lines(file_id)
+                ]
+
+            # Lines at least as long as the query must share `required`
+            # trigrams with it, hence at least one of its len - required + 1
+            # rarest ones.
+            m = len(query_lower)
+            grams = sorted(
+                trigrams(query_lower), key=lambda g: len(self._postings.get(g, ()))
+            )
+            grams = grams[: len(grams) - math.ceil(required) + 1]
+            posted = set()
+            for gram in grams:
+                posted.update(self._postings.get(gram, ()))
+
+            results = []
+            for file_id in scope:
+                has_grams = file_id in posted
+                # Lines shorter than the query are the needle themselves and
+                # are left to the scorer.
+                if not has_grams and self._shortest[file_id] >= m:
+                    continue
+                rel = self._rels[file_id]
+                for i, lowered in self._lines(file_id):
+                    if len(lowered) < m or (
+                        has_grams and any(gram in lowered for gram in grams)
+                    ):
+                        results.append((rel, i, lowered))
+            return results
+
+    def prunes(self, query_lower: str, threshold: int) -> bool:
+        """Whether the trigram filter can rule out lines for this query."""
+        return self._required(query_lower, threshold) > 0
+
+    # --- Helper methods ---
+
+    def _required(self, query_lower: str, threshold: int) -> float:
+        """Minimum number of trigrams a line as long as the query must share."""
+        m = len(query_lower)
+        if threshold <= 0 or m >= SHORT_LINE_LIMIT:
+            return 0
+        return len(trigrams(query_lower)) - 6 * (1 - threshold / 100) * m
+
+    def _add(self, rel: str, file_id: int, text: str):
+        starts = line_starts(text)
+        lowered = text.lower()
+        if lowered == text:
+            lowered, lowered_starts = text, starts
+        elif len(lowered) == len(text):
+            lowered_starts = starts
+        else:
+            # e.g. "İ" lowercases to two characters
+            lowered_starts = line_starts(lowered)
+        self._ids[rel] = file_id
+        self._rels[file_id] = rel
+        self._notes[file_id] = (text, starts, lowered, lowered_starts)
+        self._shortest[file_id] = min(
+            (len(line) for _, line in self._lines(file_id)), default=SHORT_LINE_LIMIT
+        )
+
+    def _lines(self, file_id: int) -> Iterator[tuple[int, str]]:
+        """(line number, lowered line) of the non-blank lines of a note."""
+        _, _, lowered, starts = self._notes[file_id]
+        for i in range(len(starts) - 1):
+            line = lowered[starts[i] : starts[i + 1]]
+            if line.strip():
+                yield i + 1, line
+
+    def _post(self, file_id: int):
+        grams = trigrams(self._notes[file_id][2])
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("I")
+            posting.append(file_id)
+        self._posted[file_id] = len(grams)
+        self._live += len(grams)
+
+    def _compact(self):
+        self._postings = {}
+        self._dead = 0
+        self._live = 0
+        for file_id in self._notes:
+            self._post(file_id)
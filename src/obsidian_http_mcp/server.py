@@ -1,11 +1,21 @@
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
 from dotenv import load_dotenv
 import os
 from typing import Annotated
 from pydantic import Field
 
 from vault import Vault
+from watcher import VaultWatcher
+from snapshot import SnapshotSaver
+import parallel
 from authentication import UserAuthMiddleware
+from metrics import MetricsMiddleware
+from profiling import ProfilingMiddleware
+import metrics
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from concurrency import run_heavy, run_light
+from progress import SearchProgress
 
 # ------------------------
 # Load environment
@@ -25,47 +35,251 @@ mcp = FastMCP(
     """,
 )
 
-mcp.add_middleware(UserAuthMiddleware())
+# metrics first, so calls rejected by the authentication are counted too
+mcp.add_middleware(MetricsMiddleware())
+# tools run in the heavy executor, limited per user by MCP_MAX_HEAVY_CALLS
+HEAVY_TOOLS = {"search_text_in_notes", "find_note_in_vault"}
+AUTH = UserAuthMiddleware(heavy_tools=HEAVY_TOOLS)
+mcp.add_middleware(AUTH)
+mcp.add_middleware(ProfilingMiddleware())
 
 # ------------------------
 # MCP tools
 # ------------------------
+# fork the search workers before any other thread exists and before the
+# vault is indexed, so the workers do not hold copies of the index pages
+if parallel.enabled():
+    parallel.start_pool()
+
 VAULT = Vault(vault_path)
 
+# keep VAULT in sync with edits from Obsidian, sync clients, etc.
+WATCHER = VaultWatcher(VAULT)
+WATCHER.start()
+
+# persist the indexes, so restarts only re-parse changed notes
+SNAPSHOT_SAVER = SnapshotSaver(VAULT)
+SNAPSHOT_SAVER.start()
+
+metrics.register_cache("note_cache", VAULT.content_cache.stats)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus metrics of tool calls, searches and caches.
+
+    Custom routes bypass the middlewares, the bearer token is checked here.
+    """
+    if AUTH.request_user(request) is None:
+        return PlainTextResponse(
+            "Access denied: invalid token",
+            status_code=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 @mcp.tool
-def list_files_in_vault() -> list[str]:
-    """List all notes in the obsidian vault as list of string containing the vault relative paths"""
-    return VAULT.list_files_in_vault()
+async def list_files_in_vault(
+    limit: Annotated[
+        int | None,
+        Field(
+            description="Optional maximum number of results per page. "
+            "If set, the result is a dict with 'results' and 'next_cursor'",
+            default=None,
+        ),
+    ],
+    cursor: Annotated[
+        str | None,
+        Field(
+            description="Optional 'next_cursor' of the previous page to fetch the next one",
+            default=None,
+        ),
+    ],
+    compact: Annotated[
+        bool,
+        Field(
+            description="Return the paths as a tree of nested dicts instead of a "
+            "flat list: directories map to their entries, notes to null",
+            default=False,
+        ),
+    ],
+    depth: Annotated[
+        int | None,
+        Field(
+            description="Optional number of directory levels expanded in the "
+            "compact tree, deeper directories map to their number of notes",
+            default=None,
+        ),
+    ],
+    glob: Annotated[
+        str | None,
+        Field(
+            description="Optional glob the listed paths must match, "
+            "e.g. 'projects/*' or '*meeting*'",
+            default=None,
+        ),
+    ],
+    timeout: Annotated[
+        float | None,
+        Field(
+            description="Optional seconds after which the scan stops and the results "
+            "found so far are returned with 'truncated': true. Defaults to "
+            "MCP_CALL_TIMEOUT, 0 disables it",
+            default=None,
+        ),
+    ],
+) -> list[str] | dict:
+    """List all notes in the obsidian vault as list of string containing the vault relative paths.
+    With limit or cursor the paths are returned page by page in alphabetical order.
+    With compact a page is returned as tree of its paths.
+    Results cut short by the timeout are returned as dict with 'results' and
+    'truncated'."""
+    return await run_light(
+        VAULT.list_files_in_vault, limit, cursor, compact, depth, glob, timeout=timeout
+    )
 
 
 @mcp.tool
-def list_files_in_dir(
+async def list_files_in_dir(
     dir: Annotated[
         str,
         Field(description="direcotry path in vault. Path is relative to vault path"),
     ],
-) -> list[str]:
-    """List all notes in a directory relative to the obsidian vault."""
-    return VAULT.list_files_in_dir(dir)
+    limit: Annotated[
+        int | None,
+        Field(
+            description="Optional maximum number of results per page. "
+            "If set, the result is a dict with 'results' and 'next_cursor'",
+            default=None,
+        ),
+    ],
+    cursor: Annotated[
+        str | None,
+        Field(
+            description="Optional 'next_cursor' of the previous page to fetch the next one",
+            default=None,
+        ),
+    ],
+    compact: Annotated[
+        bool,
+        Field(
+            description="Return the paths as a tree of nested dicts instead of a "
+            "flat list: directories map to their entries, notes to null",
+            default=False,
+        ),
+    ],
+    depth: Annotated[
+        int | None,
+        Field(
+            description="Optional number of directory levels expanded in the "
+            "compact tree, deeper directories map to their number of notes",
+            default=None,
+        ),
+    ],
+    glob: Annotated[
+        str | None,
+        Field(
+            description="Optional glob the listed paths must match, "
+            "e.g. 'projects/*' or '*meeting*'",
+            default=None,
+        ),
+    ],
+    timeout: Annotated[
+        float | None,
+        Field(
+            description="Optional seconds after which the scan stops and the results "
+            "found so far are returned with 'truncated': true. Defaults to "
+            "MCP_CALL_TIMEOUT, 0 disables it",
+            default=None,
+        ),
+    ],
+) -> list[str] | dict:
+    """List all notes in a directory relative to the obsidian vault.
+    With limit or cursor the paths are returned page by page in alphabetical order.
+    With compact a page is returned as tree of its paths.
+    Results cut short by the timeout are returned as dict with 'results' and
+    'truncated'."""
+    return await run_light(
+        VAULT.list_files_in_dir,
+        dir,
+        limit,
+        cursor,
+        compact,
+        depth,
+        glob,
+        timeout=timeout,
+    )
 
 
 @mcp.tool
-def get_file_contents(
+async def get_file_contents(
     filename: Annotated[
         str,
         Field(
             description="filename of note (without path)",
         ),
     ],
+    start_line: Annotated[
+        int | None,
+        Field(description="Optional first line to return (1-based)", default=None),
+    ],
+    end_line: Annotated[
+        int | None,
+        Field(description="Optional last line to return (inclusive)", default=None),
+    ],
+    start_byte: Annotated[
+        int | None,
+        Field(description="Optional first byte to return", default=None),
+    ],
+    end_byte: Annotated[
+        int | None,
+        Field(description="Optional end of the byte range (exclusive)", default=None),
+    ],
+    heading: Annotated[
+        str | None,
+        Field(
+            description="Optional heading, e.g. ## Tasks. Only the section under it is returned",
+            default=None,
+        ),
+    ],
 ):
-    """Return the full text of a note in the vault by filename (searches vault)."""
-    result = VAULT.get_file_contents(filename)
+    """Return the full text of a note in the vault by filename (searches vault).
+    Large notes can be read in parts: either a line range, a byte range or the
+    section under a heading. Only one of these modes can be used per call.
+    """
+    result = await run_light(
+        VAULT.get_file_contents,
+        filename,
+        start_line,
+        end_line,
+        start_byte,
+        end_byte,
+        heading,
+    )
     return result
 
 
 @mcp.tool
-def create_note(
+async def get_many_file_contents(
+    filenames: Annotated[
+        list[str],
+        Field(
+            description="list of names, relative paths (relative to vault path) or absolute paths of the notes",
+        ),
+    ],
+) -> list[dict]:
+    """Returns the content of several notes of the obsidian vault in one call.
+    For each requested note either its path and content or an error is returned, in the given order.
+    Notes exceeding the total size limit of the response are returned with an error.
+    """
+    return await run_light(VAULT.get_many_file_contents, filenames)
+
+
+@mcp.tool
+async def create_note(
     filepath: Annotated[
         str,
         Field(
@@ -76,11 +290,11 @@ def create_note(
     """Creates empty note in the obsidian vault.
     The input filepath is relative to the obsidian vault.
     The return value is the absolute filepath of the new file"""
-    return VAULT.create_note(filepath)
+    return await run_light(VAULT.create_note, filepath)
 
 
 @mcp.tool
-def append_content_to_note(
+async def append_content_to_note(
     filepath: Annotated[
         str,
         Field(
@@ -97,11 +311,11 @@ def append_content_to_note(
     """Adds content to the end of the given file.
     The input file path is relative to the obsidian vault.
     The return value is the absolute path of the changed file."""
-    return VAULT.append_content_to_note(filepath, content)
+    return await run_light(VAULT.append_content_to_note, filepath, content)
 
 
 @mcp.tool
-def delete_lines_from_note(
+async def delete_lines_from_note(
     filepath: Annotated[
         str,
         Field(
@@ -119,12 +333,12 @@ def delete_lines_from_note(
     Line numbers are 1-based (first line is 1).
     Multiple lines can be deleted by passing a list of line numbers.
     """
-    VAULT.delete_lines_from_note(filepath, line_numbers)
+    await run_light(VAULT.delete_lines_from_note, filepath, line_numbers)
     return f"Successfully deleted lines {line_numbers} from {filepath}"
 
 
 @mcp.tool
-def patch_content_into_note(
+async def patch_content_into_note(
     filepath: Annotated[
         str,
         Field(
@@ -134,13 +348,15 @@ def patch_content_into_note(
     target_type: Annotated[
         str,
         Field(
-            description="differentiation between inline (target_type: text) edit and linewise (target_type: line) edit.",
+            description="differentiation between inline (target_type: text) edit and linewise (target_type: line) edit. "
+            "Use heading, block or frontmatter to target a section, a block id or a frontmatter field.",
         ),
     ],
     target: Annotated[
         str,
         Field(
-            description="name of the target where the new content should be added: heading name e.g. ## Tasks",
+            description="name of the target where the new content should be added: a unique text snippet, "
+            "a heading e.g. ## Tasks or a heading path e.g. Project::Tasks, a block id e.g. ^task-1 or a frontmatter field e.g. tags",
         ),
     ],
     operation: Annotated[
@@ -157,16 +373,48 @@ def patch_content_into_note(
     ],
 ) -> str:
     """Adds content relative to a given target in the given note of the obsidian vault.
-    The target must be a text snippet.
-    It can be used to manipulate frontmatter, text, headings, blocks, etc.
+    The target is a text snippet, a heading, a block id or a frontmatter field.
+    For headings append adds to the end of the section, prepend directly below the heading and replace replaces the section body.
+    For frontmatter fields replace sets the value of the field, adding the field if it does not exist.
     If no specific position is required use the append_content_to_note tool.
     """
-    VAULT.patch_content_into_note(filepath, target_type, target, operation, content)
+    await run_light(
+        VAULT.patch_content_into_note, filepath, target_type, target, operation, content
+    )
     return f"Successfully patched content in {filepath}"
 
 
 @mcp.tool
-def find_note_in_vault(
+async def apply_note_edits(
+    filepath: Annotated[
+        str,
+        Field(
+            description="filepath (relative to vault path) of file which should be changed",
+        ),
+    ],
+    edits: Annotated[
+        list[dict],
+        Field(
+            description="ordered list of edits. Each edit is one of: "
+            '{"op": "patch", "target_type": "text"|"line", "target": ..., '
+            '"operation": "append"|"prepend"|"replace", "content": ...}, '
+            '{"op": "append", "content": ...}, {"op": "prepend", "content": ...}, '
+            '{"op": "delete_lines", "line_numbers": [...]} (1-based), '
+            '{"op": "replace", "target": ..., "content": ...}',
+        ),
+    ],
+) -> str:
+    """Applies several edits to one note of the obsidian vault at once.
+    The note is read once, the edits are applied in the given order and the result is written once.
+    Line numbers refer to the note as changed by the previous edits.
+    Either all edits succeed or the note stays unchanged.
+    """
+    await run_light(VAULT.apply_note_edits, filepath, edits)
+    return f"Successfully applied {len(edits)} edits to {filepath}"
+
+
+@mcp.tool
+async def find_note_in_vault(
     dir: Annotated[
         str,
         Field(description="Root directory in vault to search"),
@@ -188,16 +436,52 @@ def find_note_in_vault(
         int,
         Field(description="Minimum similarity score (0–100)", default=80),
     ],
-) -> list[dict]:
+    limit: Annotated[
+        int | None,
+        Field(
+            description="Optional maximum number of results per page. "
+            "If set, the result is a dict with 'results' and 'next_cursor'",
+            default=None,
+        ),
+    ],
+    cursor: Annotated[
+        str | None,
+        Field(
+            description="Optional 'next_cursor' of the previous page to fetch the next one",
+            default=None,
+        ),
+    ],
+    timeout: Annotated[
+        float | None,
+        Field(
+            description="Optional seconds after which the scan stops and the results "
+            "found so far are returned with 'truncated': true. Defaults to "
+            "MCP_CALL_TIMEOUT, 0 disables it",
+            default=None,
+        ),
+    ],
+) -> list[dict] | dict:
     """Searches for notes in a specific directory of the obsidian vault whose names are similar to `query`.
     The files can be filter by file extension, default is only markdown files
     Returns a list of dicts with 'path' and 'score', sorted by descending score.
+    With limit or cursor only one page of the results is returned.
+    Results cut short by the timeout are returned as dict with 'results' and
+    'truncated'.
     """
-    return VAULT.find_note_in_vault(dir, query, extensions, threshold)
+    return await run_heavy(
+        VAULT.find_note_in_vault,
+        dir,
+        query,
+        extensions,
+        threshold,
+        limit,
+        cursor,
+        timeout=timeout,
+    )
 
 
 @mcp.tool
-def search_text_in_notes(
+async def search_text_in_notes(
     dir: Annotated[
         str,
         Field(description="Directory in vault to search"),
@@ -217,14 +501,254 @@ def search_text_in_notes(
         int,
         Field(description="Minimum similarity score (0–100)", default=80),
     ],
-) -> list[dict]:
+    limit: Annotated[
+        int | None,
+        Field(
+            description="Optional maximum number of results per page. "
+            "If set, the result is a dict with 'results' and 'next_cursor'",
+            default=None,
+        ),
+    ],
+    cursor: Annotated[
+        str | None,
+        Field(
+            description="Optional 'next_cursor' of the previous page to fetch the next one",
+            default=None,
+        ),
+    ],
+    mode: Annotated[
+        str,
+        Field(
+            description="'fuzzy' to match lines similar to the query, or 'fulltext' "
+            'for ranked word search supporting "phrases", prefix* and AND / OR / NOT',
+            default="fuzzy",
+        ),
+    ],
+    compact: Annotated[
+        bool,
+        Field(
+            description="Return vault relative paths and group the hits by note: "
+            "[{'path', 'hits': [[line, text, score], ...]}]",
+            default=False,
+        ),
+    ],
+    stream: Annotated[
+        bool,
+        Field(
+            description="Scan part by part, report progress notifications and "
+            "allow stopping early with max_hits or time_budget. Only in fuzzy "
+            "mode without limit and cursor",
+            default=False,
+        ),
+    ],
+    max_hits: Annotated[
+        int | None,
+        Field(
+            description="Optional number of hits after which a streaming "
+            "search returns",
+            default=None,
+        ),
+    ],
+    time_budget: Annotated[
+        float | None,
+        Field(
+            description="Optional seconds after which a streaming search "
+            "returns the hits found so far",
+            default=None,
+        ),
+    ],
+    timeout: Annotated[
+        float | None,
+        Field(
+            description="Optional seconds after which the scan stops and the results "
+            "found so far are returned with 'truncated': true. Defaults to "
+            "MCP_CALL_TIMEOUT, 0 disables it",
+            default=None,
+        ),
+    ],
+    ctx: Context,
+) -> list[dict] | dict:
     """
     Fuzzy search for a given text in all notes under a given
     directory.
     Returns a list of dicts with keys 'path', 'line', 'text', 'score',
     sorted by descending score.
+    In 'fulltext' mode notes are ranked by BM25 and the dicts have the keys
+    'path', 'score' and 'snippet' with the matches in **bold**.
+    With limit or cursor only one page of the results is returned.
+    With compact the paths are vault relative and the fuzzy hits of a note
+    are grouped under it.
+    With stream progress is reported while scanning and the result is a dict
+    with 'results', 'truncated' (stopped early), 'files_scanned' and
+    'files_total'.
+    Results cut short by the timeout are returned as dict with 'results' and
+    'truncated'.
     """
-    return VAULT.search_text_in_notes(dir, query, extensions, threshold)
+    return await run_heavy(
+        VAULT.search_text_in_notes,
+        dir,
+        query,
+        extensions,
+        threshold,
+        limit,
+        cursor,
+        mode,
+        compact,
+        stream,
+        max_hits,
+        time_budget,
+        SearchProgress(ctx) if stream else None,
+        timeout=timeout,
+    )
+
+
+@mcp.tool
+async def query_notes(
+    tags: Annotated[
+        list[str] | None,
+        Field(
+            description="Optional tags every note must have, e.g. ['project']. Nested tags like project/alpha match project",
+            default=None,
+        ),
+    ],
+    properties: Annotated[
+        dict | None,
+        Field(
+            description="Optional frontmatter properties with the required value, e.g. {'status': 'open'}. "
+            "List properties match if they contain the value",
+            default=None,
+        ),
+    ],
+    ranges: Annotated[
+        dict | None,
+        Field(
+            description="Optional inclusive ranges of frontmatter properties, e.g. {'priority': {'min': 1, 'max': 3}}",
+            default=None,
+        ),
+    ],
+    modified_after: Annotated[
+        str | None,
+        Field(description="Optional ISO date, e.g. 2024-05-01", default=None),
+    ],
+    modified_before: Annotated[
+        str | None,
+        Field(description="Optional ISO date, e.g. 2024-05-31", default=None),
+    ],
+    sort_by: Annotated[
+        str,
+        Field(
+            description="Sort by 'path', 'modified' or the name of a frontmatter property",
+            default="path",
+        ),
+    ],
+    descending: Annotated[
+        bool,
+        Field(description="Sort in descending order", default=False),
+    ],
+    limit: Annotated[
+        int | None,
+        Field(
+            description="Optional maximum number of results per page. "
+            "If set, the result is a dict with 'results' and 'next_cursor'",
+            default=None,
+        ),
+    ],
+    cursor: Annotated[
+        str | None,
+        Field(
+            description="Optional 'next_cursor' of the previous page to fetch the next one",
+            default=None,
+        ),
+    ],
+) -> list[dict] | dict:
+    """
+    Find notes by tags (frontmatter and inline #tags), frontmatter properties
+    and modification date.
+    Returns a list of dicts with keys 'path', 'tags', 'properties', 'modified'.
+    With limit or cursor only one page of the results is returned.
+    """
+    return await run_light(
+        VAULT.query_notes,
+        tags,
+        properties,
+        ranges,
+        modified_after,
+        modified_before,
+        sort_by,
+        descending,
+        limit,
+        cursor,
+    )
+
+
+@mcp.tool
+async def get_backlinks(
+    filename: Annotated[
+        str,
+        Field(description="name or path (relative to vault path) of the note"),
+    ],
+) -> list[dict]:
+    """Returns all wikilinks and embeds pointing to the given note.
+    Returns a list of dicts with keys 'path' (linking note), 'line', 'link', 'embed'.
+    """
+    return await run_light(VAULT.get_backlinks, filename)
+
+
+@mcp.tool
+async def get_outgoing_links(
+    filename: Annotated[
+        str,
+        Field(description="name or path (relative to vault path) of the note"),
+    ],
+) -> list[dict]:
+    """Returns all wikilinks and embeds in the given note.
+    Returns a list of dicts with keys 'link', 'target', 'line', 'embed'.
+    'target' is the path of the linked file or null if the link is unresolved.
+    """
+    return await run_light(VAULT.get_outgoing_links, filename)
+
+
+@mcp.tool
+async def get_unresolved_links(
+    dir: Annotated[
+        str,
+        Field(description="Directory in vault to check", default="/"),
+    ],
+) -> list[dict]:
+    """Returns all wikilinks to notes or files which do not exist, in the notes under a given directory.
+    Returns a list of dicts with keys 'path' (linking note), 'line', 'link'.
+    """
+    return await run_light(VAULT.get_unresolved_links, dir)
+
+
+@mcp.tool
+async def get_note_neighborhood(
+    filename: Annotated[
+        str,
+        Field(description="name or path (relative to vault path) of the note"),
+    ],
+    depth: Annotated[
+        int,
+        Field(description="Number of link hops (1-5)", default=1),
+    ],
+    direction: Annotated[
+        str,
+        Field(
+            description="'out' to follow links, 'in' to follow backlinks or 'both'",
+            default="both",
+        ),
+    ],
+) -> list[dict]:
+    """Returns the notes connected to the given note by wikilinks within the given number of hops.
+    Returns a list of dicts with keys 'path' and 'distance', sorted by distance.
+    """
+    return await run_light(VAULT.get_note_neighborhood, filename, depth, direction)
+
+
+@mcp.tool
+async def get_cache_stats() -> dict:
+    """Return hit, miss and eviction counters of the note content cache."""
+    return VAULT.content_cache.stats()
 
 
 # ------------------------
@@ -0,0 +1,207 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+
+import search_index
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+# `auto` (hidden file next to the vault directory), `off` or a file path
+VAULT_SNAPSHOT_PATH = os.getenv("VAULT_SNAPSHOT_PATH", "auto")
+# Seconds between saves of a changed vault
+VAULT_SNAPSHOT_INTERVAL = float(os.getenv("VAULT_SNAPSHOT_INTERVAL", 300))
+
+# Bump when the tables or the content of the indexes change
+SNAPSHOT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE files (rel TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+CREATE TABLE notes (
+    rel TEXT PRIMARY KEY,
+    file_id INTEGER,
+    text TEXT,
+    posted INTEGER,
+    tags TEXT,
+    properties TEXT,
+    links TEXT
+);
+CREATE TABLE postings (gram TEXT PRIMARY KEY, keys BLOB);
+"""
+
+
+def snapshot_path(vault: Path, setting: str = VAULT_SNAPSHOT_PATH) -> Path | None:
+    """File the snapshot of `vault` is kept in, None if disabled."""
+    if setting == "off":
+        return None
+    if setting == "auto":
+        # next to the vault, so neither Obsidian nor the watcher see it
+        return vault.parent / f".{vault.name}.mcp-index.sqlite"
+    return Path(setting).expanduser()
+
+
+# ------------------------
+# Snapshot file
+# ------------------------
+class VaultSnapshot:
+    """SQLite file keeping the indexes of a vault across restarts.
+
+    Holds the file listing with (size, mtime_ns), plus text, trigram
+    postings, tags, properties and links of every indexed note. A snapshot
+    written for another vault, another format version or other index
+    parameters is ignored.
+    """
+
+    def __init__(self, path: Path, vault: Path):
+        self.path = path
+        self.vault = vault
+
+    def _meta(self) -> dict[str, str]:
+        return {
+            "version": str(SNAPSHOT_VERSION),
+            "vault": str(self.vault),
+            "short_line_limit": str(search_index.SHORT_LINE_LIMIT),
+        }
+
+    def load(self) -> dict | None:
+        """Return the saved state (see `save`), None if there is no usable one."""
+        if not self.path.is_file():
+            return None
+        try:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            meta = dict(db.execute("SELECT key, value FROM meta"))
+            next_id = meta.pop("next_id", None)
+            if meta != self._meta() or next_id is None:
+                return None
+            files = {
+                rel: (size, mtime_ns)
+                for rel, size, mtime_ns in db.execute("SELECT * FROM files")
+            }
+            notes = [
+                (
+                    rel,
+                    file_id,
+                    text,
+                    posted,
+                    json.loads(tags),
+                    json.loads(properties),
+                    [tuple(link) for link in json.loads(links)],
+                )
+                for rel, file_id, text, posted, tags, properties, links in (
+                    db.execute("SELECT * FROM notes")
+                )
+            ]
+            return {
+                "files": files,
+                "notes": notes,
+                "postings": dict(db.execute("SELECT * FROM postings")),
+                "next_id": int(next_id),
+            }
+        except (sqlite3.Error, ValueError, TypeError):
+            return None
+        finally:
+            db.close()
+
+    def save(self, state: dict):
+        """Replace the snapshot with `state`.
+
+        `state` has the keys "files" ({rel: (size, mtime_ns)}), "notes"
+        ([(rel, file id, text, posted, tags, properties, links)], text and
+        file id None for notes not in the text index) and the "postings"
+        and "next_id" of `TrigramIndex.dump`. The
+        file is written next to the old one and renamed over it, so a
+        crash never leaves a half written snapshot.
+        """
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        db = sqlite3.connect(tmp)
+        try:
+            db.executescript(SCHEMA)
+            db.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [*self._meta().items(), ("next_id", str(state["next_id"]))],
+            )
+            db.executemany(
+                "INSERT INTO files VALUES (?, ?, ?)",
+                ((rel, size, mtime) for rel, (size, mtime) in state["files"].items()),
+            )
+            db.executemany(
+                "INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        rel,
+                        file_id,
+                        text,
+                        posted,
+                        json.dumps(sorted(tags)),
+                        json.dumps(properties),
+                        json.dumps(links),
+                    )
+                    for rel, file_id, text, posted, tags, properties, links in (
+                        state["notes"]
+                    )
+                ),
+            )
+            db.executemany(
+                "INSERT INTO postings VALUES (?, ?)", state["postings"].items()
+            )
+            db.commit()
+        finally:
+            db.close()
+        os.replace(tmp, self.path)
+
+
+# ------------------------
+# Snapshot saver
+# ------------------------
+class SnapshotSaver:
+    """Background thread saving the snapshot of a `Vault` which changed.
+
+    Saves once right after start, so a vault indexed from scratch is
+    persisted early, then every `interval` seconds and on exit.
+    """
+
+    def __init__(self, vault, interval: float = VAULT_SNAPSHOT_INTERVAL):
+        self.vault = vault
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self.vault.snapshot is None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="vault-snapshot", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._save()
+
+    def _run(self):
+        while True:
+            self._save()
+            if self._stop.wait(self.interval):
+                return
+
+    def _save(self):
+        try:
+            self.vault.save_snapshot()
+        except (OSError, sqlite3.Error):
+            pass  # e.g. read-only directory, retried on the next interval
@@ -1,53 +1,244 @@
-from rapidfuzz import fuzz
+from collections import OrderedDict
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatchcase
+import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
+from compact import group_hits, path_tree
+from content_cache import ContentCache
+from fulltext import VAULT_FULLTEXT_PATH, FullTextIndex, fulltext_path
+from index import VaultIndex, normalize_name
+from links import LinkIndex
+from metadata import MetadataIndex, sort_key
+from line_table import LineTable, LineTableCache, read_span
+from search_index import TrigramIndex
+from snapshot import VAULT_SNAPSHOT_PATH, VaultSnapshot, snapshot_path
+from writer import NoteWriter
+from scoring import BATCH_SIZE, batches, score_batch, score_names
+from pagination import decode_cursor, encode_cursor, paginate, query_fingerprint
+import deadline
+import metrics
+import parallel
+
+# Notes whose lines are kept in memory for search_text_in_notes
+TEXT_INDEX_EXTENSIONS = (".md",)
+
+# Patch targets resolved via the structure of the note
+STRUCTURE_TARGET_TYPES = ("heading", "block", "frontmatter")
+
+# Number of find/search result sets kept for paging through them
+HITS_CACHE_SIZE = 16
+
+# Bytes of notes read from disk between two progress reports of a
+# streaming search
+STREAM_CHUNK_BYTES = 1024 * 1024
+# Indexed lines scored between two progress reports of a streaming search
+STREAM_BATCH_LINES = 5_000
+
 # ------------------------
 # Load environment
 # ------------------------
 load_dotenv()
 
+# Total size of the notes returned by one get_many_file_contents call
+MANY_FILES_MAX_BYTES = int(os.getenv("MANY_FILES_MAX_BYTES", 4 * 1024 * 1024))
+# Threads reading the notes of one get_many_file_contents call
+MANY_FILES_READERS = 8
+# Keep the text of all notes in memory for search_text_in_notes, "false"
+# reads every searched note from disk instead
+VAULT_TEXT_INDEX = os.getenv("VAULT_TEXT_INDEX", "true").lower() in ("1", "true", "yes")
+
 
 # ------------------------
 # Vault interface
 # ------------------------
 class Vault:
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        snapshot: str = VAULT_SNAPSHOT_PATH,
+        fulltext: str = VAULT_FULLTEXT_PATH,
+        text_index: bool = VAULT_TEXT_INDEX,
+    ):
+        """Index the vault at `path`.
+
+        Indexes of unchanged notes are loaded from the snapshot file set by
+        `snapshot` (see `snapshot.snapshot_path`), only new and changed
+        notes are parsed. `fulltext` sets the database of the full text
+        index (see `fulltext.fulltext_path`). Without `text_index` the
+        notes are not kept in memory and searches read them from disk.
+        """
         self.path = Path(path).expanduser().resolve()
 
-    def list_files_in_vault(self):
-        return [str(f.relative_to(self.path)) for f in self.path.rglob("*.md")]
+        # file listing is built once and kept up to date by the write methods
+        # and, if running, the VaultWatcher
+        self.index = VaultIndex(self.path)
+        self.index.build()
+        self.watched = False
+        # bumped on every change, invalidates cached search hits
+        self.generation = 0
+        self._hits_cache: OrderedDict[tuple, tuple[int, list]] = OrderedDict()
+        self._hits_lock = threading.Lock()
+
+        # serializes edits per note, replaces files atomically
+        self.writer = NoteWriter()
+
+        # decoded text of recently read notes
+        self.content_cache = ContentCache()
+        # line offsets of recently read notes for ranged reads
+        self.line_tables = LineTableCache()
+
+        # text of all notes, searched without touching the disk
+        self.text_index = TrigramIndex()
+        self.keep_text = text_index
+        # tags and frontmatter properties of all notes
+        self.metadata = MetadataIndex()
+        # wikilinks of all notes and the file names they resolve against
+        self.links = LinkIndex()
+        # FTS5 index of all notes for search_text_in_notes(mode="fulltext")
+        self.fulltext = FullTextIndex(fulltext_path(self.path, fulltext))
+        # held while the indexes above change, so snapshots are consistent
+        self.index_lock = threading.RLock()
+
+        snapshot_file = snapshot_path(self.path, snapshot)
+        self.snapshot = snapshot_file and VaultSnapshot(snapshot_file, self.path)
+        # generation written to the snapshot last
+        self.saved_generation: int | None = None
+
+        for rel in self.index.files:
+            self.links.add_file(rel)
+        notes = self.index.files_under("", TEXT_INDEX_EXTENSIONS)
+        restored = self._restore_snapshot(notes)
+        with self.fulltext.batch():
+            for rel in notes:
+                if rel not in restored:
+                    self._index_text(rel)
+            self._sync_fulltext(notes, restored)
 
-    def list_files_in_dir(self, dir: str):
-        if dir[0] == "/":
-            dir_path = Path(self.path) / f".{dir}"
+    def list_files_in_vault(
+        self,
+        limit: int | None = None,
+        cursor: str | None = None,
+        compact: bool = False,
+        depth: int | None = None,
+        glob: str | None = None,
+    ):
+        files = self.index.files_under("", (".md",))
+        return self._list_paths(files, limit, cursor, compact, depth, glob, "vault")
+
+    def list_files_in_dir(
+        self,
+        dir: str,
+        limit: int | None = None,
+        cursor: str | None = None,
+        compact: bool = False,
+        depth: int | None = None,
+        glob: str | None = None,
+    ):
+        rel_dir = self._relative_dir(dir)
+        if rel_dir is None:
+            files = []
         else:
-            dir_path = Path(self.path) / dir
-        return [str(f.relative_to(dir_path)) for f in dir_path.rglob("*.md")]
+            prefix = len(rel_dir) + 1 if rel_dir else 0
+            files = [rel[prefix:] for rel in self.index.files_under(rel_dir, (".md",))]
+        return self._list_paths(
+            files, limit, cursor, compact, depth, glob, "dir", rel_dir
+        )
 
-    def get_file_contents(self, filename: str):
-        # Ensure .md extension
-        if not filename.endswith(".md"):
-            filename += ".md"
+    def get_file_contents(
+        self,
+        filename: str,
+        start_line: int | None = None,
+        end_line: int | None = None,
+        start_byte: int | None = None,
+        end_byte: int | None = None,
+        heading: str | None = None,
+    ):
+        """Return the text of a note, or only a part of it.
 
-        candidate = Path(filename)
+        Args:
+            filename: Absolute path, vault relative path or name of the note.
+            start_line, end_line: 1-based, inclusive line range.
+            start_byte, end_byte: Byte range, `end_byte` is exclusive.
+            heading: Return the section under this heading, e.g. "## Tasks".
+        """
+        path = self._resolve_note(filename)
 
-        # Case 1: provided filename is absolute path
-        if candidate.exists():
-            return candidate.read_text(encoding="utf-8")
+        lines = start_line is not None or end_line is not None
+        bytes_ = start_byte is not None or end_byte is not None
+        section = heading is not None
+        if lines + bytes_ + section > 1:
+            raise ValueError("Use only one of line range, byte range or heading")
+        if not (lines or bytes_ or section):
+            return self.content_cache.read(path)
+
+        if bytes_:
+            size = path.stat().st_size
+            end = size if end_byte is None else min(end_byte, size)
+            return read_span(path, start_byte or 0, end)
+
+        table = self.line_tables.get(path)
+        if section:
+            first, last = table.section(heading)
+        else:
+            first, last = start_line or 1, end_line or table.line_count
+        return read_span(path, *table.line_span(first, last))
+
+    def get_many_file_contents(
+        self, filenames: list[str], max_bytes: int = MANY_FILES_MAX_BYTES
+    ) -> list[dict]:
+        """Return the text of several notes at once.
 
-        # Case 2: provided filename is relative path
-        absolute_path = Path(self.path) / candidate
-        if absolute_path.exists():
-            return absolute_path.read_text(encoding="utf-8")
+        All names are resolved against the same listing and the notes are
+        read concurrently. Notes that would exceed `max_bytes` in total are
+        skipped. Returns one entry per name, in order, either with the
+        "content" of the note or with an "error".
+        """
+        results = []
+        paths = []
+        remaining = max_bytes
+        for filename, path in zip(filenames, self._resolve_notes(filenames)):
+            if isinstance(path, Exception):
+                results.append({"filename": filename, "error": str(path)})
+                continue
+            try:
+                size = path.stat().st_size
+            except OSError as e:
+                results.append({"filename": filename, "error": str(e)})
+                continue
+            if size > remaining:
+                results.append(
+                    {
+                        "filename": filename,
+                        "error": f"Skipped, total size limit of {max_bytes} bytes reached",
+                    }
+                )
+                continue
+            remaining -= size
+            results.append({"filename": filename, "path": str(path)})
+            paths.append((results[-1], path))
 
-        # Case 3: provided filename is only the name of the file
-        for file in self.path.rglob("*.md"):
-            if file.name == filename:
-                content = file.read_text(encoding="utf-8")
-                return content
+        def read(path: Path):
+            try:
+                return self.content_cache.read(path), None
+            except Exception as e:
+                return None, str(e)
 
-        raise FileNotFoundError(f"No note found for {filename}")
+        if paths:
+            with ThreadPoolExecutor(min(MANY_FILES_READERS, len(paths))) as executor:
+                texts = executor.map(read, [path for _, path in paths])
+                for (result, _), (text, error) in zip(paths, texts):
+                    if error is None:
+                        result["content"] = text
+                    else:
+                        del result["path"]
+                        result["error"] = error
+        return results
 
     def create_note(self, filepath: str):
         # normalize filename
@@ -62,30 +253,32 @@ class Vault:
         # actually create the file if it doesn't exist
         absolute_path.touch(exist_ok=False)
 
+        self._update_index(absolute_path)
+        self.content_cache.put(absolute_path, "")
         return absolute_path
 
-    from pathlib import Path
-
     def append_content_to_note(self, filepath: str, content: str):
         absolute_path = self.path / filepath
 
         # Ensure parent directories exist
         absolute_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Check if file already has content
-        file_not_empty = absolute_path.exists() and absolute_path.stat().st_size > 0
-
         # Normalize content newlines
         if not content.endswith("\n"):
             content += "\n"
 
-        # Add leading newline only if file isn't empty
-        if file_not_empty and not content.startswith("\n"):
-            content = "\n" + content
+        with self.writer.lock(absolute_path):
+            # Check if file already has content
+            file_not_empty = absolute_path.exists() and absolute_path.stat().st_size > 0
+
+            # Add leading newline only if file isn't empty
+            if file_not_empty and not content.startswith("\n"):
+                content = "\n" + content
 
-        with absolute_path.open("a", encoding="utf-8") as f:
-            f.write(content)
+            self.writer.append_text(absolute_path, content)
+            self.content_cache.invalidate(absolute_path)
 
+        self._update_index(absolute_path)
         return absolute_path
 
     def delete_lines_from_note(self, filepath: str, line_numbers: list[int]):
@@ -96,55 +289,76 @@ class Vault:
         if not absolute_path.exists():
             raise FileNotFoundError(f"{absolute_path} does not exist")
 
-        lines = absolute_path.read_text(encoding="utf-8").splitlines()
+        with self.writer.lock(absolute_path):
+            text = self.content_cache.read(absolute_path)
+            text = _delete_lines(text, line_numbers)
+            self._write_note(absolute_path, text)
 
-        # Filter out the lines that should be deleted
-        new_lines = [
-            line for i, line in enumerate(lines, start=1) if i not in line_numbers
-        ]
-
-        absolute_path.write_text("\n".join(new_lines) + "\n", encoding="utf-8")
+        self._update_index(absolute_path)
         return absolute_path
 
     def patch_content_into_note(
         self, filepath: str, target_type: str, target: str, operation: str, content: str
     ):
+        """Insert or replace content relative to a target in a note.
+
+        `text` and `line` targets are unique snippets of the note. `heading`
+        (e.g. "## Tasks" or "Project::Tasks"), `block` ("^block-id") and
+        `frontmatter` (a field name) targets are looked up in the cached
+        structure of the note instead of searching its text.
+        """
         absolute_path = self._resolve_markdown_path(filepath)
 
-        text = absolute_path.read_text(encoding="utf-8")
+        with self.writer.lock(absolute_path):
+            text = self.content_cache.read(absolute_path)
+            if target_type in STRUCTURE_TARGET_TYPES:
+                data = text.encode("utf-8")
+                table = self.line_tables.get(absolute_path)
+                if table.size != len(data):
+                    # e.g. CRLF line endings, the text differs from the file
+                    table = LineTable.parse(data)
+                text = _patch_structure(
+                    data, table, target_type, target, operation, content
+                )
+            else:
+                text = _patch_text(text, target_type, target, operation, content)
+                text += "\n"
 
-        matches = text.count(target)
-        if matches == 0:
-            raise ValueError(f"No text '{target}' found")
-        if matches > 1:
-            raise ValueError(
-                f"Multiple matches for text '{target}' found. Must be unique."
-            )
+            # write to file
+            self._write_note(absolute_path, text)
 
-        if target_type == "text":
-            if operation == "replace":
-                text = text.replace(target, content, 1)
-            elif operation == "prepend":
-                text = text.replace(target, content + target, 1)
-            elif operation == "append":
-                text = text.replace(target, target + content, 1)
-            else:
-                raise ValueError(f"Wrong operation '{operation}'")
-        elif target_type == "line":
-            if operation == "replace":
-                text = text.replace(target, content, 1)
-            elif operation == "prepend":
-                text = text.replace(target, content + "\n" + target, 1)
-            elif operation == "append":
-                text = text.replace(target, target + "\n" + content, 1)
-            else:
-                raise ValueError(f"Wrong operation '{operation}'")
-        else:
-            raise ValueError(f"Wrong target_type '{target}'")
+        self._update_index(absolute_path)
+        return absolute_path
+
+    def apply_note_edits(self, filepath: str, edits: list[dict]):
+        """Apply several edits to one note with a single read and write.
+
+        Edits are applied in order to the in-memory text, so line numbers of
+        later edits refer to the result of the earlier ones. If any edit fails
+        the note is left untouched.
+
+        Supported edits:
+            {"op": "patch", "target_type", "target", "operation", "content"}
+            {"op": "append", "content"}
+            {"op": "prepend", "content"}
+            {"op": "delete_lines", "line_numbers"}
+            {"op": "replace", "target", "content"}
+        """
+        absolute_path = self._resolve_markdown_path(filepath)
+
+        with self.writer.lock(absolute_path):
+            text = self.content_cache.read(absolute_path)
+            for i, edit in enumerate(edits, start=1):
+                try:
+                    text = _apply_edit(text, edit)
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"Edit {i} ({edit.get('op')}) failed: {e}")
 
-        # write to file
-        absolute_path.write_text(text + "\n", encoding="utf-8")
+            if text and not text.endswith("\n"):
+                text += "\n"
+            self._write_note(absolute_path, text)
 
+        self._update_index(absolute_path)
         return absolute_path
 
     def find_note_in_vault(
@@ -153,7 +367,9 @@ class Vault:
         query: str,
         extensions: tuple[str, ...] = (".md",),
         threshold: int = 80,
-    ) -> list[dict]:
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> list[dict] | dict:
         """
         Search for files in a directory (including subdirectories) whose names
         are similar to `query` using fuzzy matching.
@@ -163,34 +379,50 @@ class Vault:
             query: Filename or part of filename to search.
             extensions: Tuple of file extensions to include (default: ('.md',)).
             threshold: Minimum similarity score (0-100) to include a file.
+            limit: Maximum number of results per page (default: all).
+            cursor: `next_cursor` of the previous page.
 
         Returns:
             List of dicts {"path": file_path, "score": similarity_score},
-            sorted by descending similarity.
+            sorted by descending similarity. With `limit` or `cursor` a dict
+            {"results": [...], "next_cursor": str | None}.
         """
-        # Resolve absolute path inside vault
-        if dir[0] == "/":
-            root = (self.path / f".{dir}").resolve()
-        else:
-            root = (self.path / dir).resolve()
-        if not root.exists() or not root.is_dir():
+        rel_dir = self._relative_dir(dir)
+        if rel_dir is None or not self.index.is_dir(rel_dir):
             raise FileNotFoundError(f"Directory '{dir}' does not exist in vault")
 
-        query_lower = query.lower()
-        results: list[dict] = []
-
-        for file_path in root.rglob("*"):
-            if not file_path.is_file():
-                continue
-            if extensions and file_path.suffix not in extensions:
-                continue
+        query_name = normalize_name(query)
+        extensions = tuple(extensions)
+        params = ("find", rel_dir, query_name, extensions, threshold)
 
-            score = fuzz.partial_ratio(query_lower, file_path.name.lower())
-            if score >= threshold:
-                results.append({"path": str(file_path), "score": score})
+        def scan():
+            # names are kept normalized, only the directory range is copied
+            with self.index.lock:
+                paths, names, short = self.index.names.under(rel_dir, len(query_name))
+            metrics.SEARCH_FILES.observe(len(paths), search="find_note_in_vault")
+            metrics.SEARCH_LINES.observe(len(names), search="find_note_in_vault")
+            hits = [
+                (paths[i], score)
+                for i, score in score_names(query_name, names, threshold, short)
+                if not extensions or paths[i].endswith(extensions)
+            ]
+            return hits, False  # a single batch, never stops early
 
-        # Sort by score descending
-        return sorted(results, key=lambda x: x["score"], reverse=True)
+        hits, truncated = self._cached_hits(params, scan, limit, cursor)
+        page, next_cursor = paginate(
+            hits,
+            lambda hit: (-hit[1], hit[0]),
+            limit,
+            cursor,
+            query_fingerprint(*params),
+        )
+        root = str(self.path)
+        results = [
+            {"path": os.path.join(root, rel), "score": score} for rel, score in page
+        ]
+        if limit is None and cursor is None:
+            return _truncated(results, truncated)
+        return _truncated({"results": results, "next_cursor": next_cursor}, truncated)
 
     def search_text_in_notes(
         self,
@@ -198,7 +430,15 @@ class Vault:
         query: str,
         extensions: tuple[str, ...] = (".md",),
         threshold: int = 80,
-    ) -> list[dict]:
+        limit: int | None = None,
+        cursor: str | None = None,
+        mode: str = "fuzzy",
+        compact: bool = False,
+        stream: bool = False,
+        max_hits: int | None = None,
+        time_budget: float | None = None,
+        progress=None,
+    ) -> list[dict] | dict:
         """
         Fuzzy search for a query in all files under a directory.
 
@@ -207,52 +447,796 @@ class Vault:
             query: Text to search for in file contents.
             extensions: Tuple of file extensions to include (default: ('.md',)).
             threshold: Minimum similarity score (0–100) to include a match.
+            limit: Maximum number of results per page (default: all).
+            cursor: `next_cursor` of the previous page.
+            mode: "fuzzy" to score lines, or "fulltext" to rank notes with
+                the FTS5 index. `query` is then an FTS5 query supporting
+                "phrases", prefix* and AND / OR / NOT, `threshold` is unused
+                and only notes are searched.
+            compact: Return vault relative paths, with the hits of a note
+                grouped under it (see `group_hits`).
+            stream: Scan the notes part by part, calling `progress` in
+                between, and stop early after `max_hits` hits or
+                `time_budget` seconds. Not supported with `limit`, `cursor`
+                and "fulltext" mode.
+            max_hits: Stop streaming once this many hits were found.
+            time_budget: Stop streaming after this many seconds.
+            progress: Called with (files done, files total, hits so far)
+                while streaming.
 
         Returns:
             List of dicts with keys: 'path', 'line', 'text', 'score',
-            sorted by descending similarity score.
+            sorted by descending similarity score. In "fulltext" mode the
+            keys are 'path', 'score' (BM25) and 'snippet'. With `limit` or
+            `cursor` a dict {"results": [...], "next_cursor": str | None}.
+            With `compact` the fuzzy results are
+            [{"path": rel, "hits": [[line, text, score], ...]}].
+            With `stream` a dict {"results": [...], "truncated": bool,
+            "files_scanned": int, "files_total": int}, `truncated` being
+            True if the scan stopped early. Fuzzy results cut short by the
+            deadline of the call are flagged the same way, a plain list is
+            then returned as {"results": [...], "truncated": True}.
         """
-        # Resolve absolute path inside vault
-        if dir[0] == "/":
-            root = (self.path / f".{dir}").resolve()
-        else:
-            root = (self.path / dir).resolve()
-        if not root.exists() or not root.is_dir():
+        if mode not in ("fuzzy", "fulltext"):
+            raise ValueError(f"Wrong mode '{mode}'")
+        if stream and (mode != "fuzzy" or limit is not None or cursor):
+            raise ValueError(
+                "stream is only supported in fuzzy mode without limit and cursor"
+            )
+        if max_hits is not None and max_hits < 1:
+            raise ValueError("max_hits must be at least 1")
+        rel_dir = self._relative_dir(dir)
+        if rel_dir is None or not self.index.is_dir(rel_dir):
             raise FileNotFoundError(f"Directory '{dir}' does not exist in vault")
+        if mode == "fulltext":
+            return self._search_fulltext(
+                rel_dir, query, tuple(extensions), limit, cursor, compact
+            )
 
-        results = []
         query_lower = query.lower()
+        if stream:
+            hits, scanned, total = self._stream_hits(
+                rel_dir,
+                query_lower,
+                tuple(extensions),
+                threshold,
+                max_hits,
+                time_budget,
+                progress,
+            )
+            hits.sort(key=lambda hit: (-hit[3], hit[0], hit[1]))
+            return {
+                "results": self._hit_results(hits[:max_hits], compact),
+                "truncated": scanned < total,
+                "files_scanned": scanned,
+                "files_total": total,
+            }
 
-        for file_path in root.rglob("*"):
-            if not file_path.is_file():
-                continue
-            if extensions and file_path.suffix not in extensions:
-                continue
+        params = ("search", rel_dir, query_lower, tuple(extensions), threshold)
+        hits, truncated = self._cached_hits(
+            params,
+            lambda: self._search_hits(
+                rel_dir, query_lower, tuple(extensions), threshold
+            ),
+            limit,
+            cursor,
+        )
+        page, next_cursor = paginate(
+            hits,
+            lambda hit: (-hit[3], hit[0], hit[1]),
+            limit,
+            cursor,
+            query_fingerprint(*params),
+        )
+        results = self._hit_results(page, compact)
+        if limit is None and cursor is None:
+            return _truncated(results, truncated)
+        return _truncated({"results": results, "next_cursor": next_cursor}, truncated)
 
-            try:
-                with file_path.open("r", encoding="utf-8", errors="ignore") as f:
-                    for i, line in enumerate(f, 1):
-                        text = line.strip()
-                        if not text:
-                            continue
-                        score = fuzz.partial_ratio(query_lower, line.lower())
-                        if score >= threshold:
-                            results.append(
-                                {
-                                    "path": str(file_path),
-                                    "line": i,
-                                    "text": line.strip(),
-                                    "score": score,
-                                }
-                            )
-            except Exception:
-                continue  # skip unreadable files
-
-        # Sort by score descending
-        return sorted(results, key=lambda x: x["score"], reverse=True)
+    def query_notes(
+        self,
+        tags: list[str] | None = None,
+        properties: dict | None = None,
+        ranges: dict | None = None,
+        modified_after: str | None = None,
+        modified_before: str | None = None,
+        sort_by: str = "path",
+        descending: bool = False,
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> list[dict] | dict:
+        """
+        Filter notes by tags, frontmatter properties and modification date.
+
+        Answered from the metadata index, no file is read.
+
+        Args:
+            tags: Tags every note must have, e.g. ["project"]. Nested tags
+                like "project/alpha" match their parent tags.
+            properties: Required property values, e.g. {"status": "open"}.
+            ranges: Inclusive property ranges, e.g. {"priority": {"min": 2}}.
+            modified_after, modified_before: ISO dates, e.g. "2024-05-01".
+            sort_by: "path", "modified" or the name of a property.
+            descending: Sort in descending order.
+            limit: Maximum number of results per page (default: all).
+            cursor: `next_cursor` of the previous page.
+
+        Returns:
+            List of dicts {"path", "tags", "properties", "modified"}. With
+            `limit` or `cursor` a dict {"results": [...], "next_cursor": str | None}.
+        """
+        notes = self.metadata.query(
+            tags,
+            properties,
+            ranges,
+            _timestamp_ns(modified_after),
+            _timestamp_ns(modified_before),
+        )
+
+        def key(note):
+            rel, _, note_properties, mtime_ns = note
+            if sort_by == "path":
+                value = rel
+            elif sort_by == "modified":
+                value = mtime_ns
+            else:
+                value = note_properties.get(sort_by)
+            return sort_key(value, descending) + (rel,)
+
+        params = (
+            "query",
+            tags,
+            properties,
+            ranges,
+            modified_after,
+            modified_before,
+            sort_by,
+            descending,
+        )
+        page, next_cursor = paginate(
+            notes, key, limit, cursor, query_fingerprint(*params)
+        )
+        results = [
+            {
+                "path": str(self.path / rel),
+                "tags": sorted(note_tags),
+                "properties": note_properties,
+                "modified": datetime.fromtimestamp(mtime_ns / 1e9).isoformat(
+                    timespec="seconds"
+                ),
+            }
+            for rel, note_tags, note_properties, mtime_ns in page
+        ]
+        if limit is None and cursor is None:
+            return results
+        return {"results": results, "next_cursor": next_cursor}
+
+    def get_backlinks(self, filename: str) -> list[dict]:
+        """Return {"path", "line", "link", "embed"} of every link to a note."""
+        rel = self._note_rel(filename)
+        return [
+            {
+                "path": str(self.path / source),
+                "line": line,
+                "link": text,
+                "embed": embed,
+            }
+            for source, text, embed, line in self.links.backlinks(rel)
+        ]
+
+    def get_outgoing_links(self, filename: str) -> list[dict]:
+        """Return {"link", "target", "line", "embed"} of every link in a note.
+
+        `target` is the path the link resolves to, None for unresolved links.
+        """
+        rel = self._note_rel(filename)
+        return [
+            {
+                "link": text,
+                "target": str(self.path / target) if target else None,
+                "line": line,
+                "embed": embed,
+            }
+            for text, embed, line, target in self.links.links_of(rel)
+        ]
+
+    def get_unresolved_links(self, dir: str) -> list[dict]:
+        """Return {"path", "line", "link"} of every link to a missing file
+        in the notes under `dir`."""
+        rel_dir = self._relative_dir(dir)
+        if rel_dir is None or not self.index.is_dir(rel_dir):
+            raise FileNotFoundError(f"Directory '{dir}' does not exist in vault")
+        notes = self.index.files_under(rel_dir, TEXT_INDEX_EXTENSIONS)
+        return [
+            {"path": str(self.path / source), "line": line, "link": text}
+            for source, text, line in self.links.unresolved(notes)
+        ]
+
+    def get_note_neighborhood(
+        self, filename: str, depth: int = 1, direction: str = "both"
+    ) -> list[dict]:
+        """Return {"path", "distance"} of the notes linked to or from a note
+        within `depth` hops, sorted by distance."""
+        rel = self._note_rel(filename)
+        distances = self.links.neighborhood(rel, depth, direction)
+        return [
+            {"path": str(self.path / other), "distance": distance}
+            for other, distance in sorted(
+                distances.items(), key=lambda item: (item[1], item[0])
+            )
+        ]
+
+    def save_snapshot(self) -> bool:
+        """Write the indexes to the snapshot file if they changed since the
+        last save. Returns whether a snapshot was written.
+
+        Only shallow copies are taken under the locks, edits and searches
+        wait neither for the serialization nor for the file.
+        """
+        if self.snapshot is None:
+            return False
+        with self.index_lock:
+            generation = self.generation
+            if generation == self.saved_generation:
+                return False
+            with self.index.lock:
+                files = dict(self.index.files)
+            texts, postings, next_id = self.text_index.dump()
+            with self.metadata.lock:
+                metadata = dict(self.metadata.notes)
+            with self.links.lock:
+                links = dict(self.links.outgoing)
+
+        postings = {gram: ids.tobytes() for gram, ids in postings.items()}
+        # notes without text if the text index is off
+        texts = {rel: (file_id, text, posted) for rel, file_id, text, posted in texts}
+        notes = []
+        for rel, (tags, properties, _) in metadata.items():
+            file_id, text, posted = texts.get(rel, (None, None, 0))
+            notes.append(
+                (rel, file_id, text, posted, tags, properties, links.get(rel, []))
+            )
+        self.snapshot.save(
+            {
+                "files": files,
+                "notes": notes,
+                "postings": postings,
+                "next_id": next_id,
+            }
+        )
+        self.saved_generation = generation
+        return True
+
+    def apply_changes(self, rel_paths: set[str]):
+        """Update cached vault state for paths changed outside of this class."""
+        for rel in sorted(rel_paths):
+            self._refresh(rel)
+
+    def rescan(self):
+        """Rebuild all cached vault state from disk.
+
+        The listing is walked again, but only notes whose (size, mtime_ns)
+        changed, or which are not indexed yet, are read and parsed.
+        """
+        with self.index_lock:
+            self.generation += 1
+            with self.index.lock:
+                before = dict(self.index.files)
+                self.index.build()
+            notes = set(self.index.files_under("", TEXT_INDEX_EXTENSIONS))
+            with self.fulltext.batch():
+                for rel in notes:
+                    if (
+                        before.get(rel) != self.index.files[rel]
+                        or rel not in self.metadata.notes
+                    ):
+                        self._index_text(rel)
+            for rel in self.text_index.paths():
+                if rel not in notes:
+                    self.text_index.remove(rel)
+            for rel in self.fulltext.files():
+                if rel not in notes:
+                    self.fulltext.remove(rel)
+            for rel in self.metadata.paths():
+                if rel not in notes:
+                    self.metadata.remove(rel)
+            for rel in self.links.notes():
+                if rel not in notes:
+                    self.links.remove(rel)
+            for rel in self.links.files():
+                if rel not in self.index.files:
+                    self.links.remove_file(rel)
+            for rel in self.index.files:
+                self.links.add_file(rel)
 
     # --- Helper methods ---
 
+    def _relative_dir(self, dir: str) -> str | None:
+        """Translate a tool supplied directory into a vault relative one.
+
+        A leading "/" refers to the vault root. Returns None for directories
+        outside the vault.
+        """
+        root = (self.path / dir.lstrip("/")).resolve()
+        try:
+            rel = root.relative_to(self.path).as_posix()
+        except ValueError:
+            return None
+        return "" if rel == "." else rel
+
+    def _resolve_note(self, filename: str) -> Path:
+        """Find the file of a note given by absolute path, relative path or name."""
+        # Ensure .md extension
+        if not filename.endswith(".md"):
+            filename += ".md"
+
+        candidate = Path(filename)
+
+        # Case 1: provided filename is absolute path
+        if candidate.exists():
+            return candidate
+
+        rel = self._lookup_note(filename)
+        if rel is None and not self.watched and filename not in self.index.misses:
+            # the vault may have changed behind our back, rescan once
+            self.rescan()
+            rel = self._lookup_note(filename)
+
+        if rel is None:
+            self.index.miss(filename)
+            raise FileNotFoundError(f"No note found for {filename}")
+        return self.path / rel
+
+    def _note_rel(self, filename: str) -> str:
+        """Vault relative path of a note given by path or name."""
+        path = self._resolve_note(filename)
+        try:
+            return (
+                Path(os.path.normpath(path.resolve())).relative_to(self.path).as_posix()
+            )
+        except ValueError:
+            raise FileNotFoundError(f"{path} is not part of the vault")
+
+    def _write_note(self, path: Path, text: str):
+        """Replace a note and refresh its cached text and structure."""
+        self.writer.write_text(path, text)
+        self.content_cache.put(path, text)
+        self.line_tables.put(path, text.encode("utf-8"))
+
+    def _resolve_notes(self, filenames: list[str]) -> list[Path | Exception]:
+        """Resolve several notes like `_resolve_note`, rescanning at most once."""
+        names = [f if f.endswith(".md") else f + ".md" for f in filenames]
+        # provided filenames which are absolute paths
+        found: list = [Path(name) if Path(name).exists() else None for name in names]
+        with self.index.lock:
+            for i, name in enumerate(names):
+                if found[i] is None:
+                    found[i] = self._lookup_note(name)
+
+        missing = [
+            i
+            for i, rel in enumerate(found)
+            if rel is None and names[i] not in self.index.misses
+        ]
+        if missing and not self.watched:
+            # the vault may have changed behind our back, rescan once
+            self.rescan()
+            with self.index.lock:
+                for i in missing:
+                    found[i] = self._lookup_note(names[i])
+
+        paths = []
+        for name, rel in zip(names, found):
+            if isinstance(rel, Path):
+                paths.append(rel)
+            elif rel is None:
+                self.index.miss(name)
+                paths.append(FileNotFoundError(f"No note found for {name}"))
+            else:
+                paths.append(self.path / rel)
+        return paths
+
+    def _lookup_note(self, filename: str) -> str | None:
+        """Resolve a vault relative path or a bare note name via the index."""
+        # provided filename is relative path
+        rel = Path(filename).as_posix().lstrip("/")
+        if rel in self.index.files:
+            return rel
+
+        # provided filename is only the name of the file
+        paths = self.index.by_name.get(filename)
+        if paths:
+            return min(paths, key=lambda p: (p.count("/"), p))
+        return None
+
+    def _update_index(self, absolute_path: Path):
+        try:
+            rel = (
+                Path(os.path.normpath(absolute_path)).relative_to(self.path).as_posix()
+            )
+        except ValueError:
+            return
+        self._refresh(rel)
+
+    def _refresh(self, rel: str):
+        with self.index_lock:
+            self.generation += 1
+            changed, removed = self.index.refresh(rel)
+            for rel in changed:
+                self.links.add_file(rel)
+                if rel.endswith(TEXT_INDEX_EXTENSIONS):
+                    self._index_text(rel)
+            for rel in removed:
+                self.text_index.remove(rel)
+                self.fulltext.remove(rel)
+                self.metadata.remove(rel)
+                self.links.remove(rel)
+                self.links.remove_file(rel)
+                self.content_cache.invalidate(self.path / rel)
+                self.line_tables.invalidate(self.path / rel)
+
+    def _restore_snapshot(self, notes: list[str]) -> set[str]:
+        """Load the indexes of `notes` unchanged since the snapshot was saved.
+
+        A note is unchanged if the (size, mtime_ns) found by the listing scan
+        equals the one saved with it. Returns the restored notes.
+        """
+        state = self.snapshot.load() if self.snapshot else None
+        if state is None:
+            return set()
+
+        current = self.index.files
+        saved = state["files"]
+        unchanged = [
+            note
+            for note in state["notes"]
+            if note[0] in current and current[note[0]] == saved.get(note[0])
+            # saved while the text index was off
+            and (note[2] is not None or not self.keep_text)
+        ]
+        if self.keep_text:
+            self.text_index.load(
+                [
+                    (rel, file_id, text, posted)
+                    for rel, file_id, text, posted, *_ in unchanged
+                ],
+                state["postings"],
+                state["next_id"],
+            )
+        for rel, _, _, _, tags, properties, links in unchanged:
+            self.metadata.put(rel, tags, properties, current[rel][1])
+            self.links.put(rel, links)
+
+        # nothing to save until the vault changes
+        if len(unchanged) == len(state["notes"]) == len(notes):
+            self.saved_generation = self.generation
+        return {note[0] for note in unchanged}
+
+    def _hit_results(
+        self, hits: list[tuple[str, int, str, float]], compact: bool
+    ) -> list[dict]:
+        if compact:
+            return group_hits(hits)
+        return [
+            {"path": str(self.path / rel), "line": line, "text": text, "score": score}
+            for rel, line, text, score in hits
+        ]
+
+    def _search_hits(
+        self,
+        rel_dir: str,
+        query_lower: str,
+        extensions: tuple[str, ...],
+        threshold: int,
+    ) -> tuple[list[tuple[str, int, str, float]], bool]:
+        """Return (rel, line_number, text, score) for every matching line and
+        whether the scan stopped before all files were searched."""
+        files = self.index.files_under(rel_dir, extensions)
+        if files and deadline.expired():
+            return [], True  # out of time before the scan started
+        hits = []
+        done = 0
+        with closing(self._scan_hits(files, query_lower, threshold)) as scan:
+            for done, found in scan:
+                hits += found
+                if deadline.expired():
+                    break
+            else:
+                done = len(files)
+        return hits, done < len(files)
+
+    def _stream_hits(
+        self,
+        rel_dir: str,
+        query_lower: str,
+        extensions: tuple[str, ...],
+        threshold: int,
+        max_hits: int | None,
+        time_budget: float | None,
+        progress,
+    ) -> tuple[list[tuple[str, int, str, float]], int, int]:
+        """Scan like `_search_hits`, but stop early after `max_hits` hits or
+        `time_budget` seconds.
+
+        `progress` is called with (files done, files total, hits so far)
+        after every scanned part. Returns the hits, the number of files
+        scanned and the total number of files.
+        """
+        files = self.index.files_under(rel_dir, extensions)
+        chunk_bytes = STREAM_CHUNK_BYTES
+        if parallel.enabled():
+            # chunks smaller than this would not use the process pool
+            chunk_bytes = max(chunk_bytes, parallel.SEARCH_PARALLEL_MIN_BYTES)
+
+        start = time.monotonic()
+        hits = []
+        done = 0
+        scan = self._scan_hits(
+            files, query_lower, threshold, chunk_bytes, STREAM_BATCH_LINES, max_hits
+        )
+        with closing(scan):
+            for done, found in scan:
+                hits += found
+                if progress is not None:
+                    progress(done, len(files), hits)
+                if deadline.expired():
+                    break
+                if max_hits is not None and len(hits) >= max_hits:
+                    break
+                if time_budget is not None and time.monotonic() - start >= time_budget:
+                    break
+            else:
+                done = len(files)
+                if progress is not None:
+                    progress(done, len(files), hits)
+        return hits, done, len(files)
+
+    def _scan_hits(
+        self,
+        files: list[str],
+        query_lower: str,
+        threshold: int,
+        chunk_bytes: int | None = None,
+        batch_lines: int = BATCH_SIZE,
+        top: int | None = None,
+    ):
+        """Scan `files` for lines matching `query_lower`.
+
+        Yields (number of files done, new hits) after every scored batch of
+        `batch_lines` indexed lines and after every `chunk_bytes` of notes read from disk
+        (all at once without `chunk_bytes`). Hits are (rel, line_number,
+        text, score), of a chunk read from disk only the `top` best ones if
+        given. Files skipped because the call ran out of time are not
+        counted as done.
+        """
+        indexed = [rel for rel in files if rel in self.text_index]
+        on_disk = [rel for rel in files if rel not in self.text_index]
+
+        # Full scans of large directories are spread over the process pool
+        if (
+            parallel.enabled()
+            and not self.text_index.prunes(query_lower, threshold)
+            and self._total_size(files) >= parallel.SEARCH_PARALLEL_MIN_BYTES
+        ):
+            indexed, on_disk = [], files
+
+        scored = 0
+        try:
+            # Indexed notes: only score lines passing the trigram filter
+            candidates = self.text_index.candidates(indexed, query_lower, threshold)
+            # candidates are grouped by note, notes without any are done
+            done = len(indexed) - len({entry[0] for entry in candidates})
+            for batch in batches(candidates, batch_lines):
+                lowered = [entry[2] for entry in batch]
+                scored += len(lowered)
+                hits = []
+                for i, score in score_batch(query_lower, lowered, threshold):
+                    rel, line_number, _ = batch[i]
+                    line = self.text_index.line(rel, line_number)
+                    if line is not None:  # unless changed meanwhile
+                        hits.append((rel, line_number, line.strip(), score))
+                # the last note of the batch may continue in the next one
+                done += len({entry[0] for entry in batch}) - 1
+                yield done, hits
+            if done < len(indexed):
+                done = len(indexed)
+                yield done, []
+
+            # Everything else is read from disk
+            for chunk in self._chunks(on_disk, chunk_bytes):
+                if (
+                    parallel.enabled()
+                    and self._total_size(chunk) >= parallel.SEARCH_PARALLEL_MIN_BYTES
+                ):
+                    sizes = [
+                        (rel, self.index.files.get(rel, (0, 0))[0]) for rel in chunk
+                    ]
+                    matches, chunk_scored, read = parallel.search_files(
+                        self.path, sizes, query_lower, threshold, top
+                    )
+                else:
+                    matches, chunk_scored, read = parallel.scan_files(
+                        str(self.path), chunk, query_lower, threshold, top
+                    )
+                scored += chunk_scored
+                done += read
+                yield done, matches
+        finally:
+            metrics.SEARCH_FILES.observe(len(files), search="search_text_in_notes")
+            metrics.SEARCH_LINES.observe(scored, search="search_text_in_notes")
+
+    def _chunks(self, rels: list[str], chunk_bytes: int | None):
+        """Split `rels` into consecutive chunks of about `chunk_bytes`."""
+        if chunk_bytes is None:
+            if rels:
+                yield rels
+            return
+        chunk, size = [], 0
+        for rel in rels:
+            chunk.append(rel)
+            size += self.index.files.get(rel, (0, 0))[0]
+            if size >= chunk_bytes:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+    def _search_fulltext(
+        self,
+        rel_dir: str,
+        query: str,
+        extensions: tuple[str, ...],
+        limit: int | None,
+        cursor: str | None,
+        compact: bool = False,
+    ) -> list[dict] | dict:
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        fingerprint = query_fingerprint("fulltext", rel_dir, query, extensions)
+        after = decode_cursor(cursor, fingerprint) if cursor else None
+
+        # only notes are in the full text index, no extensions means all files
+        if not extensions or any(
+            ext.endswith(extensions) for ext in TEXT_INDEX_EXTENSIONS
+        ):
+            # pages are cut by SQLite, so no hit list has to be kept around
+            hits = self.fulltext.search(
+                query,
+                f"{rel_dir}/" if rel_dir else "",
+                None if limit is None else limit + 1,
+                after,
+            )
+        else:
+            hits = []
+        next_cursor = None
+        if limit is not None and len(hits) > limit:
+            hits = hits[:limit]
+            next_cursor = encode_cursor(fingerprint, list(hits[-1]))
+
+        snippets = self.fulltext.snippets(query, [rel for _, rel in hits])
+        results = [
+            {
+                "path": rel if compact else str(self.path / rel),
+                "score": -rank,
+                "snippet": snippets[rel],
+            }
+            for rank, rel in hits
+        ]
+        if limit is None and cursor is None:
+            return results
+        return {"results": results, "next_cursor": next_cursor}
+
+    def _cached_hits(
+        self, params: tuple, scan, limit: int | None, cursor: str | None
+    ) -> tuple[list, bool]:
+        """Return the hits of a find/search and whether the scan was cut
+        short by the deadline of the call. `scan` returns both.
+
+        The previous scan is reused for follow-up pages as long as the vault
+        did not change in between. Truncated scans are not kept.
+        """
+        with self._hits_lock:
+            cached = self._hits_cache.get(params)
+            if cursor and cached and cached[0] == self.generation:
+                self._hits_cache.move_to_end(params)
+                metrics.HITS_CACHE.inc(result="hit")
+                return cached[1], False
+        if cursor:
+            metrics.HITS_CACHE.inc(result="miss")
+
+        generation = self.generation
+        hits, truncated = scan()
+        if truncated:
+            return hits, True
+        if limit is None:
+            return hits, False  # no further pages to serve
+        with self._hits_lock:
+            self._hits_cache[params] = (generation, hits)
+            self._hits_cache.move_to_end(params)
+            while len(self._hits_cache) > HITS_CACHE_SIZE:
+                self._hits_cache.popitem(last=False)
+        return hits, False
+
+    def _list_paths(
+        self,
+        paths: list[str],
+        limit: int | None,
+        cursor: str | None,
+        compact: bool,
+        depth: int | None,
+        glob: str | None,
+        *params,
+    ) -> list[str] | dict:
+        """Filter `paths` by `glob`, page them and nest them into a
+        `path_tree` if `compact`."""
+        if depth is not None and not compact:
+            raise ValueError("depth is only supported with compact")
+        truncated = False
+        if glob:
+            matched = []
+            for batch in batches(paths):
+                if deadline.expired():
+                    truncated = True
+                    break
+                matched += [rel for rel in batch if fnmatchcase(rel, glob)]
+            paths = matched
+        if limit is None and cursor is None:
+            return _truncated(path_tree(paths, depth) if compact else paths, truncated)
+        page, next_cursor = paginate(
+            paths,
+            lambda rel: (rel,),
+            limit,
+            cursor,
+            query_fingerprint(*params, glob),
+        )
+        if compact:
+            page = path_tree(page, depth)
+        return _truncated({"results": page, "next_cursor": next_cursor}, truncated)
+
+    def _total_size(self, rels: list[str]) -> int:
+        return sum(self.index.files.get(rel, (0, 0))[0] for rel in rels)
+
+    def _index_text(self, rel: str):
+        with self.index_lock:
+            try:
+                with (self.path / rel).open(
+                    "r", encoding="utf-8", errors="ignore"
+                ) as f:
+                    text = f.read()
+            except OSError:
+                self.text_index.remove(rel)
+                self.fulltext.remove(rel)
+                self.metadata.remove(rel)
+                self.links.remove(rel)
+                return
+            size, mtime_ns = self.index.files.get(rel, (0, 0))
+            if self.keep_text:
+                self.text_index.update(rel, text)
+            self.fulltext.update(rel, text, size, mtime_ns)
+            self.metadata.update(rel, text, mtime_ns)
+            self.links.update(rel, text)
+
+    def _sync_fulltext(self, notes: list[str], restored: set[str]):
+        """Bring a full text index kept on disk up to date with `notes`.
+
+        Notes indexed with another (size, mtime_ns) are re-indexed from the
+        text of the restored snapshot, notes no longer in the vault dropped.
+        """
+        indexed = self.fulltext.files()
+        for rel in restored:
+            if indexed.get(rel) != self.index.files[rel]:
+                text = self.text_index.text(rel)
+                if text is None:
+                    try:
+                        text = (self.path / rel).read_text(
+                            encoding="utf-8", errors="ignore"
+                        )
+                    except OSError:
+                        continue
+                self.fulltext.update(rel, text, *self.index.files[rel])
+        for rel in indexed.keys() - set(notes):
+            self.fulltext.remove(rel)
+
     def _resolve_markdown_path(self, filepath: str):
         """Ensure the path points to an existing Markdown file."""
         if not filepath.endswith(".md"):
@@ -262,3 +1246,179 @@ class Vault:
         if not absolute_path.exists():
             raise FileNotFoundError(f"{absolute_path} does not exist")
         return absolute_path
+
+
+def _timestamp_ns(date: str | None) -> int | None:
+    """Nanosecond timestamp of an ISO date or datetime."""
+    if date is None:
+        return None
+    try:
+        return int(datetime.fromisoformat(date).timestamp() * 1e9)
+    except ValueError:
+        raise ValueError(f"Invalid date '{date}', expected e.g. 2024-05-01")
+
+
+def _truncated(results: list | dict, truncated: bool) -> list | dict:
+    """Flag results cut short by the deadline of the call.
+
+    Plain lists are only wrapped into {"results": [...], "truncated": True}
+    when truncated, so complete results keep their shape.
+    """
+    if not truncated:
+        return results
+    if isinstance(results, dict) and "results" in results:
+        return {**results, "truncated": True}
+    return {"results": results, "truncated": True}
+
+
+# ------------------------
+# Text edits
+# ------------------------
+def _delete_lines(text: str, line_numbers: list[int]) -> str:
+    lines = text.splitlines()
+
+    # Filter out the lines that should be deleted
+    new_lines = [line for i, line in enumerate(lines, start=1) if i not in line_numbers]
+    return "\n".join(new_lines) + "\n"
+
+
+def _patch_text(
+    text: str, target_type: str, target: str, operation: str, content: str
+) -> str:
+    matches = text.count(target)
+    if matches == 0:
+        raise ValueError(f"No text '{target}' found")
+    if matches > 1:
+        raise ValueError(f"Multiple matches for text '{target}' found. Must be unique.")
+
+    if target_type == "text":
+        if operation == "replace":
+            return text.replace(target, content, 1)
+        elif operation == "prepend":
+            return text.replace(target, content + target, 1)
+        elif operation == "append":
+            return text.replace(target, target + content, 1)
+        else:
+            raise ValueError(f"Wrong operation '{operation}'")
+    elif target_type == "line":
+        if operation == "replace":
+            return text.replace(target, content, 1)
+        elif operation == "prepend":
+            return text.replace(target, content + "\n" + target, 1)
+        elif operation == "append":
+            return text.replace(target, target + "\n" + content, 1)
+        else:
+            raise ValueError(f"Wrong operation '{operation}'")
+    else:
+        raise ValueError(f"Wrong target_type '{target}'")
+
+
+def _patch_structure(
+    data: bytes,
+    table: LineTable,
+    target_type: str,
+    target: str,
+    operation: str,
+    content: str,
+) -> str:
+    """Patch a heading, block or frontmatter target located via `table`."""
+    if operation not in ("append", "prepend", "replace"):
+        raise ValueError(f"Wrong operation '{operation}'")
+    new = content.encode("utf-8")
+    if not new.endswith(b"\n"):
+        new += b"\n"
+
+    if target_type == "heading":
+        i = table.find_heading(target)
+        line = table.headings[i][0]
+        last = table.ends[i]
+        # content is appended after the last non-empty line of the section
+        while operation == "append" and last > line:
+            if data[slice(*table.line_span(last, last))].strip():
+                break
+            last -= 1
+        body = table.line_span(line, line)[1]
+        end = table.line_span(line, last)[1]
+        if operation == "prepend":
+            start = end = body
+        elif operation == "append":
+            start = end
+        else:
+            start = body
+
+    elif target_type == "block":
+        line = table.block(target)
+        start, end = table.line_span(line, line)
+        if operation == "prepend":
+            end = start
+        elif operation == "append":
+            start = end
+        else:
+            block_id = target.strip().lstrip("^")
+            new = new.rstrip(b"\n") + f" ^{block_id}\n".encode("utf-8")
+
+    elif target_type == "frontmatter":
+        field = target.strip()
+        if field in table.fields:
+            start, end = table.line_span(*table.fields[field])
+            if operation == "prepend":
+                end = start
+            elif operation == "append":
+                start = end
+            else:
+                new = f"{field}: ".encode("utf-8") + new
+        elif table.frontmatter:
+            # add the field before the closing "---" line
+            closing = table.frontmatter[1]
+            start = end = table.line_span(closing, closing)[0]
+            new = f"{field}: ".encode("utf-8") + new
+        else:
+            start = end = 0
+            new = b"---\n" + f"{field}: ".encode("utf-8") + new + b"---\n"
+
+    else:
+        raise ValueError(f"Wrong target_type '{target_type}'")
+
+    if start > 0 and data[start - 1 : start] != b"\n":
+        new = b"\n" + new
+    return (data[:start] + new + data[end:]).decode("utf-8")
+
+
+def _apply_edit(text: str, edit: dict) -> str:
+    op = edit["op"]
+    if op == "patch" and edit["target_type"] in STRUCTURE_TARGET_TYPES:
+        data = text.encode("utf-8")
+        return _patch_structure(
+            data,
+            LineTable.parse(data),
+            edit["target_type"],
+            edit["target"],
+            edit["operation"],
+            edit["content"],
+        )
+    elif op == "patch":
+        return _patch_text(
+            text,
+            edit["target_type"],
+            edit["target"],
+            edit["operation"],
+            edit["content"],
+        )
+    elif op == "append":
+        content = edit["content"]
+        if not content.endswith("\n"):
+            content += "\n"
+        if text and not content.startswith("\n"):
+            content = "\n" + content
+        return text + content
+    elif op == "prepend":
+        content = edit["content"]
+        if not content.endswith("\n"):
+            content += "\n"
+        return content + text
+    elif op == "delete_lines":
+        return _delete_lines(text, edit["line_numbers"])
+    elif op == "replace":
+        return _patch_text(text, "text", edit["target"], "replace", edit["content"])
+    else:
+        raise ValueError(f"Wrong op '{op}'")
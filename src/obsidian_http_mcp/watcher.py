@@ -0,0 +1,282 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# auto | inotify | poll | off
+VAULT_WATCH_MODE = os.getenv("VAULT_WATCH_MODE", "auto")
+VAULT_WATCH_DEBOUNCE = float(os.getenv("VAULT_WATCH_DEBOUNCE", "0.5"))
+VAULT_WATCH_POLL_INTERVAL = float(os.getenv("VAULT_WATCH_POLL_INTERVAL", "2.0"))
+
+# A batch above this size is cheaper to handle with a full rescan
+MAX_BATCH = 5000
+
+# Seconds to wait before retrying a batch which could not be applied
+RETRY_DELAY = 5.0
+
+# inotify constants (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+# ------------------------
+# Vault watcher
+# ------------------------
+class VaultWatcher:
+    """Background thread feeding filesystem changes into a `Vault`.
+
+    Changed paths are collected until no new event arrived for `debounce`
+    seconds and are then handed to `Vault.apply_changes` as one batch. A
+    batch which fails is logged and followed by a full rescan. If the thread
+    ends, `vault.watched` is cleared so lookups check the disk again.
+    """
+
+    def __init__(
+        self,
+        vault,
+        mode: str = VAULT_WATCH_MODE,
+        debounce: float = VAULT_WATCH_DEBOUNCE,
+        poll_interval: float = VAULT_WATCH_POLL_INTERVAL,
+    ):
+        self.vault = vault
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pending: set[str] = set()
+        self._pending_since = 0.0
+        self._rescan = False
+
+        # inotify state
+        self._fd = -1
+        self._libc = None
+        self._wd_to_dir: dict[int, str] = {}
+
+    def start(self):
+        if self.mode == "off":
+            return
+        if self.mode in ("auto", "inotify") and self._init_inotify():
+            target = self._run_inotify
+        elif self.mode == "inotify":
+            raise RuntimeError("inotify is not available on this system")
+        else:
+            self.mode = "poll"
+            target = self._run_poll
+
+        self.vault.watched = True
+        self._thread = threading.Thread(
+            target=self._run, args=(target,), name="vault-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self.vault.watched = False
+
+    def _run(self, target):
+        try:
+            target()
+        except Exception:
+            logger.exception("Vault watcher stopped")
+        finally:
+            self.vault.watched = False
+
+    # --- inotify backend ---
+
+    def _init_inotify(self) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+
+        self._libc = libc
+        self._fd = fd
+        self._watch_tree("")
+        return True
+
+    def _watch_tree(self, rel_dir: str):
+        """Add watches for `rel_dir` and every directory below it."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            path = os.fsencode(self.vault.path / current)
+            wd = self._libc.inotify_add_watch(self._fd, path, WATCH_MASK)
+            if wd < 0:
+                # ENOSPC means fs.inotify.max_user_watches is exhausted
+                if ctypes.get_errno() == 28:
+                    self._rescan = True
+                continue
+            self._wd_to_dir[wd] = current
+            try:
+                with os.scandir(self.vault.path / current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(
+                                f"{current}/{entry.name}" if current else entry.name
+                            )
+            except OSError:
+                continue
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            timeout = self.debounce if self._pending or self._rescan else 1.0
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if ready:
+                self._read_events()
+                # a steady stream of events must not postpone the update forever
+                waited = time.monotonic() - self._pending_since
+                if self._pending and waited > 10 * self.debounce:
+                    self._flush()
+            elif self._pending or self._rescan:
+                self._flush()
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self._rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self._wd_to_dir.pop(wd, None)
+                continue
+
+            rel_dir = self._wd_to_dir.get(wd)
+            if rel_dir is None:
+                continue
+            if not name:
+                # event on the watched directory itself (deleted or moved)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._pending.add(rel_dir)
+                continue
+
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.add(rel)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(rel)
+
+        if len(self._pending) > MAX_BATCH:
+            self._rescan = True
+
+    # --- polling backend ---
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            on_disk = self._snapshot()
+            with self.vault.index.lock:
+                indexed = dict(self.vault.index.files)
+
+            for rel, stat in on_disk.items():
+                if indexed.get(rel) != stat:
+                    self._pending.add(rel)
+            self._pending.update(rel for rel in indexed if rel not in on_disk)
+
+            if len(self._pending) > MAX_BATCH:
+                self._rescan = True
+            if self._pending or self._rescan:
+                self._flush()
+
+    def _snapshot(self) -> dict[str, tuple[int, int]]:
+        files = {}
+        stack = [""]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = os.scandir(self.vault.path / current)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    rel = f"{current}/{entry.name}" if current else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(rel)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            files[rel] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        return files
+
+    # --- Helper methods ---
+
+    def _flush(self):
+        pending, self._pending = self._pending, set()
+        rescan, self._rescan = self._rescan, False
+        try:
+            if rescan:
+                self.vault.rescan()
+            else:
+                self.vault.apply_changes(pending)
+        except Exception:
+            logger.warning(
+                "Could not apply vault changes, rescanning in %.0fs",
+                RETRY_DELAY,
+                exc_info=True,
+            )
+            # part of the batch may be applied, a rescan catches up on all
+            self._rescan = True
+            self._stop.wait(RETRY_DELAY)
@@ -0,0 +1,148 @@
+import os
+from pathlib import Path
+import stat
+import tempfile
+import threading
+import time
+from dotenv import load_dotenv
+
+# ------------------------
+# Load environment
+# ------------------------
+load_dotenv()
+
+# always | batch | none
+NOTE_FSYNC = os.getenv("NOTE_FSYNC", "batch")
+NOTE_FSYNC_INTERVAL = float(os.getenv("NOTE_FSYNC_INTERVAL", "1.0"))
+# Number of locks the note paths are spread over
+LOCK_STRIPES = 64
+
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_MODE = 0o666 & ~_umask
+
+
+# ------------------------
+# Note writer
+# ------------------------
+class NoteWriter:
+    """Serializes writes per note and replaces files atomically.
+
+    Paths are hashed onto a fixed set of locks, so edits of different notes
+    run in parallel while read-modify-write cycles on the same note do not
+    lose updates. With the `batch` fsync policy, written files are synced by
+    a background thread every `interval` seconds.
+    """
+
+    def __init__(
+        self,
+        fsync: str = NOTE_FSYNC,
+        interval: float = NOTE_FSYNC_INTERVAL,
+        stripes: int = LOCK_STRIPES,
+    ):
+        if fsync not in ("always", "batch", "none"):
+            raise ValueError(f"Wrong fsync policy '{fsync}'")
+        self.fsync = fsync
+        self.interval = interval
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+        self._pending: set[Path] = set()
+        self._pending_lock = threading.Lock()
+        self._flusher: threading.Thread | None = None
+
+    def lock(self, path: Path) -> threading.Lock:
+        """Lock guarding `path`, hold it around a read-modify-write."""
+        return self._locks[hash(os.path.normpath(path)) % len(self._locks)]
+
+    def write_text(self, path: Path, text: str):
+        """Replace the content of `path` via a temp file and rename.
+
+        Mode and owner of the existing file are kept, so notes edited by a
+        server running as root stay writable for their owner.
+        """
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            st = None
+        mode = DEFAULT_MODE if st is None else stat.S_IMODE(st.st_mode)
+
+        fd, tmp = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                if self.fsync == "always":
+                    os.fsync(f.fileno())
+            if st is not None:
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except OSError:
+                    pass  # not permitted, e.g. not running as root
+            os.chmod(tmp, mode)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._synced(path)
+
+    def append_text(self, path: Path, text: str):
+        with path.open("a", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            if self.fsync == "always":
+                os.fsync(f.fileno())
+        self._synced(path)
+
+    def flush(self):
+        """fsync every file written since the last flush."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        dirs = set()
+        for path in pending:
+            try:
+                with path.open("rb") as f:
+                    os.fsync(f.fileno())
+            except OSError:
+                continue
+            dirs.add(path.parent)
+        for directory in dirs:
+            _fsync_dir(directory)
+
+    # --- Helper methods ---
+
+    def _synced(self, path: Path):
+        """Apply the fsync policy after `path` was written."""
+        if self.fsync == "always":
+            _fsync_dir(path.parent)
+        elif self.fsync == "batch":
+            with self._pending_lock:
+                self._pending.add(path)
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._run_flusher, name="note-fsync", daemon=True
+                    )
+                    self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def _fsync_dir(directory: Path):
+    """Persist renames and new entries in `directory`."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -1,11 +1,16 @@
+import asyncio
 import subprocess
 import time
+import urllib.error
+import urllib.request
 import tempfile
 import shutil
 import json
 import os
 import stat
+import sys
 from pathlib import Path
+from types import SimpleNamespace
 import pytest
 from fastmcp import Client
 from fastmcp.exceptions import ToolError
@@ -21,6 +26,11 @@ load_dotenv()
 MCP_API_KEY = os.getenv("MCP_API_KEY")
 MCP_USER = os.getenv("MCP_USER")
 
+# The server modules import each other by their plain names
+sys.path.insert(
+    0, str(Path(__file__).resolve().parents[1] / "src" / "obsidian_http_mcp")
+)
+
 
 # Global variables for the temporary vault
 VAULT_DIR = None
@@ -93,8 +103,8 @@ def mcp_docker():
 
     yield  # tests run here
 
-    # Teardown: stop and remove container
-    subprocess.run(["docker", "rm", "-f", container_id], check=True)
+    # Teardown: stop and remove container with its index volume
+    subprocess.run(["docker", "rm", "-f", "-v", container_id], check=True)
 
     # Remove temp vault
     if VAULT_DIR:
@@ -721,3 +731,1018 @@ async def test_search_text_in_note_subdir(mcp_client):
     print(file_list[0])
 
     assert "testdir/file5.md" in file_list[0]["path"]
+
+
+@pytest.mark.asyncio
+async def test_list_files_in_vault_paginated(mcp_client):
+    result = await mcp_client.call_tool("list_files_in_vault", {})
+    file_list = json.loads(result.content[0].text)
+
+    pages = []
+    cursor = None
+    while True:
+        args = {"limit": 2}
+        if cursor:
+            args["cursor"] = cursor
+        result = await mcp_client.call_tool("list_files_in_vault", args)
+        page = json.loads(result.content[0].text)
+        assert len(page["results"]) <= 2
+        pages += page["results"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert pages == sorted(file_list)
+
+
+@pytest.mark.asyncio
+async def test_search_text_in_notes_paginated(mcp_client):
+    result = await mcp_client.call_tool(
+        "search_text_in_notes", {"dir": "/", "query": "content of file", "limit": 2}
+    )
+    first_page = json.loads(result.content[0].text)
+    print(first_page)
+
+    assert len(first_page["results"]) == 2
+    assert first_page["next_cursor"]
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {
+            "dir": "/",
+            "query": "content of file",
+            "limit": 2,
+            "cursor": first_page["next_cursor"],
+        },
+    )
+    second_page = json.loads(result.content[0].text)
+    print(second_page)
+
+    seen = {(r["path"], r["line"]) for r in first_page["results"]}
+    assert all((r["path"], r["line"]) not in seen for r in second_page["results"])
+    assert first_page["results"][-1]["score"] >= second_page["results"][0]["score"]
+
+
+@pytest.mark.asyncio
+async def test_get_cache_stats(mcp_client):
+    await mcp_client.call_tool("get_file_contents", {"filename": "file2.md"})
+    await mcp_client.call_tool("get_file_contents", {"filename": "file2.md"})
+
+    result = await mcp_client.call_tool("get_cache_stats", {})
+    stats = json.loads(result.content[0].text)
+    print(stats)
+
+    assert stats["hits"] >= 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+@pytest.mark.asyncio
+async def test_get_note_line_range(mcp_client):
+    note = "test_get_note_line_range.md"
+    content = "line1\nline2\nline3\nline4\n"
+
+    await mcp_client.call_tool("create_note", {"filepath": note})
+    await mcp_client.call_tool(
+        "append_content_to_note", {"filepath": note, "content": content}
+    )
+
+    result = await mcp_client.call_tool(
+        "get_file_contents", {"filename": note, "start_line": 2, "end_line": 3}
+    )
+
+    assert result.content[0].text == "line2\nline3\n"
+
+
+@pytest.mark.asyncio
+async def test_get_note_section(mcp_client):
+    note = "test_get_note_section.md"
+    content = (
+        "# Title\nintro\n## Tasks\n- task 1\n### Details\ntext\n## Done\n- task 2\n"
+    )
+
+    await mcp_client.call_tool("create_note", {"filepath": note})
+    await mcp_client.call_tool(
+        "append_content_to_note", {"filepath": note, "content": content}
+    )
+
+    result = await mcp_client.call_tool(
+        "get_file_contents", {"filename": note, "heading": "## Tasks"}
+    )
+
+    assert result.content[0].text == "## Tasks\n- task 1\n### Details\ntext\n"
+
+
+@pytest.mark.asyncio
+async def test_apply_note_edits(mcp_client):
+    note = "test_apply_note_edits.md"
+    content = "# Title\nline1\nline2\nline3\n"
+
+    await mcp_client.call_tool("create_note", {"filepath": note})
+    await mcp_client.call_tool(
+        "append_content_to_note", {"filepath": note, "content": content}
+    )
+
+    edits = [
+        {
+            "op": "patch",
+            "target_type": "line",
+            "target": "line1",
+            "operation": "append",
+            "content": "new line",
+        },
+        {"op": "delete_lines", "line_numbers": [4]},
+        {"op": "replace", "target": "line3", "content": "LINE3"},
+        {"op": "prepend", "content": "---\ntags: test\n---"},
+    ]
+    await mcp_client.call_tool("apply_note_edits", {"filepath": note, "edits": edits})
+
+    result = await mcp_client.call_tool("get_file_contents", {"filename": note})
+    assert (
+        result.content[0].text
+        == "---\ntags: test\n---\n# Title\nline1\nnew line\nLINE3\n"
+    )
+
+    # a failing edit leaves the note unchanged
+    edits = [
+        {"op": "append", "content": "more"},
+        {"op": "replace", "target": "does not exist", "content": "x"},
+    ]
+    with pytest.raises(ToolError):
+        await mcp_client.call_tool(
+            "apply_note_edits", {"filepath": note, "edits": edits}
+        )
+
+    result = await mcp_client.call_tool("get_file_contents", {"filename": note})
+    assert (
+        result.content[0].text
+        == "---\ntags: test\n---\n# Title\nline1\nnew line\nLINE3\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_many_file_contents(mcp_client):
+    result = await mcp_client.call_tool(
+        "get_many_file_contents",
+        {"filenames": ["file2", "testdir/file4.md", "does_not_exist"]},
+    )
+    items = result.structured_content["result"]
+    print(items)
+
+    assert items[0]["content"] == "content of file 2"
+    assert items[1]["content"] == "content of file 4"
+    assert "error" in items[2]
+
+
+@pytest.mark.asyncio
+async def test_patch_heading_block_frontmatter(mcp_client):
+    note = "test_patch_heading_block_frontmatter.md"
+    content = "---\ntitle: old\n---\n# Project\n## Tasks\n- task 1 ^t1\n\n## Done\n"
+
+    await mcp_client.call_tool("create_note", {"filepath": note})
+    await mcp_client.call_tool(
+        "append_content_to_note", {"filepath": note, "content": content}
+    )
+
+    patches = [
+        ("heading", "Project::Tasks", "append", "- task 2"),
+        ("block", "^t1", "replace", "- task 1 done"),
+        ("frontmatter", "title", "replace", "new"),
+        ("frontmatter", "status", "replace", "open"),
+    ]
+    for target_type, target, operation, new_content in patches:
+        await mcp_client.call_tool(
+            "patch_content_into_note",
+            {
+                "filepath": note,
+                "target_type": target_type,
+                "target": target,
+                "operation": operation,
+                "content": new_content,
+            },
+        )
+
+    result = await mcp_client.call_tool("get_file_contents", {"filename": note})
+    lines = result.content[0].text.splitlines()
+    print(lines)
+
+    assert lines == [
+        "---",
+        "title: new",
+        "status: open",
+        "---",
+        "# Project",
+        "## Tasks",
+        "- task 1 done ^t1",
+        "- task 2",
+        "",
+        "## Done",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_query_notes(mcp_client):
+    notes = {
+        "test_query_notes_1.md": "---\nstatus: open\npriority: 1\ntags: [project]\n---\n",
+        "test_query_notes_2.md": "---\nstatus: open\npriority: 3\n---\ntext #project/alpha\n",
+        "test_query_notes_3.md": "---\nstatus: done\npriority: 2\ntags: [project]\n---\n",
+    }
+    for note, content in notes.items():
+        await mcp_client.call_tool("create_note", {"filepath": note})
+        await mcp_client.call_tool(
+            "append_content_to_note", {"filepath": note, "content": content}
+        )
+
+    result = await mcp_client.call_tool(
+        "query_notes",
+        {
+            "tags": ["project"],
+            "properties": {"status": "open"},
+            "sort_by": "priority",
+            "descending": True,
+        },
+    )
+    paths = [Path(item["path"]).name for item in result.structured_content["result"]]
+    print(paths)
+
+    assert paths == ["test_query_notes_2.md", "test_query_notes_1.md"]
+
+    result = await mcp_client.call_tool(
+        "query_notes", {"ranges": {"priority": {"min": 2}}, "tags": ["project"]}
+    )
+    paths = [Path(item["path"]).name for item in result.structured_content["result"]]
+
+    assert paths == ["test_query_notes_2.md", "test_query_notes_3.md"]
+
+
+@pytest.mark.asyncio
+async def test_backlinks_and_outgoing_links(mcp_client):
+    notes = {
+        "test_links_source.md": "see [[test_links_target]] and [[test_links_missing]]\n",
+        "test_links_target.md": "back to [[test_links_source#Heading]]\n",
+    }
+    for note, content in notes.items():
+        await mcp_client.call_tool("create_note", {"filepath": note})
+        await mcp_client.call_tool(
+            "append_content_to_note", {"filepath": note, "content": content}
+        )
+
+    result = await mcp_client.call_tool(
+        "get_backlinks", {"filename": "test_links_target"}
+    )
+    backlinks = result.structured_content["result"]
+    print(backlinks)
+
+    assert [Path(item["path"]).name for item in backlinks] == ["test_links_source.md"]
+
+    result = await mcp_client.call_tool(
+        "get_outgoing_links", {"filename": "test_links_source"}
+    )
+    targets = [item["target"] for item in result.structured_content["result"]]
+
+    assert Path(targets[0]).name == "test_links_target.md"
+    assert targets[1] is None
+
+    result = await mcp_client.call_tool(
+        "get_note_neighborhood", {"filename": "test_links_target", "depth": 2}
+    )
+    neighbors = result.structured_content["result"]
+
+    assert [Path(item["path"]).name for item in neighbors] == ["test_links_source.md"]
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(mcp_client):
+    await mcp_client.call_tool("get_file_contents", {"filename": "file2"})
+    with pytest.raises(ToolError):
+        await mcp_client.call_tool("nonexistent_tool_xyz", {})
+
+    # the endpoint needs the bearer token like the tools
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen("http://localhost:9001/metrics")
+    assert error.value.code == 401
+
+    request = urllib.request.Request(
+        "http://localhost:9001/metrics",
+        headers={"Authorization": f"Bearer {MCP_API_KEY}"},
+    )
+    with urllib.request.urlopen(request) as response:
+        text = response.read().decode()
+    print(text)
+
+    assert 'mcp_tool_calls_total{tool="get_file_contents"' in text
+    assert "mcp_tool_duration_seconds_bucket" in text
+    assert "note_cache_hit_ratio" in text
+    # unknown tools share one label
+    assert 'tool="unknown"' in text
+    assert "nonexistent_tool_xyz" not in text
+
+
+@pytest.mark.asyncio
+async def test_search_text_in_notes_fulltext(mcp_client):
+    notes = {
+        "test_fulltext_1.md": "Planning the quarterly budget review\n",
+        "test_fulltext_2.md": "The review of the budget is planned quarterly\n",
+        "test_fulltext_3.md": "Nothing to see here\n",
+    }
+    for note, content in notes.items():
+        await mcp_client.call_tool("create_note", {"filepath": note})
+        await mcp_client.call_tool(
+            "append_content_to_note", {"filepath": note, "content": content}
+        )
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": '"budget review"', "mode": "fulltext"},
+    )
+    hits = json.loads(result.content[0].text)
+    print(hits)
+
+    assert [Path(hit["path"]).name for hit in hits] == ["test_fulltext_1.md"]
+    assert "**budget review**" in hits[0]["snippet"]
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": "quarter* NOT nothing", "mode": "fulltext"},
+    )
+    paths = {Path(hit["path"]).name for hit in json.loads(result.content[0].text)}
+
+    assert paths == {"test_fulltext_1.md", "test_fulltext_2.md"}
+
+    # no extensions means all files
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": '"budget review"', "mode": "fulltext", "extensions": []},
+    )
+    hits = json.loads(result.content[0].text)
+
+    assert [Path(hit["path"]).name for hit in hits] == ["test_fulltext_1.md"]
+
+
+@pytest.mark.asyncio
+async def test_find_note_in_vault_unicode(mcp_client):
+    # decomposed "é" as written by macOS file systems
+    await mcp_client.call_tool(
+        "create_note", {"filepath": "testdir/Cafe\u0301 Notes.md"}
+    )
+
+    result = await mcp_client.call_tool(
+        "find_note_in_vault",
+        {"dir": "testdir", "query": "caf\u00e9 notes", "threshold": 100},
+    )
+    file_list = json.loads(result.content[0].text)
+    print(file_list)
+
+    assert len(file_list) == 1
+    assert file_list[0]["path"].endswith("Notes.md")
+    assert file_list[0]["score"] == 100
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_rejected(mcp_client):
+    client = Client(
+        {
+            "mcpServers": {
+                "obsidian": {
+                    "url": "http://localhost:9001/mcp",
+                    "headers": {"Authorization": "Bearer not-a-valid-key"},
+                }
+            }
+        }
+    )
+    async with client:
+        with pytest.raises(ToolError, match="Access denied"):
+            await client.call_tool("get_file_contents", {"filename": "file2"})
+
+
+@pytest.mark.asyncio
+async def test_compact_results(mcp_client):
+    notes = {
+        "compact/a.md": "compact search target\nunrelated line\ncompact search target\n",
+        "compact/sub/b.md": "compact search target\n",
+        "compact/sub/deeper/c.md": "nothing\n",
+    }
+    for note, content in notes.items():
+        await mcp_client.call_tool("create_note", {"filepath": note})
+        await mcp_client.call_tool(
+            "append_content_to_note", {"filepath": note, "content": content}
+        )
+
+    result = await mcp_client.call_tool(
+        "list_files_in_dir", {"dir": "compact", "compact": True}
+    )
+    tree = json.loads(result.content[0].text)
+    print(tree)
+    assert tree == {"a.md": None, "sub": {"b.md": None, "deeper": {"c.md": None}}}
+
+    result = await mcp_client.call_tool(
+        "list_files_in_dir",
+        {"dir": "compact", "compact": True, "depth": 0, "glob": "sub/*"},
+    )
+    assert json.loads(result.content[0].text) == {"sub": 2}
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "compact", "query": "compact search target", "compact": True},
+    )
+    groups = json.loads(result.content[0].text)
+    print(groups)
+    assert [group["path"] for group in groups] == ["compact/a.md", "compact/sub/b.md"]
+    assert [hit[0] for hit in groups[0]["hits"]] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_search_text_in_notes_stream(mcp_client):
+    progress = []
+
+    async def on_progress(done, total, message):
+        progress.append((done, total, message))
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": "content of file", "stream": True},
+        progress_handler=on_progress,
+    )
+    data = json.loads(result.content[0].text)
+    print(data, progress)
+
+    assert data["truncated"] is False
+    assert data["files_scanned"] == data["files_total"]
+    assert len(data["results"]) >= 4
+    assert progress[-1][0] == progress[-1][1] == data["files_total"]
+    assert "hits" in progress[-1][2]
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": "content of file", "stream": True, "max_hits": 1},
+    )
+    data = json.loads(result.content[0].text)
+
+    assert len(data["results"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_call_timeout_truncates(mcp_client):
+    result = await mcp_client.call_tool(
+        "search_text_in_notes", {"dir": "/", "query": "content of file"}
+    )
+    assert isinstance(json.loads(result.content[0].text), list)
+
+    result = await mcp_client.call_tool(
+        "search_text_in_notes",
+        {"dir": "/", "query": "content of file", "timeout": 0.000001},
+    )
+    data = json.loads(result.content[0].text)
+    print(data)
+    assert data["truncated"] is True
+    assert isinstance(data["results"], list)
+
+    result = await mcp_client.call_tool(
+        "list_files_in_vault", {"glob": "*", "timeout": 0.000001}
+    )
+    data = json.loads(result.content[0].text)
+    assert data["truncated"] is True
+
+
+@pytest.mark.asyncio
+async def test_concurrent_edits_keep_all_updates(mcp_client):
+    note = "test_concurrent_edits.md"
+    await mcp_client.call_tool("create_note", {"filepath": note})
+
+    await asyncio.gather(
+        *(
+            mcp_client.call_tool(
+                "apply_note_edits",
+                {
+                    "filepath": note,
+                    "edits": [{"op": "prepend", "content": f"edit {i}"}],
+                },
+            )
+            for i in range(20)
+        )
+    )
+
+    result = await mcp_client.call_tool("get_file_contents", {"filename": note})
+    lines = result.content[0].text.splitlines()
+    print(lines)
+
+    assert sorted(lines) == sorted(f"edit {i}" for i in range(20))
+
+
+@pytest.mark.asyncio
+async def test_profiled_call_returns_result(mcp_client):
+    client = Client(
+        {
+            "mcpServers": {
+                "obsidian": {
+                    "url": "http://localhost:9001/mcp",
+                    "headers": {
+                        "Authorization": f"Bearer {MCP_API_KEY}",
+                        "X-MCP-Profile": "1",
+                    },
+                }
+            }
+        }
+    )
+    async with client:
+        result = await client.call_tool(
+            "search_text_in_notes", {"dir": "/", "query": "content of file"}
+        )
+    hits = json.loads(result.content[0].text)
+
+    assert any(Path(hit["path"]).name == "file2.md" for hit in hits)
+
+
+# ------------------------
+# Authentication and limits
+# ------------------------
+def test_keyfile_users_and_reload(tmp_path, monkeypatch):
+    import authentication
+
+    monkeypatch.setattr(authentication, "KEYFILE_CHECK_INTERVAL", 0)
+    keyfile = tmp_path / "api_keys"
+    keyfile.write_text("# clients\nalice:token-a\nbob: token-b \n\nno token\n")
+    keys = authentication.KeyStore(str(keyfile), "token-env", "env")
+
+    assert keys.user_for("token-a") == "alice"
+    assert keys.user_for("token-b") == "bob"
+    assert keys.user_for("token-env") == "env"
+    assert keys.user_for("token-c") is None
+
+    # changed keyfile replaces the keys
+    keyfile.write_text("carol:token-c\n")
+    assert keys.user_for("token-a") is None
+    assert keys.user_for("token-c") == "carol"
+
+    # deleted keyfile revokes its keys, the env key stays
+    keyfile.unlink()
+    assert keys.user_for("token-c") is None
+    assert keys.user_for("token-env") == "env"
+
+
+def test_rate_limiter_refills():
+    import authentication
+
+    limiter = authentication.RateLimiter(rate=20, burst=2)
+
+    assert limiter.acquire("alice") == 0
+    assert limiter.acquire("alice") == 0
+    assert limiter.acquire("alice") > 0
+    assert limiter.acquire("bob") == 0
+
+    time.sleep(0.1)
+    assert limiter.acquire("alice") == 0
+    assert authentication.RateLimiter(rate=0).acquire("alice") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_and_heavy_call_cap(monkeypatch):
+    import authentication
+
+    request = SimpleNamespace(headers={"Authorization": "Bearer token-a"})
+    monkeypatch.setattr(authentication, "get_http_request", lambda: request)
+    middleware = authentication.UserAuthMiddleware(
+        keys=authentication.KeyStore(None, "token-a", "alice"),
+        rate_limiter=authentication.RateLimiter(rate=0.001, burst=3),
+        heavy_limiter=authentication.ConcurrencyLimiter(limit=1),
+        heavy_tools={"search_text_in_notes"},
+    )
+
+    def context(tool):
+        return SimpleNamespace(
+            message=SimpleNamespace(name=tool),
+            fastmcp_context=SimpleNamespace(set_state=lambda key, value: None),
+        )
+
+    release = asyncio.Event()
+
+    async def slow(ctx):
+        await release.wait()
+        return "slow"
+
+    async def fast(ctx):
+        return "fast"
+
+    first = asyncio.create_task(
+        middleware.on_call_tool(context("search_text_in_notes"), slow)
+    )
+    await asyncio.sleep(0)
+
+    # a second search of the same user is rejected while the first runs
+    with pytest.raises(ToolError, match="Too many concurrent searches"):
+        await middleware.on_call_tool(context("search_text_in_notes"), fast)
+    # other tools are not capped
+    assert await middleware.on_call_tool(context("get_file_contents"), fast) == "fast"
+
+    release.set()
+    assert await first == "slow"
+
+    # the burst of 3 calls is used up
+    with pytest.raises(ToolError, match="Rate limit exceeded"):
+        await middleware.on_call_tool(context("get_file_contents"), fast)
+
+
+# ------------------------
+# Vault without the server
+# ------------------------
+def local_vault(root: Path, notes: dict[str, str], **kwargs):
+    """Vault over `notes` written to `root`, without snapshot and FTS file."""
+    from vault import Vault
+
+    for rel, text in notes.items():
+        (root / rel).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel).write_text(text, encoding="utf-8")
+    kwargs.setdefault("snapshot", "off")
+    kwargs.setdefault("fulltext", "memory")
+    return Vault(str(root), **kwargs)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    """Poll `condition` until it holds or `timeout` seconds passed."""
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.mark.parametrize("mode", ["poll", "auto"])
+def test_watcher_applies_create_rename_delete(tmp_path, mode):
+    from watcher import VaultWatcher
+
+    vault = local_vault(tmp_path, {"a.md": "alpha\n", "sub/c.md": "charlie\n"})
+    root = vault.path
+    watcher = VaultWatcher(vault, mode=mode, debounce=0.05, poll_interval=0.05)
+    watcher.start()
+
+    def found(query):
+        hits = vault.search_text_in_notes(dir="/", query=query, threshold=90)
+        return [hit["path"] for hit in hits]
+
+    try:
+        (root / "b.md").write_text("bravo\n")
+        assert wait_for(lambda: found("bravo") == [str(root / "b.md")])
+
+        (root / "b.md").rename(root / "sub" / "d.md")
+        assert wait_for(lambda: found("bravo") == [str(root / "sub" / "d.md")])
+        assert "b.md" not in vault.list_files_in_vault()
+
+        (root / "sub" / "c.md").unlink()
+        assert wait_for(lambda: "sub/c.md" not in vault.list_files_in_vault())
+        assert sorted(vault.list_files_in_vault()) == ["a.md", "sub/d.md"]
+    finally:
+        watcher.stop()
+
+
+def test_watcher_survives_failed_batches(tmp_path, monkeypatch):
+    import watcher
+    from watcher import VaultWatcher
+
+    monkeypatch.setattr(watcher, "RETRY_DELAY", 0.05)
+    vault = local_vault(tmp_path, {"a.md": "alpha\n"})
+    failures = []
+
+    def apply_changes(rel_paths):
+        failures.append(rel_paths)
+        raise OSError("disk went away")
+
+    monkeypatch.setattr(vault, "apply_changes", apply_changes)
+    watch = VaultWatcher(vault, mode="poll", debounce=0.05, poll_interval=0.05)
+    watch.start()
+    try:
+        (tmp_path / "b.md").write_text("bravo\n")
+        # the failed batch is followed by a rescan on the next tick
+        assert wait_for(lambda: "b.md" in vault.list_files_in_vault())
+        assert failures
+        assert vault.watched
+    finally:
+        watch.stop()
+
+    # a watcher thread which dies no longer claims to watch the vault
+    watch = VaultWatcher(vault, mode="poll", debounce=0.05, poll_interval=0.05)
+    monkeypatch.setattr(watch, "_snapshot", lambda: 1 / 0)
+    watch.start()
+    try:
+        assert wait_for(lambda: not vault.watched)
+    finally:
+        watch.stop()
+
+
+def test_trigram_pruning_matches_brute_force():
+    import random
+    from rapidfuzz import fuzz
+    from search_index import TrigramIndex, split_lines
+
+    rng = random.Random(3)
+    words = "alpha Beta gamma delta epsilon İstanbul zeta theta kappa lambda".split()
+    texts = {
+        f"note{n}.md": "\n".join(
+            " ".join(rng.choices(words, k=rng.choice([0, 1, 2, rng.randint(3, 12)])))
+            for _ in range(30)
+        )
+        for n in range(50)
+    }
+    index = TrigramIndex()
+    for rel, text in texts.items():
+        index.update(rel, text)
+
+    pruned_queries = 0
+    for _ in range(80):
+        query = " ".join(rng.choices(words, k=rng.randint(1, 4))).lower()
+        if rng.random() < 0.5:  # typo
+            i = rng.randrange(len(query))
+            query = query[:i] + "x" + query[i + 1 :]
+        threshold = rng.choice([60, 75, 85, 95])
+        pruned_queries += index.prunes(query, threshold)
+
+        pruned = {
+            (rel, line)
+            for rel, line, lowered in index.candidates(texts, query, threshold)
+            if fuzz.partial_ratio(query, lowered) >= threshold
+        }
+        brute = {
+            (rel, i)
+            for rel, text in texts.items()
+            for i, line in enumerate(split_lines(text), 1)
+            if line.strip() and fuzz.partial_ratio(query, line.lower()) >= threshold
+        }
+        assert pruned == brute, (query, threshold)
+    assert pruned_queries > 10
+
+
+def test_search_without_text_index(tmp_path):
+    notes = {f"note{i}.md": f"# Note {i}\n\nsome Searched text {i}\n" for i in range(5)}
+    indexed = local_vault(tmp_path, notes)
+    on_disk = local_vault(tmp_path, {}, text_index=False)
+    query = {"dir": "/", "query": "searched text 3", "threshold": 90}
+
+    assert on_disk.text_index.paths() == []
+    assert on_disk.search_text_in_notes(**query) == indexed.search_text_in_notes(
+        **query
+    )
+    assert indexed.search_text_in_notes(**query)[0]["text"] == "some Searched text 3"
+
+
+def test_rescan_only_parses_changed_notes(tmp_path, monkeypatch):
+    vault = local_vault(tmp_path, {f"n{i}.md": f"note {i}\n" for i in range(5)})
+    (tmp_path / "n1.md").write_text("changed note 1\n")
+    (tmp_path / "n5.md").write_text("new note 5\n")
+    (tmp_path / "n2.md").unlink()
+
+    parsed = []
+    index_text = vault._index_text
+    monkeypatch.setattr(
+        vault, "_index_text", lambda rel: (parsed.append(rel), index_text(rel))
+    )
+    vault.rescan()
+
+    assert sorted(parsed) == ["n1.md", "n5.md"]
+    assert vault.text_index.text("n1.md") == "changed note 1\n"
+    assert sorted(vault.text_index.paths()) == [
+        "n0.md",
+        "n1.md",
+        "n3.md",
+        "n4.md",
+        "n5.md",
+    ]
+    hits = vault.search_text_in_notes(dir="/", query="note 2", threshold=100)
+    assert hits == []
+
+
+def test_sharded_search_matches_in_process_scan(tmp_path, monkeypatch):
+    import parallel
+
+    notes = {
+        f"dir{i % 3}/note{i}.txt": f"line {i}\nsharded search target {i}\nother\n"
+        for i in range(40)
+    }
+    vault = local_vault(tmp_path, notes)
+    query = {"dir": "/", "query": "sharded search target", "extensions": (".txt",)}
+    expected = vault.search_text_in_notes(**query)
+
+    monkeypatch.setattr(parallel, "SEARCH_WORKERS", 2)
+    monkeypatch.setattr(parallel, "SEARCH_PARALLEL_MIN_BYTES", 0)
+    try:
+        sharded = vault.search_text_in_notes(**query)
+        assert parallel._pool is not None
+    finally:
+        parallel.shutdown_pool()
+
+    assert len(expected) == 40
+    assert sorted(map(json.dumps, sharded)) == sorted(map(json.dumps, expected))
+
+
+def test_sharded_search_stops_waiting_at_deadline(tmp_path, monkeypatch):
+    import deadline
+    import parallel
+
+    notes = {f"note{i}.md": f"waited line {i}\n" for i in range(30)}
+    for rel, text in notes.items():
+        (tmp_path / rel).write_text(text)
+    # reading a pipe blocks its shard until something is written to it
+    os.mkfifo(tmp_path / "blocked.md")
+    files = [(rel, len(text)) for rel, text in notes.items()] + [("blocked.md", 1)]
+
+    monkeypatch.setattr(parallel, "SEARCH_WORKERS", 2)
+    parallel.start_pool()
+    token = deadline.CURRENT.set(deadline.Deadline(1))
+    try:
+        start = time.monotonic()
+        hits, _, read = parallel.search_files(tmp_path, files, "waited line", 90)
+        assert time.monotonic() - start < 5
+    finally:
+        deadline.CURRENT.reset(token)
+        with open(tmp_path / "blocked.md", "w"):
+            pass  # let the blocked worker finish
+        parallel.shutdown_pool()
+
+    assert 0 < read < len(files)
+    assert len(hits) <= read
+
+
+def test_scan_files_keeps_top_hits(tmp_path):
+    import parallel
+
+    notes = {f"note{i}.md": f"top line {i}\ntop lines\nother\n" for i in range(50)}
+    for rel, text in notes.items():
+        (tmp_path / rel).write_text(text)
+    args = (str(tmp_path), sorted(notes), "top line", 50)
+
+    matches, scored, read = parallel.scan_files(*args)
+    top, top_scored, top_read = parallel.scan_files(*args, top=5)
+    assert len(matches) > 5
+    assert top == sorted(matches, key=parallel.rank)[:5]
+    assert (top_scored, top_read) == (scored, read) == (150, 50)
+
+
+def test_warm_restart_after_changes(tmp_path):
+    root = tmp_path / "vault"
+    snapshot = str(tmp_path / "index.sqlite")
+    notes = {
+        "kept.md": "---\ntags: [keep]\n---\nlinks to [[changed]]\nkept line\n",
+        "changed.md": "---\nstatus: old\n---\nold line\n",
+        "removed.md": "removed line [[kept]]\n",
+    }
+    vault = local_vault(root, notes, snapshot=snapshot)
+    assert vault.save_snapshot()
+
+    # changed between the runs, with a new size and mtime
+    changed = root / "changed.md"
+    changed.write_text("---\nstatus: new\n---\nnew line [[added]]\n")
+    os.utime(changed, ns=(changed.stat().st_atime_ns, time.time_ns() + 10**9))
+    (root / "added.md").write_text("added line\n")
+    (root / "removed.md").unlink()
+
+    warm = local_vault(root, {}, snapshot=snapshot)
+    cold = local_vault(root, {})
+    assert sorted(warm.text_index.paths()) == ["added.md", "changed.md", "kept.md"]
+    for query in ("old line", "new line", "added line", "removed line", "kept line"):
+        search = {"dir": "/", "query": query, "threshold": 90}
+        assert warm.search_text_in_notes(**search) == cold.search_text_in_notes(
+            **search
+        )
+    assert warm.search_text_in_notes(dir="/", query="removed line", threshold=90) == []
+    assert warm.query_notes(properties={"status": "new"}) == cold.query_notes(
+        properties={"status": "new"}
+    )
+    assert warm.query_notes(properties={"status": "old"}) == []
+    assert warm.get_backlinks("kept") == []
+    assert warm.get_outgoing_links("changed") == cold.get_outgoing_links("changed")
+
+
+def test_snapshot_written_without_holding_locks(tmp_path, monkeypatch):
+    import threading
+
+    vault = local_vault(
+        tmp_path / "vault",
+        {"note.md": "first line\n"},
+        snapshot=str(tmp_path / "index.sqlite"),
+    )
+    writing, release = threading.Event(), threading.Event()
+    save = vault.snapshot.save
+
+    def slow_save(state):
+        writing.set()
+        release.wait(5)
+        save(state)
+
+    monkeypatch.setattr(vault.snapshot, "save", slow_save)
+    saver = threading.Thread(target=vault.save_snapshot)
+    saver.start()
+    try:
+        assert writing.wait(5)
+        # edits and searches go on while the snapshot is written
+        vault.append_content_to_note("note.md", "second line\n")
+        hits = vault.search_text_in_notes(dir="/", query="second line", threshold=90)
+        assert [hit["text"] for hit in hits] == ["second line"]
+    finally:
+        release.set()
+        saver.join()
+
+
+def test_unwatched_miss_refreshes_all_indexes(tmp_path):
+    vault = local_vault(tmp_path, {"old.md": "links to [[fresh]]\n"})
+    generation = vault.generation
+
+    # created behind the back of the vault, no watcher running
+    (tmp_path / "fresh.md").write_text("---\ntags: [new]\n---\nfresh text\n")
+    assert "fresh text" in vault.get_file_contents("fresh")
+
+    assert vault.generation > generation
+    assert [note["path"] for note in vault.query_notes(tags=["new"])] == [
+        str(vault.path / "fresh.md")
+    ]
+    assert [link["path"] for link in vault.get_backlinks("fresh")] == [
+        str(vault.path / "old.md")
+    ]
+    assert vault.text_index.text("fresh.md") is not None
+
+
+def test_missing_note_names_are_capped(tmp_path, monkeypatch):
+    import index
+
+    monkeypatch.setattr(index, "MAX_MISSES", 3)
+    vault = local_vault(tmp_path, {"note.md": "text\n"})
+    for i in range(10):
+        with pytest.raises(FileNotFoundError):
+            vault.get_file_contents(f"missing {i}")
+    assert 0 < len(vault.index.misses) <= 3
+
+
+def test_overlapping_profiled_calls(monkeypatch):
+    import threading
+    import profiling
+
+    collectors = [profiling.ProfileCollector() for _ in range(4)]
+    barrier = threading.Barrier(len(collectors))
+
+    def call():
+        barrier.wait(5)  # all calls run at the same time
+        return "result"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda c=c: results.append(c.run(call)))
+        for c in collectors
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * len(collectors)
+    # only one profiler can be active, the other calls ran unprofiled
+    assert sum(len(c.profiles) for c in collectors) == 1
+
+    class BusyProfile:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling, "cProfile", SimpleNamespace(Profile=BusyProfile))
+    collector = profiling.ProfileCollector()
+    assert collector.run(lambda: "result") == "result"
+    assert collector.profiles == []
+    assert not profiling._active.locked()
+
+
+def test_truncated_only_if_scan_stopped_early(tmp_path, monkeypatch):
+    import deadline
+
+    notes = {f"n{i}.md": f"searched line {i}\n" for i in range(20)}
+    vault = local_vault(tmp_path, notes, text_index=False)
+    query = {"dir": "/", "query": "searched line", "threshold": 90}
+
+    # the deadline passes right after a complete scan
+    call = deadline.Deadline(None)
+    scan_hits = vault._scan_hits
+
+    def scan_then_expire(*args, **kwargs):
+        yield from scan_hits(*args, **kwargs)
+        call.cancel()
+
+    monkeypatch.setattr(vault, "_scan_hits", scan_then_expire)
+    token = deadline.CURRENT.set(call)
+    try:
+        hits = vault.search_text_in_notes(**query)
+    finally:
+        deadline.CURRENT.reset(token)
+    assert isinstance(hits, list) and len(hits) == 20
+
+    # the scan stops after the first note read from disk
+    class ExpiresAfter(deadline.Deadline):
+        def __init__(self, checks: int):
+            super().__init__(None)
+            self.checks = checks
+
+        def expired(self) -> bool:
+            self.checks -= 1
+            return self.checks < 0
+
+    monkeypatch.setattr(vault, "_scan_hits", scan_hits)
+    token = deadline.CURRENT.set(ExpiresAfter(2))
+    try:
+        data = vault.search_text_in_notes(**query)
+    finally:
+        deadline.CURRENT.reset(token)
+    assert data["truncated"] is True
+    assert len(data["results"]) == 1